@@ -5,9 +5,19 @@ Objectif : détecter en CI les incompatibilités de dépendances (ex. le bug
 passlib/Python récent) avant le déploiement sur Streamlit Cloud, plutôt qu'en
 production. app.py est volontairement exclu : c'est le point d'entrée
 Streamlit, pas un module destiné à être importé isolément.
+
+Chaque module est importé dans un processus neuf, ce qui donne aussi son
+temps d'import à froid (dépendances comprises), affiché pour suivre les
+régressions. Deux vérifications de démarrage :
+- les modules importés par app.py avant la page de connexion
+  (LOGIN_PATH_MODULES) ne doivent charger aucune dépendance lourde
+  (HEAVY_MODULES : analyse, graphiques, Prophet, OCR...) ;
+- leur temps d'import cumulé doit rester sous $LOGIN_IMPORT_BUDGET_MS
+  (défaut DEFAULT_LOGIN_IMPORT_BUDGET_MS).
 """
-import importlib
+import json
 import os
+import subprocess
 import sys
 
 # Le script vit dans .github/scripts/ ; on ajoute la racine du dépôt (où
@@ -25,14 +35,79 @@ MODULES_TO_CHECK = [
     "analysis",
     "forms",
     "investments",
+    "maintenance",
+    "dates",
+    "buckets",
+    "instrumentation",
+    "admin",
+    "profiling",
+    "derived",
+    "anomalies",
+    "search",
+    "portfolio",
+    "quotes",
+    "cache",
+    "snapshots",
+    "throttle",
+    "write_queue",
+]
+
+# Importés en tête de app.py, donc payés par la page de connexion.
+LOGIN_PATH_MODULES = [
+    "temp_db_client",
+    "users",
+    "currency",
+    "instrumentation",
+    "profiling",
+]
+
+# Ne doivent être chargés qu'une fois l'utilisateur connecté, à l'usage.
+HEAVY_MODULES = [
+    "pandas",
+    "analysis",
+    "plots",
+    "forms",
+    "prophet",
+    "cmdstanpy",
+    # plotly.graph_objects n'y figure pas : Streamlit l'importe lui-même
+    # (thème des graphiques), sous forme de module paresseux peu coûteux.
+    "plotly.express",
+    "pytesseract",
+    "openpyxl",
 ]
 
+DEFAULT_LOGIN_IMPORT_BUDGET_MS = 2500
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    __import__(name)
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({"ms": elapsed, "heavy": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def import_in_fresh_process(module_names):
+    """Importe les modules dans un nouvel interpréteur. Retourne
+    (temps en ms, dépendances lourdes chargées), ou lève RuntimeError avec
+    la fin de la sortie d'erreur si l'import échoue."""
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE % (HEAVY_MODULES,), *module_names],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "échec")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report["ms"], report["heavy"]
+
+
 def main():
     failures = []
     for module_name in MODULES_TO_CHECK:
         try:
-            importlib.import_module(module_name)
-            print(f"OK   - {module_name}")
+            elapsed_ms, _heavy = import_in_fresh_process([module_name])
+            print(f"OK   - {module_name:<16} {elapsed_ms:8.0f} ms")
         except Exception as exc:
             failures.append((module_name, exc))
             print(f"FAIL - {module_name}: {exc!r}")
@@ -45,5 +120,15 @@ def main():
 
     print(f"\nLes {len(MODULES_TO_CHECK)} modules se sont importés avec succès.")
 
+    login_ms, heavy = import_in_fresh_process(LOGIN_PATH_MODULES)
+    budget_ms = float(os.environ.get("LOGIN_IMPORT_BUDGET_MS", DEFAULT_LOGIN_IMPORT_BUDGET_MS))
+    print(f"\nPage de connexion : {login_ms:.0f} ms d'imports (budget {budget_ms:.0f} ms).")
+    if heavy:
+        print(f"FAIL - dépendances lourdes chargées avant la connexion : {', '.join(heavy)}")
+        sys.exit(1)
+    if login_ms > budget_ms:
+        print("FAIL - budget d'import de la page de connexion dépassé.")
+        sys.exit(1)
+
 if __name__ == "__main__":
     main()
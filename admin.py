@@ -0,0 +1,72 @@
+"""Panneau d'administration (barre latérale), réservé au rôle "admin" :
+consommation Firestore de l'app (par méthode, page et rôle), statistiques des
+vues dérivées et mémoire des sessions, cache partagé et mode profilage."""
+import os
+import streamlit as st
+import cache
+import instrumentation
+from derived import SESSION_KEY as DERIVED_GRAPH_KEY, memory_budget_bytes, memory_stats
+
+
+def render_admin_panel():
+    """Affiche le panneau si l'utilisateur connecté est administrateur."""
+    if st.session_state.get('role') != 'admin':
+        return
+
+    with st.sidebar.expander("🛠️ Administration"):
+        st.markdown("##### Consommation Firestore (processus courant)")
+        rows = instrumentation.snapshot()
+        if rows:
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+        else:
+            st.caption("Aucun appel Firestore enregistré pour l'instant.")
+
+        prometheus_text = instrumentation.to_prometheus_text()
+        st.download_button(
+            "📥 Exporter (format Prometheus)",
+            data=prometheus_text.encode('utf-8'),
+            file_name="probudget_firestore.prom",
+            mime="text/plain",
+            use_container_width=True,
+        )
+        metrics_file = os.environ.get(instrumentation.METRICS_FILE_ENV)
+        if metrics_file:
+            st.caption(f"Export automatique vers `{metrics_file}`.")
+        if st.button("Remettre les compteurs à zéro", use_container_width=True):
+            instrumentation.reset()
+            st.rerun()
+
+        st.markdown("##### Vues dérivées (session courante)")
+        graph = st.session_state.get(DERIVED_GRAPH_KEY)
+        if graph is not None and graph.stats():
+            st.dataframe(graph.stats(), use_container_width=True, hide_index=True)
+        else:
+            st.caption("Aucune vue dérivée calculée pour l'instant.")
+
+        st.markdown("##### Mémoire des sessions (processus courant)")
+        sessions = memory_stats(current=graph)
+        if sessions:
+            total = sum(row["mémoire (Mo)"] for row in sessions)
+            st.caption(f"{total:.1f} Mo sur un budget de {memory_budget_bytes() / 1024 / 1024:.0f} Mo "
+                       "(les sessions inactives sont vidées au-delà).")
+            st.dataframe(sessions, use_container_width=True, hide_index=True)
+
+        st.markdown("##### Cache partagé (taux de change, prévisions)")
+        cache_rows = cache.stats()
+        if cache_rows:
+            st.dataframe(cache_rows, use_container_width=True, hide_index=True)
+        else:
+            st.caption("Aucun accès au cache pour l'instant.")
+        st.caption("Niveaux actifs : " + ", ".join(tier.name for tier in cache.get_cache().tiers))
+
+        st.markdown("##### Profilage")
+        st.checkbox(
+            "Mode profilage (cascade des sections du rerun)",
+            key="profiling_enabled",
+            help="Équivalent au paramètre d'URL ?profile=1.",
+        )
+        st.checkbox(
+            "Enregistrer un profil cProfile par rerun (.pstats)",
+            key="profiling_dump",
+            disabled=not st.session_state.get("profiling_enabled", False),
+        )
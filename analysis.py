@@ -1,21 +1,135 @@
 import calendar
+import importlib.util
+import threading
 from datetime import date
+import numpy as np
 import pandas as pd
 import streamlit as st
+from cache import cached
+from dates import to_naive_datetime_series
+from profiling import profiled
 
-try:
-    from prophet import Prophet
-    PROPHET_AVAILABLE = True
-except Exception:
-    # On capture toute exception (pas seulement ImportError) car l'import de
-    # Prophet peut aussi échouer au runtime (ex: binaire cmdstan manquant).
-    Prophet = None
-    PROPHET_AVAILABLE = False
+# Prophet (et cmdstanpy qu'il entraîne) n'est importé qu'au premier calcul de
+# prévision, pas à l'import du module. PROPHET_AVAILABLE reste lisible comme
+# un attribut du module (voir __getattr__) : sonde paresseuse.
+_prophet_class = None
+_prophet_loaded = False
+_prophet_lock = threading.Lock()
 
-def prepare_data(entries):
-    """Transforme les données brutes Firestore en DataFrame structuré."""
+
+def load_prophet():
+    """Classe Prophet, importée au premier appel ; None si indisponible."""
+    global _prophet_class, _prophet_loaded
+    if not _prophet_loaded:
+        with _prophet_lock:
+            if not _prophet_loaded:
+                try:
+                    from prophet import Prophet
+                    _prophet_class = Prophet
+                except Exception:
+                    # On capture toute exception (pas seulement ImportError) car l'import de
+                    # Prophet peut aussi échouer au runtime (ex: binaire cmdstan manquant).
+                    _prophet_class = None
+                _prophet_loaded = True
+    return _prophet_class
+
+
+def prophet_available():
+    """Prophet est-il utilisable ? Avant le premier calcul, on vérifie
+    seulement qu'il est installé (sans l'importer) ; ensuite, on sait si
+    l'import a réussi."""
+    if _prophet_loaded:
+        return _prophet_class is not None
+    return importlib.util.find_spec("prophet") is not None
+
+
+def __getattr__(name):
+    if name == "PROPHET_AVAILABLE":
+        return prophet_available()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class MonthlyAggregate:
+    """Agrégat mensuel unique d'un rendu, partagé par les indicateurs, les
+    graphiques, la prévision et les alertes au lieu que chacun rééchantillonne
+    les transactions de son côté.
+
+    Calculé en un seul groupby mois × type × catégorie (by_type_category) ;
+    les séries par mois en sont dérivées, sur une plage de mois continue
+    (un mois sans transaction vaut 0, comme avec resample).
+    """
+
+    def __init__(self, by_type_category):
+        self.by_type_category = by_type_category
+
+        if by_type_category.empty:
+            months = pd.PeriodIndex([], freq='M')
+            by_type = pd.DataFrame(index=months)
+        else:
+            by_type = by_type_category.groupby(level=['month', 'type']).sum().unstack('type', fill_value=0)
+            months = pd.period_range(by_type.index.min(), by_type.index.max(), freq='M', name='month')
+            by_type = by_type.reindex(months, fill_value=0)
+
+        zeros = pd.Series(0.0, index=months)
+        self.revenue = by_type['Revenu'] if 'Revenu' in by_type else zeros
+        self.expense = by_type['Dépense'] if 'Dépense' in by_type else zeros
+        # Même convention que le profit par ligne : tout ce qui n'est pas un
+        # Revenu est compté comme une sortie.
+        self.profit = self.revenue - (by_type.sum(axis=1) - self.revenue) if not by_type.empty else zeros
+
+        # Taux d'épargne mensuel réel : (revenus - dépenses) / revenus * 100.
+        savings_rate = (self.profit / self.revenue) * 100
+        self.savings_rate = savings_rate.replace([float('inf'), -float('inf')], 0).fillna(0)
+
+    @property
+    def months(self):
+        return self.profit.index
+
+    def profit_by_month_end(self):
+        """Profit mensuel indexé par date de fin de mois (format attendu par Prophet)."""
+        series = self.profit.copy()
+        series.index = self.months.to_timestamp(how='end').normalize()
+        return series
+
+
+# Format du DataFrame préparé (colonnes, dtypes, index, attrs) : fait partie
+# de la clé des instantanés locaux (snapshots.py). À incrémenter à chaque
+# changement de prepare_dashboard_data ou de MonthlyAggregate, sinon un
+# instantané écrit par l'ancien code serait relu par le nouveau.
+SNAPSHOT_FORMAT_VERSION = 2
+
+# Colonnes du DataFrame préparé stockées en dtype "category".
+CATEGORICAL_COLUMNS = ('type', 'category', 'currency_original', 'currency_pivot', 'exchange_rate_source')
+# Nombre d'entrées écartées faute de date exploitable (df.attrs du DataFrame préparé).
+INVALID_DATES_ATTR = 'invalid_dates'
+
+
+def compute_monthly_aggregate(df):
+    """Un seul groupby mois × type × catégorie sur le DataFrame préparé."""
+    if df.empty:
+        return MonthlyAggregate(pd.Series(dtype='float64'))
+    months = df.index.to_period('M').rename('month')
+    by_type_category = df.groupby(
+        [months, df['type'].rename('type'), df['category'].rename('category')],
+        observed=True, dropna=False,
+    )['amount'].sum()
+    return MonthlyAggregate(by_type_category)
+
+
+@profiled
+def prepare_dashboard_data(entries):
+    """Transforme les données brutes Firestore en DataFrame structuré, et
+    calcule dans la foulée l'agrégat mensuel partagé du rendu.
+
+    Retourne (df, monthly) ; df vide et agrégat vide s'il n'y a aucune entrée.
+    Les entrées sans date exploitable sont écartées ; leur nombre est dans
+    df.attrs[INVALID_DATES_ATTR].
+
+    Tout changement du format du résultat : incrémenter SNAPSHOT_FORMAT_VERSION.
+    """
     if not entries:
-        return pd.DataFrame()
+        df = pd.DataFrame()
+        return df, compute_monthly_aggregate(df)
 
     df = pd.DataFrame(entries)
 
@@ -27,31 +141,49 @@ def prepare_data(entries):
         df['type'] = 'Dépense'
     if 'amount' not in df.columns:
         df['amount'] = 0
+    if 'category' not in df.columns:
+        df['category'] = 'Autre'
 
-    df['date'] = pd.to_datetime(df['date'])
+    # Dates typées (Timestamps Firestore) converties sans analyse de chaîne ;
+    # seules les chaînes ISO des documents hérités passent par le parseur.
+    # Une date manquante ou illisible n'est pas remplacée par "maintenant" (la
+    # transaction gonflerait le mois en cours, la projection et la
+    # prévision) : la ligne est écartée et comptée dans df.attrs.
+    dates = to_naive_datetime_series(df['date'])
+    invalid_dates = int(dates.isna().sum())
+    if invalid_dates:
+        df = df.loc[dates.notna()].copy()
+        dates = dates.loc[df.index]
+    df['date'] = dates
+    for col in ('created_at', 'exchange_rate_date'):
+        if col in df.columns:
+            df[col] = to_naive_datetime_series(df[col])
     df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0)
+    # Colonnes à peu de valeurs distinctes : catégorielles (un code entier par
+    # ligne) plutôt qu'une chaîne par ligne, dans chaque session connectée.
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
     
-    # Calcul du profit net par ligne
-    df['profit'] = df.apply(lambda row: row['amount'] if row['type'] == 'Revenu' else -row['amount'], axis=1)
+    # Calcul du profit net par ligne (vectorisé)
+    df['profit'] = np.where(df['type'] == 'Revenu', df['amount'], -df['amount'])
     
     df = df.set_index('date').sort_index()
     
-    # Agrégation mensuelle pour le calcul exact du taux d'épargne
-    monthly = df.resample('ME').agg({'profit': 'sum'})
-    monthly['rev_total'] = df[df['type'] == 'Revenu'].resample('ME')['amount'].sum().fillna(0)
+    monthly = compute_monthly_aggregate(df)
 
-    # Taux d'épargne mensuel réel : (revenus - dépenses) / revenus * 100.
-    # monthly['profit'] vaut déjà (revenus - dépenses) du mois (profit par
-    # ligne = montant si Revenu, -montant si Dépense), donc la formule est
-    # directement profit / rev_total * 100.
-    monthly['taux_epargne'] = (monthly['profit'] / monthly['rev_total']) * 100
-    monthly['taux_epargne'] = monthly['taux_epargne'].replace([float('inf'), -float('inf')], 0).fillna(0)
+    # Taux d'épargne du mois de chaque transaction, lu dans l'agrégat
+    df['taux_epargne'] = monthly.savings_rate.reindex(df.index.to_period('M')).to_numpy()
+    df.attrs[INVALID_DATES_ATTR] = invalid_dates
 
-    # Cartographie propre sur l'index
-    df['taux_epargne'] = df.index.to_period('M').map(monthly['taux_epargne'].to_dict())
+    return df, monthly
 
-    return df
 
+def prepare_data(entries):
+    """Transforme les données brutes Firestore en DataFrame structuré."""
+    return prepare_dashboard_data(entries)[0]
+
+@profiled
 def compute_monthly_budget_status(df, today=None):
     """Calcule le solde disponible du mois en cours et le budget journalier
     restant, pour la carte "Combien puis-je dépenser ?".
@@ -85,6 +217,86 @@ def compute_monthly_budget_status(df, today=None):
         "month_end": month_end,
     }
 
+# Projection du solde de fin de mois par rééchantillonnage (block bootstrap)
+# des flux quotidiens des mois passés.
+PROJECTION_SIMULATIONS = 2000
+PROJECTION_BLOCK_DAYS = 7
+PROJECTION_MAX_MONTHS = 24
+PROJECTION_MIN_MONTHS = 2
+
+
+@profiled
+def project_month_end_balance(df, today=None, n_sims=PROJECTION_SIMULATIONS, block_days=PROJECTION_BLOCK_DAYS,
+                              max_months=PROJECTION_MAX_MONTHS, seed=0):
+    """Distribution du solde de fin de mois d'après le rythme de dépenses et
+    de revenus de l'utilisateur, pour la carte "Combien puis-je dépenser ?".
+
+    Les jours restants du mois (après today) sont découpés en blocs de
+    block_days jours ; chaque bloc de chaque simulation reprend les flux nets
+    des mêmes jours du mois d'un mois passé tiré au hasard (block bootstrap
+    calé sur le calendrier : le salaire du 1er ou le loyer du 5 restent à
+    leur place). Les n_sims simulations sont tirées d'un bloc (numpy).
+
+    Retourne None sans transaction ce mois-ci ou avec moins de
+    PROJECTION_MIN_MONTHS mois d'historique ; sinon un dict : percentiles
+    p10/p50/p90 du solde de fin de mois, moyenne, probabilité de finir le
+    mois dans le rouge et nombre de mois d'historique utilisés.
+    """
+    status = compute_monthly_budget_status(df, today)
+    if status is None:
+        return None
+    if today is None:
+        today = date.today()
+
+    month_start = pd.Timestamp(today.year, today.month, 1)
+    history = df.loc[(df.index < month_start) & (df.index >= month_start - pd.DateOffset(months=max_months)), 'profit'].astype('float64')
+    if history.empty:
+        return None
+
+    # Matrice mois passés × jour du mois (1..31) des flux nets ; un mois
+    # sans transaction compte comme un mois à flux nuls.
+    months = pd.period_range(history.index.min().to_period('M'), month_start.to_period('M') - 1, freq='M')
+    if len(months) < PROJECTION_MIN_MONTHS:
+        return None
+    flows = (
+        history.groupby([history.index.to_period('M'), history.index.day]).sum()
+        .unstack(fill_value=0.0)
+        .reindex(index=months, columns=range(1, 32), fill_value=0.0)
+        .to_numpy(dtype='float64')
+    )
+    # Jours inexistants d'un mois court (30 février...) : flux médian du mois,
+    # plutôt qu'une journée sans aucune dépense.
+    missing = np.arange(1, 32) > np.asarray(months.days_in_month)[:, None]
+    existing = np.where(missing, np.nan, flows)
+    flows = np.where(missing, np.nanmedian(existing, axis=1)[:, None], flows)
+
+    days = np.arange(today.day + 1, status["month_end"].day + 1)
+    finals = np.full(n_sims, status["balance"], dtype='float64')
+    if len(days):
+        block_of_day = (days - days[0]) // block_days
+        rng = np.random.default_rng(seed)
+        picks = rng.integers(0, len(months), size=(n_sims, block_of_day[-1] + 1))
+        finals += flows[picks[:, block_of_day], days - 1].sum(axis=1)
+
+    p10, p50, p90 = np.percentile(finals, [10, 50, 90])
+    return {
+        "p10": p10,
+        "p50": p50,
+        "p90": p90,
+        "mean": finals.mean(),
+        "overspend_probability": float((finals < 0).mean()),
+        "months_used": len(months),
+        "days_simulated": len(days),
+    }
+
+def daily_balance_series(df):
+    """Solde cumulé jour par jour (somme des profits depuis la première
+    transaction), calendrier continu : un jour sans transaction reprend le
+    solde de la veille. Entièrement vectorisé (resample + cumsum)."""
+    if df.empty:
+        return pd.Series(dtype='float64')
+    return df['profit'].resample('D').sum().cumsum().rename('solde')
+
 # En dessous de ce nombre de mois d'historique, une prévision Prophet n'est
 # pas assez fiable pour être présentée comme telle sous "Prévision IA".
 FORECAST_MIN_MONTHS = 3
@@ -99,25 +311,41 @@ def _forecast_label(months_used):
     return "Prévision (historique suffisant)"
 
 
-@st.cache_data(ttl=3600, show_spinner=False)
-def forecast_prophet(df):
+def _forecast_is_final(forecast):
+    """Résultat à conserver en cache : une prévision calculée, ou un
+    historique trop court. Prophet indisponible ou en échec : on réessaiera."""
+    return forecast["available"] or forecast["months_used"] < FORECAST_MIN_MONTHS
+
+
+@profiled
+@cached("forecast", ttl=3600, cache_if=_forecast_is_final)
+def forecast_prophet(monthly_profit):
     """Prédit le profit du mois prochain, avec une fourchette (yhat_lower/yhat_upper)
     plutôt qu'un chiffre unique.
 
+    monthly_profit : profit mensuel indexé par fin de mois
+    (MonthlyAggregate.profit_by_month_end()) ; une petite série, bien moins
+    coûteuse à hacher pour la clé du cache partagé (cache.py) que tout le
+    DataFrame.
+
     Retourne toujours un dict avec au moins "available" et "months_used" :
     - available=False, months_used<FORECAST_MIN_MONTHS : pas assez d'historique.
     - available=False, months_used>=FORECAST_MIN_MONTHS : Prophet indisponible
-      ou échec du calcul (binaire cmdstan manquant, etc.).
+      ou échec du calcul (binaire cmdstan manquant, etc.) ; jamais mis en
+      cache, le calcul est retenté au rendu suivant.
     - available=True : yhat/yhat_lower/yhat_upper/label présents.
     """
-    if not PROPHET_AVAILABLE or df.empty:
+    if monthly_profit.empty:
         return {"available": False, "months_used": 0}
 
-    ts = df['profit'].resample('ME').sum().reset_index()
-    ts.columns = ['ds', 'y']
+    ts = monthly_profit.rename_axis('ds').reset_index(name='y')
     months_used = len(ts)
 
-    if months_used < FORECAST_MIN_MONTHS:
+    if months_used < FORECAST_MIN_MONTHS or not prophet_available():
+        return {"available": False, "months_used": months_used}
+
+    Prophet = load_prophet()
+    if Prophet is None:
         return {"available": False, "months_used": months_used}
 
     try:
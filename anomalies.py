@@ -0,0 +1,127 @@
+"""Détection des dépenses atypiques par catégorie, en remplacement du seuil
+unique de alert_expense (bruyant pour le loyer, aveugle pour les petites
+catégories).
+
+Pour chaque catégorie, on garde une fenêtre glissante des WINDOW dernières
+dépenses ; une nouvelle dépense est comparée à la médiane et à l'écart
+interquartile (IQR) de la fenêtre qui la précède, via un score robuste
+z = (montant - médiane) / (IQR / 1.349). Au-delà de Z_CUTOFF, elle est
+signalée comme atypique.
+
+Incrémental : AnomalyDetector.update ne score que les transactions qu'il n'a
+pas encore vues (coût proportionnel aux nouvelles entrées, pas à tout
+l'historique), par calcul vectorisé (rolling median/quantile) sur la fin de
+fenêtre de la catégorie suivie des nouveaux montants.
+
+Le seuil configuré par l'utilisateur reste le plancher de secours : tant
+qu'une catégorie n'a pas MIN_HISTORY dépenses d'historique, une dépense y est
+signalée dès qu'elle dépasse ce seuil (comportement historique).
+"""
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+WINDOW = 60
+MIN_HISTORY = 5
+Z_CUTOFF = 3.5
+# IQR d'une loi normale = 1.349 écart-type : rend le score comparable à un z-score.
+IQR_TO_SIGMA = 1.349
+# Échelle minimale relative à la médiane : une catégorie aux montants
+# identiques (abonnement) aurait sinon un IQR nul, et la moindre variation
+# deviendrait "atypique".
+MIN_RELATIVE_SCALE = 0.1
+
+# Dépenses candidates gardées par catégorie (les plus récentes) : seule la
+# plus récente sert à l'alerte, inutile d'accumuler toute la session.
+MAX_CANDIDATES_PER_CATEGORY = 20
+
+SESSION_KEY = "anomaly_detector"
+
+
+class AnomalyDetector:
+    """Statistiques glissantes par catégorie et dépenses candidates à l'alerte."""
+
+    def __init__(self, window=WINDOW, min_history=MIN_HISTORY, z_cutoff=Z_CUTOFF, base_currency=None,
+                 max_candidates=MAX_CANDIDATES_PER_CATEGORY):
+        self.base_currency = base_currency
+        self.window = window
+        self.min_history = min_history
+        self.z_cutoff = z_cutoff
+        self.max_candidates = max_candidates
+        self._windows = {}
+        self._seen_ids = set()
+        # Dépenses atypiques (score > z_cutoff) ou sans historique suffisant
+        # (score None, jugées au seuil au moment de la requête), par
+        # catégorie : les max_candidates plus récentes seulement.
+        self._candidates = {}
+        # Résultat de anomalies() par seuil, vidé dès que update ajoute des dépenses.
+        self._flagged = {}
+
+    def update(self, df):
+        """Intègre les dépenses de df pas encore vues. Retourne leur nombre."""
+        expenses = df[df['type'] == 'Dépense']
+        if 'id' in expenses.columns:
+            seen = self._seen_ids
+            expenses = expenses[[entry_id not in seen for entry_id in expenses['id'].to_numpy()]]
+        if expenses.empty:
+            return 0
+
+        expenses = expenses.sort_index()
+        self._flagged.clear()
+        for category, group in expenses.groupby('category', sort=False, dropna=False):
+            self._score_category(category, group)
+        if 'id' in expenses.columns:
+            self._seen_ids.update(expenses['id'])
+        return len(expenses)
+
+    def _score_category(self, category, group):
+        history = self._windows.setdefault(category, deque(maxlen=self.window))
+        amounts = group['amount'].to_numpy(dtype='float64')
+        combined = pd.Series(np.concatenate([np.fromiter(history, dtype='float64'), amounts]))
+
+        # Statistiques de la fenêtre qui précède chaque montant (shift(1)).
+        rolling = combined.rolling(self.window, min_periods=self.min_history)
+        median = rolling.median().shift(1).to_numpy()[-len(amounts):]
+        iqr = (rolling.quantile(0.75) - rolling.quantile(0.25)).shift(1).to_numpy()[-len(amounts):]
+        scale = np.maximum(iqr / IQR_TO_SIGMA, MIN_RELATIVE_SCALE * np.abs(median))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = (amounts - median) / scale
+
+        ids = group['id'].to_numpy() if 'id' in group.columns else [None] * len(group)
+        candidates = self._candidates.setdefault(category, deque(maxlen=self.max_candidates))
+        for position in np.flatnonzero(np.isnan(scores) | (scores > self.z_cutoff)):
+            score = scores[position]
+            candidates.append({
+                "id": ids[position],
+                "date": group.index[position],
+                "category": category,
+                "amount": amounts[position],
+                "amount_original": group['amount_original'].iloc[position] if 'amount_original' in group else None,
+                "currency_original": group['currency_original'].iloc[position] if 'currency_original' in group else None,
+                "score": None if np.isnan(score) else float(score),
+            })
+
+        history.extend(amounts)
+
+    def anomalies(self, threshold):
+        """Dépenses signalées, de la plus récente à la plus ancienne : score
+        robuste au-delà du seuil statistique, ou, faute d'historique dans la
+        catégorie, montant au-delà du seuil configuré."""
+        if threshold not in self._flagged:
+            flagged = [
+                c for candidates in self._candidates.values() for c in candidates
+                if (c["score"] is not None) or (threshold is not None and c["amount"] > threshold)
+            ]
+            self._flagged[threshold] = sorted(flagged, key=lambda c: c["date"], reverse=True)
+        return self._flagged[threshold]
+
+
+def get_session_detector(base_currency):
+    """Détecteur de la session courante (vidé à la déconnexion). Les montants
+    étant en devise de référence, un changement de devise repart de zéro."""
+    detector = st.session_state.get(SESSION_KEY)
+    if detector is None or detector.base_currency != base_currency:
+        detector = st.session_state[SESSION_KEY] = AnomalyDetector(base_currency=base_currency)
+    return detector
@@ -1,14 +1,17 @@
+from datetime import date
 import streamlit as st
-import pandas as pd
 import extra_streamlit_components as stx
-from temp_db_client import DBClient
-from forms import entry_form
-from analysis import prepare_data, forecast_prophet, compute_monthly_budget_status, PROPHET_AVAILABLE
-from plots import plot_revenue_expense, plot_savings_rate
-# CORRECTION 1 : Importation de export_excel à la place de export_pdf
-from utils import export_csv, export_excel, alert_expense, with_nd_placeholders, EXCHANGE_RATE_TRACE_COLUMNS
-from users import login, register, logout, request_password_reset, reset_password, try_remember_me_login
+from temp_db_client import get_db_client, start_token_sweeper, start_write_queue
+from users import (
+    login, register, logout, request_password_reset, reset_password, try_remember_me_login,
+    invalidate_verified_tokens,
+)
 from currency import CURRENCY_SYMBOLS, DEFAULT_ALERT_THRESHOLDS
+from instrumentation import set_render_context, maybe_export
+from profiling import PROFILE_QUERY_PARAM, start_rerun, finish_rerun, section, render_waterfall
+# Les modules du tableau de bord (pandas, analyse, graphiques Plotly, OCR...)
+# ne sont importés qu'une fois l'utilisateur connecté, sur la page qui s'en
+# sert : la page de connexion s'affiche sans les charger.
 
 # --- CONFIGURATION DE LA PAGE ---
 # Doit rester la toute première commande Streamlit du script : on ne crée le
@@ -32,230 +35,417 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# --- INITIALISATION DE LA DB ---
-if 'db' not in st.session_state:
+# --- MODE PROFILAGE ---
+# ?profile=1 dans l'URL, ou interrupteur du panneau d'administration. Le
+# profil cProfile sur disque reste réservé aux administrateurs.
+profiler = start_rerun(
+    enabled=st.query_params.get(PROFILE_QUERY_PARAM) == "1" or st.session_state.get('profiling_enabled', False),
+    dump=st.session_state.get('role') == 'admin' and st.session_state.get('profiling_dump', False),
+)
+
+# Tout le reste du rerun dans un try/finally : un rerun interrompu
+# (st.rerun(), st.stop(), exception) doit quand même arrêter le profilage,
+# sinon cProfile resterait actif pour tout le processus.
+try:
+    # --- INITIALISATION DE LA DB ---
+    # Client partagé par tout le processus (voir get_db_client) : la session ne
+    # conserve que l'identité de l'utilisateur, la connexion Firestore n'est
+    # créée qu'au premier appel réel. Le balayage des jetons "rester connecté"
+    # expirés tourne en fond, une fois par processus.
     try:
-        st.session_state['db'] = DBClient()
+        db = get_db_client()
+        start_token_sweeper(db)
     except Exception:
         # Pas de détail brut d'exception : il peut contenir des fragments de la clé Firebase.
         st.error("Erreur d'initialisation de la base de données.")
         st.stop()
-db = st.session_state['db']
 
-# --- RECONNEXION AUTOMATIQUE ("RESTER CONNECTÉ") ---
-# Survit aux rechargements de page (retape d'URL, ou rechargement forcé de
-# l'onglet mobile après ouverture de l'appareil photo/sélecteur de fichiers)
-# qui vident st.session_state.
-if 'user' not in st.session_state:
-    try_remember_me_login(db, cookie_manager)
+    # Étiquettes des métriques Firestore de ce rerun (affinées une fois la page connue).
+    set_render_context(page="connexion", role=st.session_state.get('role'))
+    maybe_export()
 
-# --- LOGIQUE D'ACCÈS (NON CONNECTÉ) ---
-if 'user' not in st.session_state:
-    # On cache le menu latéral si non connecté pour la sécurité
-    st.markdown("<style>#MainMenu {visibility: hidden;} footer {visibility: hidden;}</style>", unsafe_allow_html=True)
+    # --- RECONNEXION AUTOMATIQUE ("RESTER CONNECTÉ") ---
+    # Survit aux rechargements de page (retape d'URL, ou rechargement forcé de
+    # l'onglet mobile après ouverture de l'appareil photo/sélecteur de fichiers)
+    # qui vident st.session_state.
+    if 'user' not in st.session_state:
+        with section("Reconnexion automatique"):
+            try_remember_me_login(db, cookie_manager)
+
+    # --- LOGIQUE D'ACCÈS (NON CONNECTÉ) ---
+    if 'user' not in st.session_state:
+        # On cache le menu latéral si non connecté pour la sécurité
+        st.markdown("<style>#MainMenu {visibility: hidden;} footer {visibility: hidden;}</style>", unsafe_allow_html=True)
     
-    st.title("🚀 Bienvenue sur ProBudget AI")
-    st.info("Gerez vos finances avec la puissance de l'IA.")
+        st.title("🚀 Bienvenue sur ProBudget AI")
+        st.info("Gerez vos finances avec la puissance de l'IA.")
     
-    tab1, tab2, tab3 = st.tabs(["🔒 Connexion", "📝 Créer un compte", "🔑 Mot de passe oublié"])
+        tab1, tab2, tab3 = st.tabs(["🔒 Connexion", "📝 Créer un compte", "🔑 Mot de passe oublié"])
 
-    with tab1:
-        with st.form("login_form"):
-            email_log = st.text_input("Email")
-            pass_log = st.text_input("Mot de passe", type="password")
-            remember_me = st.checkbox("Rester connecté sur cet appareil", value=True)
-            if st.form_submit_button("Se connecter", use_container_width=True):
-                login(email_log, pass_log, db, cookie_manager=cookie_manager, remember_me=remember_me)
+        with tab1:
+            with st.form("login_form"):
+                email_log = st.text_input("Email")
+                pass_log = st.text_input("Mot de passe", type="password")
+                remember_me = st.checkbox("Rester connecté sur cet appareil", value=True)
+                if st.form_submit_button("Se connecter", use_container_width=True):
+                    login(email_log, pass_log, db, cookie_manager=cookie_manager, remember_me=remember_me)
 
-    with tab2:
-        with st.form("register_form"):
-            email_reg = st.text_input("Email professionnel ou personnel")
-            pass_reg = st.text_input("Mot de passe (sécure)", type="password")
-            devise_reg = st.selectbox("Devise de référence", list(CURRENCY_SYMBOLS.keys()))
-            if st.form_submit_button("Créer mon compte", use_container_width=True):
-                register(email_reg, pass_reg, db, base_currency=devise_reg)
+        with tab2:
+            with st.form("register_form"):
+                email_reg = st.text_input("Email professionnel ou personnel")
+                pass_reg = st.text_input("Mot de passe (sécure)", type="password")
+                devise_reg = st.selectbox("Devise de référence", list(CURRENCY_SYMBOLS.keys()))
+                if st.form_submit_button("Créer mon compte", use_container_width=True):
+                    register(email_reg, pass_reg, db, base_currency=devise_reg)
 
-    with tab3:
-        st.caption(
-            "Aucun service d'email n'est configuré pour l'instant : le code de "
-            "réinitialisation doit être récupéré manuellement (console Firestore) "
-            "et transmis à l'utilisateur par l'administrateur."
-        )
-        with st.form("reset_request_form"):
-            st.markdown("##### 1. Demander un code de réinitialisation")
-            email_reset_req = st.text_input("Email du compte")
-            if st.form_submit_button("Demander un code", use_container_width=True):
-                request_password_reset(email_reset_req, db)
+        with tab3:
+            st.caption(
+                "Aucun service d'email n'est configuré pour l'instant : le code de "
+                "réinitialisation doit être récupéré manuellement (console Firestore) "
+                "et transmis à l'utilisateur par l'administrateur."
+            )
+            with st.form("reset_request_form"):
+                st.markdown("##### 1. Demander un code de réinitialisation")
+                email_reset_req = st.text_input("Email du compte")
+                if st.form_submit_button("Demander un code", use_container_width=True):
+                    request_password_reset(email_reset_req, db)
 
-        with st.form("reset_confirm_form"):
-            st.markdown("##### 2. Utiliser le code reçu")
-            email_reset = st.text_input("Email", key="reset_email")
-            token_reset = st.text_input("Code de réinitialisation")
-            new_pass_reset = st.text_input("Nouveau mot de passe", type="password")
-            if st.form_submit_button("Réinitialiser le mot de passe", use_container_width=True):
-                reset_password(email_reset, token_reset, new_pass_reset, db)
-    st.stop()
+            with st.form("reset_confirm_form"):
+                st.markdown("##### 2. Utiliser le code reçu")
+                email_reset = st.text_input("Email", key="reset_email")
+                token_reset = st.text_input("Code de réinitialisation")
+                new_pass_reset = st.text_input("Nouveau mot de passe", type="password")
+                if st.form_submit_button("Réinitialiser le mot de passe", use_container_width=True):
+                    reset_password(email_reset, token_reset, new_pass_reset, db)
+        st.stop()
     
-# --- LOGIQUE D'ACCÈS (UTILISATEUR CONNECTÉ) ---
-else:
-    base_currency = st.session_state.get('base_currency', 'XOF')
-    currency_symbol = CURRENCY_SYMBOLS.get(base_currency, base_currency)
+    # --- LOGIQUE D'ACCÈS (UTILISATEUR CONNECTÉ) ---
+    else:
+        base_currency = st.session_state.get('base_currency', 'XOF')
+        currency_symbol = CURRENCY_SYMBOLS.get(base_currency, base_currency)
 
-    # Barre latérale globale de navigation
-    with st.sidebar:
-        st.title("Menu Principal")
-        st.write(f"Connecté en tant que : **{st.session_state['user']}**")
-        page = st.radio("Aller vers :", ["📊 Tableau de Bord", "🚀 Investissements"])
+        # Barre latérale globale de navigation
+        with st.sidebar:
+            st.title("Menu Principal")
+            st.write(f"Connecté en tant que : **{st.session_state['user']}**")
+            page = st.radio("Aller vers :", ["📊 Tableau de Bord", "🚀 Investissements"])
+            set_render_context(page=page, role=st.session_state.get('role'))
 
-        with st.expander("⚙️ Paramètres du profil"):
-            currency_options = list(CURRENCY_SYMBOLS.keys())
-            new_currency = st.selectbox(
-                "Devise de référence",
-                currency_options,
-                index=currency_options.index(base_currency) if base_currency in currency_options else 0,
-                key="settings_currency"
-            )
-            current_threshold = st.session_state.get(
-                'alert_threshold', DEFAULT_ALERT_THRESHOLDS.get(base_currency, 500)
-            )
-            new_threshold = st.number_input(
-                f"Seuil d'alerte dépense élevée ({CURRENCY_SYMBOLS.get(new_currency, new_currency)})",
-                min_value=0.0, value=float(current_threshold), step=10.0, key="settings_threshold"
-            )
-            if st.button("Enregistrer les paramètres", use_container_width=True):
-                if db.update_user(st.session_state['user'], {
-                    "base_currency": new_currency,
-                    "alert_threshold": new_threshold,
-                }):
-                    st.session_state['base_currency'] = new_currency
-                    st.session_state['alert_threshold'] = new_threshold
-                    st.success("Paramètres mis à jour.")
-                    st.rerun()
+            with st.expander("⚙️ Paramètres du profil"):
+                currency_options = list(CURRENCY_SYMBOLS.keys())
+                new_currency = st.selectbox(
+                    "Devise de référence",
+                    currency_options,
+                    index=currency_options.index(base_currency) if base_currency in currency_options else 0,
+                    key="settings_currency"
+                )
+                current_threshold = st.session_state.get(
+                    'alert_threshold', DEFAULT_ALERT_THRESHOLDS.get(base_currency, 500)
+                )
+                new_threshold = st.number_input(
+                    f"Seuil d'alerte dépense élevée ({CURRENCY_SYMBOLS.get(new_currency, new_currency)})",
+                    min_value=0.0, value=float(current_threshold), step=10.0, key="settings_threshold"
+                )
+                if st.button("Enregistrer les paramètres", use_container_width=True):
+                    if db.update_user(st.session_state['user'], {
+                        "base_currency": new_currency,
+                        "alert_threshold": new_threshold,
+                    }):
+                        st.session_state['base_currency'] = new_currency
+                        st.session_state['alert_threshold'] = new_threshold
+                        # Les reconnexions "rester connecté" doivent reprendre les nouveaux paramètres.
+                        invalidate_verified_tokens(email=st.session_state['user'])
+                        st.success("Paramètres mis à jour.")
+                        st.rerun()
 
-        st.markdown("---")
-        logout(db, cookie_manager)
+            from admin import render_admin_panel
+            render_admin_panel()
 
-        st.markdown("---")
-        st.subheader("☕ Soutenir le projet")
-        if st.button("Faire un don", key="donate_btn", use_container_width=True):
-            db.log_donation_click(st.session_state.get('user', ''))
-            st.success(
-                "Merci ! Envoie ton soutien via Orange Money / Wave au "
-                "+223 71302389. ⚠️ Ceci n'est pas un paiement automatique : "
-                "c'est juste le numéro à utiliser manuellement dans ton app "
-                "Orange Money ou Wave."
+            st.markdown("---")
+            logout(db, cookie_manager)
+
+            st.markdown("---")
+            st.subheader("☕ Soutenir le projet")
+            if st.button("Faire un don", key="donate_btn", use_container_width=True):
+                db.log_donation_click(st.session_state.get('user', ''))
+                st.success(
+                    "Merci ! Envoie ton soutien via Orange Money / Wave au "
+                    "+223 71302389. ⚠️ Ceci n'est pas un paiement automatique : "
+                    "c'est juste le numéro à utiliser manuellement dans ton app "
+                    "Orange Money ou Wave."
+                )
+
+        # --- SÉLECTION DES PAGES ---
+        if page == "📊 Tableau de Bord":
+            import pandas as pd
+            from forms import entry_form
+            from analysis import (
+                daily_balance_series, forecast_prophet, compute_monthly_budget_status,
+                project_month_end_balance, PROPHET_AVAILABLE, INVALID_DATES_ATTR,
             )
+            from plots import plot_revenue_expense, plot_savings_rate, plot_daily_balance
+            # CORRECTION 1 : Importation de export_excel à la place de export_pdf
+            from utils import (
+                export_csv, export_excel, alert_expense, find_expense_alert, with_nd_placeholders,
+                csv_export_bytes, excel_export_bytes, EXCHANGE_RATE_TRACE_COLUMNS,
+            )
+            from derived import data_version, get_session_graph
+            from anomalies import get_session_detector
+            from search import get_session_index
+            from snapshots import load_prepared
+            from write_queue import merge_pending
 
-    # --- SÉLECTION DES PAGES ---
-    if page == "📊 Tableau de Bord":
-        st.title("📊 Tableau de Bord Budgétaire")
+            st.title("📊 Tableau de Bord Budgétaire")
         
-        # Barre latérale de saisie (spécifique au budget)
-        with st.sidebar:
-            st.subheader("➕ Nouvelle Opération")
-            entry = entry_form(base_currency)
-            if entry:
+            # Barre latérale de saisie (spécifique au budget)
+            with st.sidebar:
+                st.subheader("➕ Nouvelle Opération")
+                with section("Formulaire de saisie"):
+                    entry = entry_form(base_currency)
                 collection_name = f"entries_{st.session_state['uid']}"
-                if db.add_entry(collection_name, entry):
-                    st.success("Opération enregistrée avec succès !")
-                    # Utilisation d'un rafraîchissement contrôlé pour éviter les boucles OCR
-                    st.toast("Données synchronisées avec Firebase", icon="🔄")
-                    st.rerun() 
+                # File d'écriture locale (write_queue.py) : la saisie est
+                # confirmée dès qu'elle est sur disque, l'envoi à Firestore se
+                # fait en fond. Sans file, écriture directe comme avant.
+                write_worker = start_write_queue(db)
+                if entry:
+                    if write_worker is not None:
+                        write_worker.queue.enqueue(collection_name, entry)
+                        write_worker.wake()
+                        st.success("Opération enregistrée avec succès !")
+                        st.toast("Synchronisation avec Firebase en cours", icon="🔄")
+                        st.rerun()
+                    elif db.add_entry(collection_name, entry):
+                        st.success("Opération enregistrée avec succès !")
+                        # Utilisation d'un rafraîchissement contrôlé pour éviter les boucles OCR
+                        st.toast("Données synchronisées avec Firebase", icon="🔄")
+                        st.rerun() 
+                if write_worker is not None:
+                    pending_count, pending_error, _next_attempt = write_worker.queue.status(collection_name)
+                    if pending_count:
+                        st.caption(
+                            f"⏳ {pending_count} opération(s) en attente de synchronisation"
+                            + (" (Firebase injoignable, nouvel essai automatique)." if pending_error else ".")
+                        )
         
-        # Chargement et affichage des données du budget
-        collection_name = f"entries_{st.session_state['uid']}"
-        entries = db.get_entries(collection_name)
-        df = prepare_data(entries)
+            # Chargement et affichage des données du budget
+            collection_name = f"entries_{st.session_state['uid']}"
+            with section("Chargement Firestore"):
+                # Version de la collection lue sans la rapatrier ; les transactions
+                # ne sont relues qu'à défaut (erreur) ou si la version n'a pas
+                # d'instantané local (snapshots.py).
+                version = db.get_collection_version(collection_name)
+                entries = db.get_entries(collection_name) if version is None else None
+                # Opérations encore dans la file d'écriture : affichées tout de
+                # suite, sans instantané local tant qu'elles ne sont pas écrites.
+                pending = write_worker.queue.pending(collection_name) if write_worker is not None else []
+                if pending:
+                    entries = merge_pending(db.get_entries(collection_name) if entries is None else entries, pending)
+                    version = None
 
-        if not df.empty:
-            # 0. Combien puis-je dépenser ? (calcul direct sur les données du
-            # mois en cours, pas d'IA nécessaire). N'apparaît que s'il y a au
-            # moins une transaction ce mois-ci.
-            budget_status = compute_monthly_budget_status(df)
-            if budget_status is not None:
-                st.subheader("💸 Combien puis-je dépenser ?")
-                if budget_status["balance"] < 0:
-                    st.error(
-                        f"⚠️ Budget du mois dépassé de {abs(budget_status['balance']):,.2f} "
-                        f"{currency_symbol}. Plus de marge de dépense avant le mois prochain."
-                    )
-                else:
-                    st.info(
-                        f"Il te reste **{budget_status['balance']:,.2f} {currency_symbol}**, soit "
-                        f"environ **{budget_status['daily_budget']:,.2f} {currency_symbol}/jour** "
-                        f"jusqu'au {budget_status['month_end'].strftime('%d/%m/%Y')}."
-                    )
-                st.markdown("---")
+            # Vues dérivées : chaque nœud n'est recalculé que si la version des
+            # transactions (ou un de ses paramètres) a changé depuis le rerun précédent.
+            graph = get_session_graph()
+            graph.set_source("entries", entries, version if version is not None else data_version(entries))
+            with section("Préparation des données"):
+                # df + agrégat mensuel unique, partagé par les graphiques et la prévision
+                df, monthly = graph.compute(
+                    "prepared",
+                    lambda entries: load_prepared(db, collection_name, st.session_state['uid'], version, entries),
+                    deps=("entries",),
+                )
 
-            # 1. Indicateurs Clés
-            # La carte "Prévision IA" n'apparaît que si Prophet est disponible ;
-            # sinon le reste du tableau de bord continue de fonctionner normalement.
-            cols = st.columns(3) if PROPHET_AVAILABLE else st.columns(2)
-            col1, col2 = cols[0], cols[1]
-            with col1:
-                st.metric(f"Profit Total (Pivot {base_currency})", f"{df['profit'].sum():,.2f} {currency_symbol}", delta=None)
-            with col2:
-                # Éviter l'affichage de 'nan %' s'il n'y a pas encore assez de données de revenus
-                taux_epargne_moyen = df['taux_epargne'].mean()
-                taux_epargne_txt = f"{taux_epargne_moyen:.1f} %" if not pd.isna(taux_epargne_moyen) else "0.0 %"
-                st.metric("Taux d'Épargne Moyen", taux_epargne_txt)
+            invalid_dates = df.attrs.get(INVALID_DATES_ATTR, 0)
+            if invalid_dates:
+                st.warning(f"⚠️ {invalid_dates} opération(s) ignorée(s) : date manquante ou illisible.")
 
-            if PROPHET_AVAILABLE:
-                with cols[2]:
-                    with st.spinner("Calcul de la prévision IA..."):
-                        forecast = forecast_prophet(df)
-                    if forecast["available"]:
-                        st.metric(
-                            f"{forecast['label']} (M+1)",
-                            f"{forecast['yhat']:,.2f} {currency_symbol}",
+            if not df.empty:
+                # 0. Combien puis-je dépenser ? (calcul direct sur les données du
+                # mois en cours, pas d'IA nécessaire). N'apparaît que s'il y a au
+                # moins une transaction ce mois-ci.
+                with section("Carte budget"):
+                    budget_status = graph.compute(
+                        "budget_status", lambda prepared: compute_monthly_budget_status(prepared[0]),
+                        deps=("prepared",), params=(date.today(),),
+                    )
+                    # Projection de fin de mois d'après le rythme habituel : recalculée
+                    # seulement à une nouvelle version des données ou un nouveau jour.
+                    projection = graph.compute(
+                        "month_end_projection", lambda prepared: project_month_end_balance(prepared[0]),
+                        deps=("prepared",), params=(date.today(),),
+                    )
+                if budget_status is not None:
+                    st.subheader("💸 Combien puis-je dépenser ?")
+                    if budget_status["balance"] < 0:
+                        st.error(
+                            f"⚠️ Budget du mois dépassé de {abs(budget_status['balance']):,.2f} "
+                            f"{currency_symbol}. Plus de marge de dépense avant le mois prochain."
                         )
+                    else:
+                        st.info(
+                            f"Il te reste **{budget_status['balance']:,.2f} {currency_symbol}**, soit "
+                            f"environ **{budget_status['daily_budget']:,.2f} {currency_symbol}/jour** "
+                            f"jusqu'au {budget_status['month_end'].strftime('%d/%m/%Y')}."
+                        )
+                    if projection is not None and projection["days_simulated"] > 0:
                         st.caption(
-                            f"Fourchette (95%) : {forecast['yhat_lower']:,.2f} – "
-                            f"{forecast['yhat_upper']:,.2f} {currency_symbol}"
+                            f"📉 À ton rythme habituel ({projection['months_used']} mois d'historique), "
+                            f"fin de mois vers **{projection['p50']:,.0f} {currency_symbol}** "
+                            f"(entre {projection['p10']:,.0f} et {projection['p90']:,.0f} {currency_symbol} "
+                            f"8 fois sur 10). Risque de finir dans le rouge : "
+                            f"**{projection['overspend_probability']:.0%}**."
                         )
-                    elif forecast["months_used"] < 3:
-                        st.metric("Prévision IA (M+1)", "Indisponible")
-                        st.caption("Prévision indisponible (min. 3 mois de données)")
-                    else:
-                        st.metric("Prévision IA (M+1)", "Indisponible")
+                    st.markdown("---")
+
+                # 1. Indicateurs Clés
+                # La carte "Prévision IA" n'apparaît que si Prophet est disponible ;
+                # sinon le reste du tableau de bord continue de fonctionner normalement.
+                cols = st.columns(3) if PROPHET_AVAILABLE else st.columns(2)
+                col1, col2 = cols[0], cols[1]
+                with col1:
+                    st.metric(f"Profit Total (Pivot {base_currency})", f"{df['profit'].sum():,.2f} {currency_symbol}", delta=None)
+                with col2:
+                    # Éviter l'affichage de 'nan %' s'il n'y a pas encore assez de données de revenus
+                    taux_epargne_moyen = df['taux_epargne'].mean()
+                    taux_epargne_txt = f"{taux_epargne_moyen:.1f} %" if not pd.isna(taux_epargne_moyen) else "0.0 %"
+                    st.metric("Taux d'Épargne Moyen", taux_epargne_txt)
+
+                if PROPHET_AVAILABLE:
+                    with cols[2]:
+                        with st.spinner("Calcul de la prévision IA..."), section("Prévision IA"):
+                            forecast = graph.compute(
+                                "forecast", lambda prepared: forecast_prophet(prepared[1].profit_by_month_end()),
+                                deps=("prepared",),
+                            )
+                        if forecast["available"]:
+                            st.metric(
+                                f"{forecast['label']} (M+1)",
+                                f"{forecast['yhat']:,.2f} {currency_symbol}",
+                            )
+                            st.caption(
+                                f"Fourchette (95%) : {forecast['yhat_lower']:,.2f} – "
+                                f"{forecast['yhat_upper']:,.2f} {currency_symbol}"
+                            )
+                        elif forecast["months_used"] < 3:
+                            st.metric("Prévision IA (M+1)", "Indisponible")
+                            st.caption("Prévision indisponible (min. 3 mois de données)")
+                        else:
+                            st.metric("Prévision IA (M+1)", "Indisponible")
+
+                # 2. Graphiques
+                st.subheader("📈 Analyses Graphiques")
+                c1, c2 = st.columns(2)
+                with c1, section("Graphique flux mensuels"):
+                    fig_flux = graph.compute(
+                        "fig_flux", lambda prepared: plot_revenue_expense(prepared[0], base_currency, prepared[1]),
+                        deps=("prepared",), params=(base_currency,),
+                    )
+                    st.plotly_chart(fig_flux, use_container_width=True)
+                with c2, section("Graphique taux d'épargne"):
+                    fig_epargne = graph.compute(
+                        "fig_epargne", lambda prepared: plot_savings_rate(prepared[0], prepared[1]),
+                        deps=("prepared",),
+                    )
+                    st.plotly_chart(fig_epargne, use_container_width=True)
 
-            # 2. Graphiques
-            st.subheader("📈 Analyses Graphiques")
-            c1, c2 = st.columns(2)
-            with c1:
-                st.plotly_chart(plot_revenue_expense(df, base_currency), use_container_width=True)
-            with c2:
-                st.plotly_chart(plot_savings_rate(df), use_container_width=True)
+                # Solde cumulé jour par jour : la série complète reste côté serveur,
+                # seuls au plus MAX_BALANCE_POINTS points (LTTB) partent vers le
+                # navigateur ; réduire la période affichée redonne la pleine résolution.
+                with section("Graphique solde quotidien"):
+                    balance = graph.compute(
+                        "daily_balance", lambda prepared: daily_balance_series(prepared[0]), deps=("prepared",),
+                    )
+                    if len(balance) > 1:
+                        first_day, last_day = balance.index[0].date(), balance.index[-1].date()
+                        balance_window = st.slider(
+                            "Période du solde quotidien",
+                            min_value=first_day, max_value=last_day, value=(first_day, last_day),
+                            format="DD/MM/YYYY",
+                        )
+                        fig_solde = graph.compute(
+                            "fig_solde",
+                            lambda series: plot_daily_balance(
+                                series, base_currency, pd.Timestamp(balance_window[0]), pd.Timestamp(balance_window[1])
+                            ),
+                            deps=("daily_balance",), params=(base_currency, balance_window),
+                        )
+                        st.plotly_chart(fig_solde, use_container_width=True)
 
-            # 3. Alertes et Historique
-            alert_expense(df, st.session_state.get('alert_threshold'), base_currency)
+                # 3. Alertes et Historique
+                with section("Alertes"):
+                    alert_threshold = st.session_state.get('alert_threshold')
+                    # Détecteur incrémental de la session : à chaque nouvelle version
+                    # des données, seules les transactions ajoutées sont analysées.
+                    anomaly_detector = get_session_detector(base_currency)
+                    alert_message = graph.compute(
+                        "alert",
+                        lambda prepared: find_expense_alert(prepared[0], alert_threshold, base_currency, anomaly_detector),
+                        deps=("prepared",), params=(alert_threshold, base_currency),
+                    )
+                    alert_expense(df, message=alert_message)
             
-            with st.expander("📂 Voir l'historique complet des transactions"):
-                # Tri de l'affichage par index décroissant pour voir les plus récents en premier.
-                # "n/d" pour le taux de change sur les transactions créées avant son ajout.
-                df_historique = with_nd_placeholders(df, EXCHANGE_RATE_TRACE_COLUMNS)
-                st.dataframe(df_historique.sort_index(ascending=False), use_container_width=True)
+                with st.expander("📂 Voir l'historique complet des transactions"), section("Historique"):
+                    # Tri de l'affichage par index décroissant pour voir les plus récents en premier.
+                    # "n/d" pour le taux de change sur les transactions créées avant son ajout.
+                    df_historique = graph.compute(
+                        "history",
+                        lambda prepared: with_nd_placeholders(prepared[0], EXCHANGE_RATE_TRACE_COLUMNS).sort_index(ascending=False),
+                        deps=("prepared",),
+                    )
+                    # Recherche : index inversé de la session, mis à jour avec les
+                    # seules transactions nouvelles à chaque version des données.
+                    search_index = get_session_index()
+                    graph.compute("search_index", lambda prepared: search_index.update(prepared[0]), deps=("prepared",))
+                    search_col, min_col, max_col = st.columns([3, 1, 1])
+                    search_query = search_col.text_input(
+                        "🔎 Rechercher (description, catégorie, justificatif, texte du ticket)",
+                        key="history_search", placeholder="ex. resto, pharma, loyer...",
+                    )
+                    amount_min = min_col.number_input("Montant min.", min_value=0.0, value=None, key="history_amount_min")
+                    amount_max = max_col.number_input("Montant max.", min_value=0.0, value=None, key="history_amount_max")
+                    search_dates = st.date_input("Période", value=(), key="history_dates")
+                    date_min = search_dates[0] if len(search_dates) > 0 else None
+                    date_max = search_dates[1] if len(search_dates) > 1 else None
+
+                    if search_query or amount_min is not None or amount_max is not None or date_min is not None:
+                        matching_ids = search_index.search(search_query, amount_min, amount_max, date_min, date_max)
+                        if 'id' in df_historique.columns:
+                            df_historique = df_historique[df_historique['id'].isin(matching_ids)]
+                        st.caption(f"{len(df_historique)} transaction(s) trouvée(s).")
+                    st.dataframe(df_historique, use_container_width=True)
             
-            # 4. Modules d'Export
-            st.markdown("---")
-            st.subheader("📥 Rapports")
-            exp1, exp2 = st.columns(2)
-            with exp1:
-                export_csv(df, base_currency)
-            with exp2:
-                # CORRECTION 2 : Appel du bon nom de la fonction Excel
-                export_excel(df, base_currency)
+                # 4. Modules d'Export
+                st.markdown("---")
+                st.subheader("📥 Rapports")
+                exp1, exp2 = st.columns(2)
+                with exp1, section("Export CSV"):
+                    export_csv(df, base_currency, data=graph.compute(
+                        "export_csv", lambda prepared: csv_export_bytes(prepared[0], base_currency),
+                        deps=("prepared",), params=(base_currency,),
+                    ))
+                with exp2, section("Export Excel"):
+                    # CORRECTION 2 : Appel du bon nom de la fonction Excel
+                    export_excel(df, base_currency, data=graph.compute(
+                        "export_excel", lambda prepared: excel_export_bytes(prepared[0], base_currency),
+                        deps=("prepared",), params=(base_currency,),
+                    ))
                 
-        else:
-            st.warning("👋 Bienvenue ! Commencez par ajouter votre première transaction dans le menu à gauche.")  
+            else:
+                st.warning("👋 Bienvenue ! Commencez par ajouter votre première transaction dans le menu à gauche.")  
+
+        elif page == "🚀 Investissements":
+            # Importation dynamique du module de la Phase 2
+            try:
+                from investments import investment_dashboard
+                with section("Page investissements"):
+                    investment_dashboard(db, st.session_state['uid'], base_currency)
+            except Exception:
+                # On capture toute exception (pas seulement ImportError) : une
+                # erreur de syntaxe ou une erreur runtime dans investments.py ne
+                # doit jamais afficher de traceback brut à l'écran.
+                st.error("Le module 'Investissements' est indisponible pour le moment (fichier manquant ou en erreur).")
 
-    elif page == "🚀 Investissements":
-        # Importation dynamique du module de la Phase 2
-        try:
-            from investments import investment_dashboard
-            investment_dashboard(db, st.session_state['uid'], base_currency)
-        except Exception:
-            # On capture toute exception (pas seulement ImportError) : une
-            # erreur de syntaxe ou une erreur runtime dans investments.py ne
-            # doit jamais afficher de traceback brut à l'écran.
-            st.error("Le module 'Investissements' est indisponible pour le moment (fichier manquant ou en erreur).")
\ No newline at end of file
+        # Cascade du profilage, une fois toutes les sections du rerun exécutées.
+        if profiler is not None:
+            render_waterfall(profiler)
+finally:
+    finish_rerun(profiler)
@@ -0,0 +1,78 @@
+"""Mesure du gain du stockage compact par buckets mensuels (buckets.py) pour
+un gros historique : documents lus (facturés) par chargement du tableau de
+bord, octets transférés, et coût local du dépliage + prepare_data.
+
+La latence réseau Firestore n'est pas mesurable hors ligne : elle croît avec
+le nombre de documents streamés, que l'on compte ici.
+
+    python benchmarks/bench_buckets.py [nb_mois] [transactions_par_mois]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from analysis import prepare_data
+from buckets import estimate_document_size, expand_entries, pack_month
+
+
+def _synthetic_history(months, per_month, seed=0):
+    rng = random.Random(seed)
+    categories = ["Alimentation", "Transport", "Loisirs", "Santé", "Abonnements"]
+    history = {}
+    for m in range(months):
+        year, month = 2020 + m // 12, 1 + m % 12
+        key = f"{year}-{month:02d}"
+        history[key] = [
+            {
+                "id": f"{key}-{i:05d}",
+                "type": "Revenu" if i == 0 else "Dépense",
+                "amount": round(rng.uniform(500, 50_000), 2),
+                "currency_original": "XOF",
+                "currency_pivot": "XOF",
+                "category": "Salaire" if i == 0 else rng.choice(categories),
+                "date": datetime(year, month, 1 + i % 28, tzinfo=timezone.utc),
+                "created_at": datetime(year, month, 1 + i % 28, 12, tzinfo=timezone.utc),
+                "server_timestamp": datetime(year, month, 1 + i % 28, 12, i % 60, tzinfo=timezone.utc),
+                "description": rng.choice(["", "marché", "taxi", "pharmacie", "crédit téléphone"]),
+            }
+            for i in range(per_month)
+        ]
+    return history
+
+
+def main(months=60, per_month=120):
+    history = _synthetic_history(months, per_month)
+    month_keys = sorted(history)
+    current_month = month_keys[-1]
+
+    individual = [entry for key in month_keys for entry in history[key]]
+    compact = [
+        {**data, "id": doc_id}
+        for key in month_keys[:-1]
+        for doc_id, data in pack_month(key, history[key])
+    ] + history[current_month]
+
+    def _bytes(docs):
+        return sum(estimate_document_size({k: v for k, v in d.items() if k != "id"}, d["id"]) for d in docs)
+
+    start = time.perf_counter()
+    prepare_data(individual)
+    individual_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prepare_data(expand_entries(compact))
+    compact_time = time.perf_counter() - start
+
+    print(f"{months} mois x {per_month} transactions = {len(individual)} transactions")
+    print(f"documents lus  : {len(individual):7d} -> {len(compact):5d}  (÷{len(individual) / len(compact):.0f})")
+    print(f"octets stockés : {_bytes(individual):7d} -> {_bytes(compact):7d}")
+    print(f"dépliage + prepare_data : {individual_time * 1000:.1f} ms -> {compact_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,53 @@
+"""Benchmark du chargement des dates dans prepare_data, à 100k transactions :
+
+- avant : chaînes ISO (mélange "YYYY-MM-DD" / horodatages complets) passées
+  à pd.to_datetime avec inférence de format ligne par ligne ;
+- après : Timestamps Firestore natifs (datetime UTC), convertis sans analyse
+  de chaîne par dates.to_naive_datetime_series ;
+- documents hérités non migrés : chaînes passées au parseur ISO 8601 explicite.
+
+    python benchmarks/bench_date_parse.py [nb_lignes]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dates import to_naive_datetime_series
+
+
+def _best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(rows=100_000):
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    typed = [start + timedelta(hours=7 * i) for i in range(rows)]
+    legacy = [
+        d.date().isoformat() if i % 2 else d.replace(tzinfo=None).isoformat()
+        for i, d in enumerate(typed)
+    ]
+
+    # Comme dans prepare_data, la construction du DataFrame est incluse : c'est
+    # là que pandas type (ou non) la colonne.
+    before = _best_of(lambda: pd.to_datetime(pd.DataFrame({"date": legacy})["date"], format="mixed"))
+    after = _best_of(lambda: to_naive_datetime_series(pd.DataFrame({"date": typed})["date"]))
+    legacy_iso = _best_of(lambda: to_naive_datetime_series(pd.DataFrame({"date": legacy})["date"]))
+
+    print(f"{rows} lignes")
+    print(f"avant  (chaînes, inférence de format) : {before * 1000:8.1f} ms")
+    print(f"après  (horodatages natifs)           : {after * 1000:8.1f} ms  (x{before / after:.0f})")
+    print(f"hérité (chaînes, parseur ISO 8601)    : {legacy_iso * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,62 @@
+"""Coût CPU des agrégations mensuelles d'un rendu du tableau de bord :
+- avant : chaque consommateur rééchantillonne de son côté (prepare_data x2,
+  plot_revenue_expense x2, plot_savings_rate, forecast_prophet) ;
+- après : un seul groupby mois × type × catégorie (compute_monthly_aggregate).
+
+    python benchmarks/bench_monthly_aggregate.py [nb_transactions]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from analysis import compute_monthly_aggregate
+
+
+def _frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2015-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 3650, rows)), unit="D")
+    types = np.where(rng.random(rows) < 0.1, "Revenu", "Dépense")
+    df = pd.DataFrame({
+        "type": types,
+        "category": rng.choice(["Alimentation", "Transport", "Loisirs", "Salaire"], rows),
+        "amount": rng.uniform(100, 50_000, rows),
+    }, index=pd.DatetimeIndex(dates, name="date"))
+    df["profit"] = np.where(df["type"] == "Revenu", df["amount"], -df["amount"])
+    df["taux_epargne"] = 0.0
+    return df
+
+
+def _before(df):
+    monthly = df.resample('ME').agg({'profit': 'sum'})
+    monthly['rev_total'] = df[df['type'] == 'Revenu'].resample('ME')['amount'].sum()
+    df[df['type'] == 'Revenu'].resample('ME')['amount'].sum()
+    df[df['type'] == 'Dépense'].resample('ME')['amount'].sum()
+    df.resample('ME')['taux_epargne'].mean()
+    df['profit'].resample('ME').sum()
+
+
+def _best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(rows=100_000):
+    df = _frame(rows)
+    before = _best_of(lambda: _before(df))
+    after = _best_of(lambda: compute_monthly_aggregate(df))
+    print(f"{rows} transactions")
+    print(f"avant (6 rééchantillonnages) : {before * 1000:.1f} ms")
+    print(f"après (agrégat partagé)      : {after * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
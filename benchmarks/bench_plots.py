@@ -0,0 +1,70 @@
+"""Taille du JSON envoyé au navigateur et temps de construction des deux
+graphiques du tableau de bord : Plotly Express + template plotly_white
+(avant) contre graph_objects, mise en page minimale et valeurs arrondies
+(après), pour un historique court et un historique long.
+
+    python benchmarks/bench_plots.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from analysis import compute_monthly_aggregate
+from plots import figure_payload_bytes, plot_revenue_expense, plot_savings_rate
+
+
+def _frame(months, per_month=60, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = months * per_month
+    dates = pd.Timestamp("2015-01-01") + pd.to_timedelta(np.sort(rng.integers(0, months * 30, rows)), unit="D")
+    df = pd.DataFrame({
+        "type": np.where(rng.random(rows) < 0.1, "Revenu", "Dépense"),
+        "category": rng.choice(["Alimentation", "Transport", "Salaire"], rows),
+        "amount": rng.uniform(100, 50_000, rows),
+    }, index=pd.DatetimeIndex(dates, name="date"))
+    df["profit"] = np.where(df["type"] == "Revenu", df["amount"], -df["amount"])
+    return df
+
+
+def _before(monthly):
+    plot_df = pd.concat([monthly.revenue.rename('Revenu'), monthly.expense.rename('Dépense')], axis=1)
+    plot_df['month'] = plot_df.index.strftime('%b %Y')
+    fig1 = px.bar(plot_df, x='month', y=['Revenu', 'Dépense'], barmode='group',
+                  color_discrete_map={'Revenu': '#2ecc71', 'Dépense': '#e74c3c'}, template="plotly_white")
+    savings = monthly.savings_rate.rename('taux_epargne').to_frame()
+    savings['month'] = savings.index.strftime('%b %Y')
+    fig2 = px.line(savings, x='month', y='taux_epargne', markers=True, template="plotly_white")
+    return fig1, fig2
+
+
+def _after(df, monthly):
+    return plot_revenue_expense(df, "XOF", monthly), plot_savings_rate(df, monthly)
+
+
+def _timed(func):
+    start = time.perf_counter()
+    figs = func()
+    return figs, time.perf_counter() - start
+
+
+def main():
+    for months in (12, 120):
+        df = _frame(months)
+        monthly = compute_monthly_aggregate(df)
+        before, before_time = _timed(lambda: _before(monthly))
+        after, after_time = _timed(lambda: _after(df, monthly))
+        before_bytes = sum(len(pio.to_json(f).encode("utf-8")) for f in before)
+        after_bytes = sum(figure_payload_bytes(f) for f in after)
+        print(f"{months:4d} mois : {before_bytes:7d} -> {after_bytes:6d} octets, "
+              f"construction {before_time * 1000:.1f} -> {after_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
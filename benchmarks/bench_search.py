@@ -0,0 +1,73 @@
+"""Temps de construction de l'index de recherche et temps de requête sur
+100 000 transactions : préfixe seul, plusieurs mots, filtres montant/date,
+comparés à un filtrage pandas str.contains sur les mêmes colonnes.
+
+    python benchmarks/bench_search.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from search import SearchIndex
+
+WORDS = ["café", "restaurant", "loyer", "électricité", "taxi", "marché", "pharmacie",
+         "essence", "abonnement", "téléphone", "boulangerie", "école", "cinéma", "épicerie"]
+CATEGORIES = ["Alimentation", "Transport", "Logement", "Santé", "Loisirs"]
+
+
+def _frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2015-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 3650, rows)), unit="D")
+    descriptions = [" ".join(rng.choice(WORDS, 3)) + f" n{i % 997}" for i in range(rows)]
+    return pd.DataFrame({
+        "id": [f"doc{i}" for i in range(rows)],
+        "type": "Dépense",
+        "category": rng.choice(CATEGORIES, rows),
+        "description": descriptions,
+        "amount": rng.uniform(100, 200_000, rows),
+    }, index=pd.DatetimeIndex(dates, name="date"))
+
+
+def _best_ms(func, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(rows=100_000):
+    df = _frame(rows)
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.update(df)
+    print(f"construction de l'index ({rows} transactions) : {(time.perf_counter() - start) * 1000:,.0f} ms, "
+          f"{index.memory_bytes() / 1e6:.1f} Mo")
+
+    tail = _frame(100, seed=1).assign(id=[f"new{i}" for i in range(100)])
+    start = time.perf_counter()
+    index.update(pd.concat([df, tail]))
+    print(f"mise à jour incrémentale (+100) : {(time.perf_counter() - start) * 1000:,.1f} ms")
+
+    queries = {
+        "préfixe 'resta'": dict(query="resta"),
+        "deux mots 'cafe taxi'": dict(query="cafe taxi"),
+        "catégorie + montant": dict(query="sante", amount_min=50_000, amount_max=100_000),
+        "texte + dates": dict(query="elec", date_min="2020-01-01", date_max="2020-12-31"),
+    }
+    for label, kwargs in queries.items():
+        print(f"{label:<24} {_best_ms(lambda: index.search(**kwargs, limit=200)):6.2f} ms "
+              f"({len(index.search(**kwargs))} résultats)")
+
+    text = (df["description"] + " " + df["category"]).str.lower()
+    print(f"{'pandas str.contains':<24} {_best_ms(lambda: df[text.str.contains('resta')], repeat=3):6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
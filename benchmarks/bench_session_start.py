@@ -0,0 +1,52 @@
+"""Coût d'ouverture d'une session : un client Firestore (et son canal gRPC)
+par session, comme avant get_db_client, contre un client partagé par le
+processus. Mesure le temps de démarrage et la mémoire allouée par session.
+
+Aucune requête n'est envoyée : on utilise des identifiants anonymes et
+l'on force seulement la création du canal, ce que faisait chaque session au
+premier appel Firestore.
+
+    python benchmarks/bench_session_start.py [nb_sessions]
+"""
+import sys
+import time
+import tracemalloc
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+
+
+def _new_client():
+    client = firestore.Client(project="probudget-bench", credentials=AnonymousCredentials())
+    client._firestore_api  # création du canal gRPC (paresseuse dans le SDK)
+    return client
+
+
+def _measure(open_session, sessions):
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = [open_session() for _ in range(sessions)]
+    elapsed = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return elapsed / sessions, peak / sessions
+
+
+def main(sessions=200):
+    per_session_time, per_session_mem = _measure(
+        lambda: {"db": _new_client(), "user": "a@b.c", "uid": "0" * 64}, sessions
+    )
+
+    shared = _new_client()
+    shared_time, shared_mem = _measure(
+        lambda: {"db": shared, "user": "a@b.c", "uid": "0" * 64}, sessions
+    )
+
+    print(f"{sessions} sessions")
+    print(f"client par session : {per_session_time * 1000:8.3f} ms/session, {per_session_mem / 1024:8.1f} Kio/session")
+    print(f"client partagé     : {shared_time * 1000:8.3f} ms/session, {shared_mem / 1024:8.1f} Kio/session")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
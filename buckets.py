@@ -0,0 +1,152 @@
+"""Stockage compact optionnel des transactions : un document "bucket" par mois clos.
+
+Firestore facture et pagine au document : un historique de plusieurs années
+représente des milliers de petites lectures à chaque chargement. Une fois un
+mois clos, maintenance.compact_closed_months regroupe ses transactions dans
+un seul document (entries_<uid>/bucket_YYYY-MM_<partie>), sous forme de
+tableaux parallèles (une liste par champ, une position par transaction). Le
+mois en cours reste en documents individuels : la saisie ne change pas.
+
+Un bucket est découpé en plusieurs parties s'il approche la limite de 1 Mio
+par document, ou celle de 40 000 entrées d'index par document (chaque
+élément des tableaux columns.* et ids est indexé par défaut). DBClient.get_entries les redéplie de façon transparente : le
+reste de l'app ne voit que des transactions ordinaires, avec leur id d'origine.
+"""
+from datetime import date, datetime
+
+# Marqueur distinguant un bucket d'une transaction ordinaire dans entries_<uid>.
+BUCKET_MARKER = "_bucket"
+
+# Limite Firestore : 1 048 576 octets par document. On garde une marge pour
+# l'estimation (approchée) et les métadonnées du bucket.
+MAX_BUCKET_BYTES = 900_000
+
+# Limite Firestore : 40 000 entrées d'index par document. Chaque valeur d'un
+# tableau (columns.<champ>, ids) en produit une (index "array-contains"),
+# chaque champ quelques autres : on plafonne à la moitié pour la marge. Une
+# exemption d'index à champ unique sur columns et ids lèverait cette limite,
+# mais la compaction ne doit pas en dépendre.
+MAX_BUCKET_INDEX_ENTRIES = 20_000
+
+
+def bucket_doc_id(month, part):
+    """Identifiant du document bucket d'un mois ("YYYY-MM") et d'une partie."""
+    return f"bucket_{month}_{part}"
+
+
+def is_bucket(data):
+    return bool(data) and data.get(BUCKET_MARKER) is True
+
+
+def estimate_value_size(value):
+    """Taille de stockage Firestore approchée d'une valeur, selon les règles
+    documentées (chaîne : octets UTF-8 + 1, nombre/horodatage : 8, etc.)."""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime, date)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_value_size(v) for v in value)
+    if isinstance(value, dict):
+        return sum(len(str(k).encode("utf-8")) + 1 + estimate_value_size(v) for k, v in value.items())
+    return len(str(value).encode("utf-8")) + 1
+
+
+def estimate_document_size(data, doc_id=""):
+    """Taille approchée d'un document Firestore (champs + nom + 32 octets)."""
+    return estimate_value_size(data) + len(doc_id.encode("utf-8")) + 1 + 32
+
+
+def pack_month(month, entries, max_bytes=MAX_BUCKET_BYTES, max_index_entries=MAX_BUCKET_INDEX_ENTRIES):
+    """Regroupe les transactions d'un mois clos en documents bucket.
+
+    entries : dicts de transactions avec leur 'id' d'origine. Retourne une
+    liste de (doc_id, données) ; plusieurs parties si le mois dépasse
+    max_bytes une fois empaqueté, ou si les tableaux totalisent plus de
+    max_index_entries valeurs indexées (débordement sur bucket_<mois>_1, _2...).
+    """
+    fields = sorted({key for entry in entries for key in entry if key != "id"})
+    # Une valeur par champ + l'id pour chaque transaction, plus les entrées
+    # fixes du bucket (champs, sous-champs de columns).
+    max_rows = max(1, (max_index_entries - 2 * (len(fields) + 8)) // (len(fields) + 1))
+    buckets = []
+
+    def _new_bucket():
+        return {"ids": [], "columns": {field: [] for field in fields}}
+
+    current = _new_bucket()
+    current_size = estimate_value_size({field: [] for field in fields})
+
+    for entry in entries:
+        row_size = estimate_value_size(entry.get("id", "")) + sum(
+            estimate_value_size(entry.get(field)) for field in fields
+        )
+        if current["ids"] and (current_size + row_size > max_bytes or len(current["ids"]) >= max_rows):
+            buckets.append(current)
+            current = _new_bucket()
+            current_size = estimate_value_size({field: [] for field in fields})
+        current["ids"].append(entry.get("id"))
+        for field in fields:
+            current["columns"][field].append(entry.get(field))
+        current_size += row_size
+
+    if current["ids"]:
+        buckets.append(current)
+
+    packed = []
+    for part, bucket in enumerate(buckets):
+        timestamps = [ts for ts in bucket["columns"].get("server_timestamp", []) if ts is not None]
+        packed.append((bucket_doc_id(month, part), {
+            BUCKET_MARKER: True,
+            "month": month,
+            "part": part,
+            "count": len(bucket["ids"]),
+            "ids": bucket["ids"],
+            "columns": bucket["columns"],
+            # Le bucket reste visible par la requête triée de get_entries.
+            "server_timestamp": max(timestamps) if timestamps else None,
+        }))
+    return packed
+
+
+def expand_bucket(data):
+    """Redéplie un bucket en transactions ordinaires (avec leur id d'origine).
+    Un champ absent de la transaction d'origine (None) n'est pas recréé."""
+    columns = data.get("columns", {})
+    entries = []
+    for position, entry_id in enumerate(data.get("ids", [])):
+        entry = {
+            field: values[position]
+            for field, values in columns.items()
+            if position < len(values) and values[position] is not None
+        }
+        entry["id"] = entry_id
+        entries.append(entry)
+    return entries
+
+
+def expand_entries(docs):
+    """Liste de documents bruts (dicts avec 'id') -> transactions, buckets dépliés.
+
+    Si une compaction a été interrompue entre l'écriture du bucket et la
+    suppression des originaux, une même transaction existe sous les deux
+    formes : le document individuel l'emporte, la copie du bucket est ignorée.
+    """
+    if not any(is_bucket(doc) for doc in docs):
+        return docs
+
+    individual_ids = {doc.get("id") for doc in docs if not is_bucket(doc)}
+    entries = []
+    for doc in docs:
+        if is_bucket(doc):
+            entries.extend(
+                entry for entry in expand_bucket(doc)
+                if entry["id"] not in individual_ids
+            )
+        else:
+            entries.append(doc)
+    return entries
@@ -0,0 +1,474 @@
+"""Cache partagé à plusieurs niveaux pour les calculs coûteux (taux de change,
+prévisions Prophet), en remplacement de st.cache_data qui ne vit que dans
+un processus : derrière un répartiteur de charge, chaque réplique refaisait
+les mêmes appels API et les mêmes ajustements Prophet.
+
+Niveaux, du plus rapide au plus partagé :
+- mémoire : LRU du processus (MEMORY_MAX_ENTRIES entrées) ;
+- disque : base SQLite locale ($PROBUDGET_CACHE_DIR, défaut .cache/ ; vide
+  pour désactiver), partagée par les répliques d'une même machine, bornée
+  à $PROBUDGET_CACHE_DISK_MAX_MB Mo (entrées les moins récemment lues
+  évincées) ;
+- Redis (optionnel) : $PROBUDGET_REDIS_URL, partagé par toutes les
+  répliques. "local://" le remplace par un équivalent en mémoire
+  (LocalRedisStandIn) pour le développement et les tests ; sans le paquet
+  redis installé, ce niveau est simplement ignoré.
+
+Chaque entrée a une durée de vie (TTL). Une valeur trouvée dans un niveau
+lent est recopiée dans les niveaux plus rapides. Anti-emballement : un seul
+calcul à la fois par clé dans le processus (single-flight), et entre
+répliques via un verrou Redis (SET NX) quand ce niveau est présent.
+
+Hits par niveau, calculs et appels coalescés sont comptés (export
+Prometheus et panneau d'administration).
+
+Les valeurs mises en cache doivent être sérialisables (pickle) et ne pas
+être modifiées par l'appelant : le niveau mémoire renvoie l'objet lui-même.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from instrumentation import register_counter
+
+CACHE_DIR_ENV = "PROBUDGET_CACHE_DIR"
+CACHE_DISK_MAX_MB_ENV = "PROBUDGET_CACHE_DISK_MAX_MB"
+REDIS_URL_ENV = "PROBUDGET_REDIS_URL"
+DEFAULT_CACHE_DIR = ".cache"
+DEFAULT_DISK_MAX_MB = 64
+MEMORY_MAX_ENTRIES = 256
+# Valeurs plus grosses que ça : gardées en mémoire seulement.
+MAX_SHARED_VALUE_BYTES = 1_000_000
+# Attente maximale d'un calcul mené par une autre réplique avant de calculer soi-même.
+LOCK_WAIT_SECONDS = 30.0
+LOCK_POLL_SECONDS = 0.1
+
+CACHE_EVENTS = Counter()
+register_counter(
+    "probudget_cache_events_total",
+    "Événements du cache partagé (espace:hit_niveau / calcul / coalescé / erreur).",
+    "event", CACHE_EVENTS,
+)
+_events_lock = threading.Lock()
+
+
+def _count(namespace, event):
+    with _events_lock:
+        CACHE_EVENTS[f"{namespace}:{event}"] += 1
+
+
+class MemoryTier:
+    """LRU en mémoire du processus."""
+
+    name = "mémoire"
+
+    def __init__(self, max_entries=MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[1] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item
+
+    def set(self, key, value, expires_at, payload=None):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteTier:
+    """Entrées sérialisées dans une base SQLite locale (mode WAL : plusieurs
+    processus de la même machine peuvent la partager)."""
+
+    name = "disque"
+
+    def __init__(self, path, max_bytes=DEFAULT_DISK_MAX_MB * 1_000_000):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "expires_at REAL NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at, payload=None):
+        payload = payload if payload is not None else pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, size, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, expires_at, len(payload), time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        """Supprime les entrées expirées, puis les moins récemment lues
+        jusqu'à repasser sous 90 % de max_bytes."""
+        self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed_at").fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+
+class LocalRedisStandIn:
+    """Équivalent en mémoire du sous-ensemble de l'API redis-py utilisé ici
+    (get, set avec ex/nx, delete, incr, expire), pour développer et tester
+    sans serveur."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            item = self._data.get(name)
+            if item is None:
+                return None
+            if item[1] is not None and item[1] < time.time():
+                del self._data[name]
+                return None
+            return item[0]
+
+    def set(self, name, value, ex=None, nx=False):
+        with self._lock:
+            current = self._data.get(name)
+            alive = current is not None and (current[1] is None or current[1] >= time.time())
+            if nx and alive:
+                return None
+            self._data[name] = (value, time.time() + ex if ex else None)
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+    def incr(self, name):
+        with self._lock:
+            value, expires_at = self._data.get(name, (0, None))
+            if expires_at is not None and expires_at < time.time():
+                value, expires_at = 0, None
+            self._data[name] = (int(value) + 1, expires_at)
+            return int(value) + 1
+
+    def expire(self, name, seconds):
+        with self._lock:
+            if name not in self._data:
+                return False
+            self._data[name] = (self._data[name][0], time.time() + seconds)
+            return True
+
+
+class RedisTier:
+    """Niveau partagé entre répliques, sur un client compatible redis-py."""
+
+    name = "redis"
+
+    def __init__(self, client, prefix="probudget:cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        value, expires_at = pickle.loads(raw)
+        return value, expires_at
+
+    def set(self, key, value, expires_at, payload=None):
+        ttl = max(1, int(expires_at - time.time()))
+        self.client.set(self.prefix + key, pickle.dumps((value, expires_at), protocol=pickle.HIGHEST_PROTOCOL), ex=ttl)
+
+    def acquire(self, key, token, ttl):
+        return bool(self.client.set(self.prefix + "lock:" + key, token, ex=max(1, int(ttl)), nx=True))
+
+    def release(self, key, token):
+        lock_key = self.prefix + "lock:" + key
+        current = self.client.get(lock_key)
+        if current is not None and (current == token or current == token.encode()):
+            self.client.delete(lock_key)
+
+    def clear(self):
+        pass
+
+
+class _Flight:
+    __slots__ = ("event", "value", "ok")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.ok = False
+
+
+class TieredCache:
+    """Lecture à travers les niveaux, calcul unique par clé en cas d'absence."""
+
+    def __init__(self, tiers):
+        self.tiers = list(tiers)
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    def _lookup(self, namespace, key):
+        for position, tier in enumerate(self.tiers):
+            try:
+                item = tier.get(key)
+            except Exception:
+                _count(namespace, f"erreur_{tier.name}")
+                continue
+            if item is not None:
+                _count(namespace, f"hit_{tier.name}")
+                value, expires_at = item
+                # Recopie dans les niveaux plus rapides.
+                for faster in self.tiers[:position]:
+                    self._store(namespace, faster, key, value, expires_at)
+                return True, value
+        return False, None
+
+    def _store(self, namespace, tier, key, value, expires_at, payload=None):
+        try:
+            if not isinstance(tier, MemoryTier):
+                payload = payload if payload is not None else pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                if len(payload) > MAX_SHARED_VALUE_BYTES:
+                    return
+            tier.set(key, value, expires_at, payload)
+        except Exception:
+            _count(namespace, f"erreur_{tier.name}")
+
+    def _redis(self):
+        return next((tier for tier in self.tiers if isinstance(tier, RedisTier)), None)
+
+    def get_or_compute(self, namespace, key, compute, ttl, cache_if=None):
+        """Valeur en cache pour key, sinon compute() (une seule fois à la fois
+        par clé), stockée ttl secondes dans tous les niveaux.
+
+        cache_if : prédicat sur la valeur calculée ; si faux, la valeur est
+        retournée sans être stockée (échec passager à ne pas resservir)."""
+        found, value = self._lookup(namespace, key)
+        if found:
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.event.wait(LOCK_WAIT_SECONDS)
+            if flight.ok:
+                _count(namespace, "coalescé")
+                return flight.value
+            return compute()
+
+        try:
+            value = self._compute_once_across_replicas(namespace, key, compute, ttl, cache_if)
+            flight.value, flight.ok = value, True
+            return value
+        finally:
+            flight.event.set()
+            with self._flights_lock:
+                self._flights.pop(key, None)
+
+    def _compute_once_across_replicas(self, namespace, key, compute, ttl, cache_if=None):
+        redis_tier = self._redis()
+        token = f"{os.getpid()}:{threading.get_ident()}:{time.time()}"
+        locked = False
+        if redis_tier is not None:
+            try:
+                locked = redis_tier.acquire(key, token, LOCK_WAIT_SECONDS)
+                if not locked:
+                    # Une autre réplique calcule : on attend son résultat.
+                    deadline = time.monotonic() + LOCK_WAIT_SECONDS
+                    while time.monotonic() < deadline:
+                        time.sleep(LOCK_POLL_SECONDS)
+                        item = redis_tier.get(key)
+                        if item is not None:
+                            _count(namespace, "coalescé")
+                            for tier in self.tiers:
+                                if tier is not redis_tier:
+                                    self._store(namespace, tier, key, item[0], item[1])
+                            return item[0]
+            except Exception:
+                _count(namespace, "erreur_redis")
+
+        try:
+            _count(namespace, "calcul")
+            value = compute()
+            if cache_if is not None and not cache_if(value):
+                _count(namespace, "non_conservé")
+                return value
+            expires_at = time.time() + ttl
+            payload = None
+            for tier in self.tiers:
+                if not isinstance(tier, MemoryTier) and payload is None:
+                    try:
+                        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                    except Exception:
+                        _count(namespace, "erreur_sérialisation")
+                        break
+                self._store(namespace, tier, key, value, expires_at, payload)
+            return value
+        finally:
+            if locked:
+                try:
+                    redis_tier.release(key, token)
+                except Exception:
+                    pass
+
+    def clear(self):
+        for tier in self.tiers:
+            try:
+                tier.clear()
+            except Exception:
+                pass
+
+
+def _key_material(value):
+    """Octets identifiant un argument : contenu haché pour les objets pandas
+    (leur pickle n'est pas stable), pickle pour le reste. pandas n'est pas
+    importé ici : si le module n'est pas chargé, value n'en est pas un objet."""
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, (pd.Series, pd.DataFrame)):
+        return b"pd" + pickle.dumps((
+            type(value).__name__, getattr(value, "name", None), str(value.index.dtype),
+            pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes(),
+        ))
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def make_key(namespace, args, kwargs):
+    digest = hashlib.sha256()
+    for value in args:
+        digest.update(_key_material(value))
+    for name in sorted(kwargs):
+        digest.update(name.encode())
+        digest.update(_key_material(kwargs[name]))
+    return f"{namespace}:{digest.hexdigest()}"
+
+
+def _build_tiers():
+    tiers = [MemoryTier()]
+    cache_dir = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+    if cache_dir:
+        try:
+            max_mb = float(os.environ.get(CACHE_DISK_MAX_MB_ENV, DEFAULT_DISK_MAX_MB))
+            tiers.append(SQLiteTier(os.path.join(cache_dir, "probudget_cache.sqlite"), int(max_mb * 1_000_000)))
+        except (OSError, sqlite3.Error, ValueError):
+            pass
+    redis_url = os.environ.get(REDIS_URL_ENV)
+    if redis_url == "local://":
+        tiers.append(RedisTier(LocalRedisStandIn()))
+    elif redis_url:
+        try:
+            import redis
+            tiers.append(RedisTier(redis.Redis.from_url(redis_url)))
+        except Exception:
+            pass
+    return tiers
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Cache du processus, construit au premier appel depuis l'environnement."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = TieredCache(_build_tiers())
+        return _shared_cache
+
+
+def shared_redis_client():
+    """Client Redis du cache partagé (réutilisé par throttle.py), ou None."""
+    tier = get_cache()._redis()
+    return tier.client if tier is not None else None
+
+
+def set_cache(cache):
+    """Remplace le cache du processus (tests, configuration explicite)."""
+    global _shared_cache
+    with _shared_cache_lock:
+        _shared_cache = cache
+
+
+def cached(namespace, ttl, cache_if=None):
+    """Décorateur : résultat de la fonction mis en cache ttl secondes, clé =
+    namespace + contenu des arguments. cache_if : voir get_or_compute."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(namespace, args, kwargs)
+            return get_cache().get_or_compute(namespace, key, lambda: func(*args, **kwargs), ttl, cache_if)
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Une ligne par espace de cache, pour l'affichage admin."""
+    with _events_lock:
+        events = dict(CACHE_EVENTS)
+    rows = {}
+    for label, count in events.items():
+        namespace, event = label.split(":", 1)
+        rows.setdefault(namespace, Counter())[event] += count
+    result = []
+    for namespace, counts in sorted(rows.items()):
+        hits = sum(v for k, v in counts.items() if k.startswith("hit_")) + counts["coalescé"]
+        lookups = hits + counts["calcul"]
+        result.append({
+            "espace": namespace,
+            "hits mémoire": counts["hit_mémoire"],
+            "hits disque": counts["hit_disque"],
+            "hits redis": counts["hit_redis"],
+            "coalescés": counts["coalescé"],
+            "calculs": counts["calcul"],
+            "taux de hit (%)": round(hits / lookups * 100, 1) if lookups else 0.0,
+        })
+    return result
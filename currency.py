@@ -1,5 +1,5 @@
-import streamlit as st
 import requests
+from cache import cached
 
 # Symbole d'affichage par devise de référence supportée (XOF en tête : c'est
 # la devise par défaut pour le public cible Mali / Afrique de l'Ouest).
@@ -43,13 +43,14 @@ def format_amount(amount, currency="XOF"):
     symbol = CURRENCY_SYMBOLS.get(currency, currency)
     return f"{amount:,.2f} {symbol}"
 
-@st.cache_data(ttl=3600)
+@cached("fx", ttl=3600)
 def get_exchange_rate_with_source(from_currency, to_currency="XOF"):
     """
     Récupère le taux de change en direct depuis une API gratuite, avec sa
     source ("api" ou "fallback") : sert à tracer, sur chaque transaction,
     si le taux vient réellement de l'API ou de la table de secours.
     Si l'API est indisponible ou corrompue, utilise des taux de secours.
+    Mis en cache une heure, partagé entre répliques (cache.py).
     """
     if from_currency == to_currency:
         # Conversion identité (même devise) : ni appel API ni valeur de
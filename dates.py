@@ -0,0 +1,81 @@
+"""Stockage typé des dates dans Firestore et conversion rapide au chargement.
+
+Les transactions sont écrites avec de vrais horodatages Firestore (datetime
+UTC, que le SDK convertit en Timestamp natif) plutôt qu'en chaînes ISO :
+Firestore les renvoie alors déjà sous forme de datetime, et le chargement
+n'a plus aucune chaîne à analyser. Les documents hérités (chaînes
+"YYYY-MM-DD" ou horodatages ISO complets, mélangés) restent lisibles, via un
+parseur ISO 8601 explicite plutôt que l'inférence de format de pandas.
+"""
+from datetime import date, datetime, timezone
+
+import pandas as pd
+
+# Champs date des transactions concernés par le stockage typé.
+ENTRY_DATE_FIELDS = ("date", "created_at", "exchange_rate_date")
+
+
+def to_firestore_datetime(value):
+    """Valeur à écrire dans Firestore pour une date/heure.
+
+    Une date calendaire (date_input) devient minuit UTC de ce jour : ramené
+    en heure naïve au chargement, on retrouve exactement le même jour quel
+    que soit le fuseau du serveur. Un datetime naïf est considéré comme UTC.
+    """
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    raise TypeError(f"Date attendue, reçu {type(value).__name__}")
+
+
+def parse_legacy_date(value):
+    """Convertit une date héritée (chaîne ISO, epoch en secondes, date ou
+    datetime) en datetime UTC. None si la valeur n'est pas interprétable."""
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return to_firestore_datetime(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    if isinstance(value, str):
+        try:
+            return to_firestore_datetime(datetime.fromisoformat(value.strip()))
+        except ValueError:
+            return None
+    return None
+
+
+def to_naive_datetime_series(series):
+    """Convertit une colonne de dates Firestore en datetime64 naïf (UTC).
+
+    Chemin rapide : une colonne issue uniquement de Timestamps Firestore est
+    déjà typée datetime64 par pandas, il suffit de retirer le fuseau. Les
+    colonnes mixtes sont découpées par type : datetimes convertis sans
+    analyse de chaîne, epochs numériques convertis directement, et seules les
+    chaînes héritées passent par le parseur ISO 8601 (format explicite, sans
+    inférence ligne par ligne).
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series.dt.tz_convert(None) if series.dt.tz is not None else series
+    if isinstance(series.dtype, pd.StringDtype):
+        # Colonne entièrement héritée (que des chaînes) : un seul appel vectorisé.
+        return pd.to_datetime(series, format="ISO8601", utc=True, errors="coerce").dt.tz_convert(None)
+
+    result = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
+
+    is_datetime = series.map(lambda v: isinstance(v, (date, datetime)))
+    is_number = series.map(
+        lambda v: isinstance(v, (int, float)) and not isinstance(v, bool) and v == v
+    )
+    is_string = series.map(lambda v: isinstance(v, str))
+
+    if is_datetime.any():
+        result[is_datetime] = pd.to_datetime(series[is_datetime], utc=True).dt.tz_convert(None)
+    if is_number.any():
+        result[is_number] = pd.to_datetime(series[is_number].astype("float64"), unit="s", utc=True).dt.tz_convert(None)
+    if is_string.any():
+        result[is_string] = pd.to_datetime(
+            series[is_string], format="ISO8601", utc=True, errors="coerce"
+        ).dt.tz_convert(None)
+    return result
@@ -0,0 +1,260 @@
+"""Graphe des vues dérivées du tableau de bord (DataFrame préparé, agrégat
+mensuel, carte budget, graphiques, prévision, alerte, exports...).
+
+Chaque nœud n'est recalculé que si la version d'un de ses nœuds amont (ou
+un de ses paramètres, ex. la devise) a changé depuis son dernier calcul ;
+sinon sa valeur précédente est réutilisée telle quelle, sans hacher de gros
+DataFrames comme le fait st.cache_data. La source "entries" est versionnée
+par data_version (nombre de transactions + dernier server_timestamp).
+
+Un graphe par session (get_session_graph), vidé à la déconnexion avec le
+reste de st.session_state. Temps de calcul, hits et raison du dernier
+recalcul de chaque nœud sont affichés dans le panneau d'administration.
+
+Budget mémoire du processus : la taille de chaque valeur est estimée une
+fois, à son calcul. Quand le total de toutes les sessions dépasse
+$PROBUDGET_MEMORY_BUDGET_MB (défaut DEFAULT_MEMORY_BUDGET_MB), les graphes
+des sessions inactives depuis au moins IDLE_SECONDS_BEFORE_EVICTION sont
+vidés, de la moins récemment utilisée à la plus récente ; ils seront
+recalculés au prochain rerun de leur session.
+"""
+import os
+import sys
+import threading
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+SESSION_KEY = "derived_graph"
+MEMORY_BUDGET_ENV = "PROBUDGET_MEMORY_BUDGET_MB"
+DEFAULT_MEMORY_BUDGET_MB = 1024
+IDLE_SECONDS_BEFORE_EVICTION = 120
+# Taille d'une liste de documents estimée sur un échantillon.
+SIZE_SAMPLE = 100
+
+
+def data_version(entries):
+    """Version peu coûteuse des transactions d'un utilisateur : nombre
+    d'entrées et plus récent server_timestamp (toute écriture via add_entry
+    en pose un nouveau)."""
+    latest = None
+    for entry in entries:
+        ts = entry.get('server_timestamp')
+        if ts is not None and hasattr(ts, 'timestamp') and (latest is None or ts > latest):
+            latest = ts
+    return (len(entries), latest.isoformat() if latest is not None else None)
+
+
+def estimate_nbytes(value, depth=0):
+    """Taille mémoire approximative d'une valeur de nœud (DataFrame, tuple,
+    liste de documents, octets exportés, figure...)."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True, index=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if depth >= 3:
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v, depth + 1) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        if len(value) > SIZE_SAMPLE:
+            sample = value[:SIZE_SAMPLE]
+            return sys.getsizeof(value) + sum(estimate_nbytes(v, depth + 1) for v in sample) * len(value) // SIZE_SAMPLE
+        return sys.getsizeof(value) + sum(estimate_nbytes(v, depth + 1) for v in value)
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + estimate_nbytes(vars(value), depth + 1)
+    return sys.getsizeof(value)
+
+
+class _Node:
+    __slots__ = ("value", "key", "version", "hits", "misses", "last_duration", "last_reason", "nbytes")
+
+    def __init__(self):
+        self.nbytes = 0
+        self.value = None
+        self.key = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.last_duration = 0.0
+        self.last_reason = ""
+
+
+class DerivedGraph:
+    """Nœuds nommés, recalculés uniquement quand leur clé (versions amont +
+    paramètres) change."""
+
+    def __init__(self):
+        self._nodes = {}
+        self.last_used = time.monotonic()
+        self.evictions = 0
+
+    def _node(self, name):
+        node = self._nodes.get(name)
+        if node is None:
+            node = self._nodes[name] = _Node()
+        return node
+
+    def version(self, name):
+        node = self._nodes.get(name)
+        return node.version if node is not None else None
+
+    def value(self, name):
+        return self._nodes[name].value
+
+    def set_source(self, name, value, version):
+        """Déclare une donnée source (ex. transactions Firestore) et sa version.
+        Les nœuds aval ne sont invalidés que si la version change."""
+        node = self._node(name)
+        if node.key == version:
+            node.hits += 1
+            node.last_reason = "inchangée"
+            return
+        node.last_reason = "première lecture" if node.key is None else f"nouvelle version {version}"
+        node.misses += 1
+        node.key = version
+        node.value = value
+        node.nbytes = estimate_nbytes(value)
+        node.version += 1
+
+    def compute(self, name, func, deps=(), params=()):
+        """Valeur du nœud name = func(*valeurs des deps), recalculée seulement
+        si la version d'une dépendance ou un paramètre a changé."""
+        key = (tuple(self.version(dep) for dep in deps), tuple(params))
+        node = self._node(name)
+        if node.key == key:
+            node.hits += 1
+            node.last_reason = "à jour"
+            return node.value
+
+        if node.key is None:
+            reason = "premier calcul"
+        else:
+            changed = [dep for dep, old, new in zip(deps, node.key[0], key[0]) if old != new]
+            reason = f"amont modifié : {', '.join(changed)}" if changed else "paramètres modifiés"
+
+        start = time.perf_counter()
+        value = func(*(self.value(dep) for dep in deps))
+        node.last_duration = time.perf_counter() - start
+        node.value = value
+        node.nbytes = estimate_nbytes(value)
+        node.key = key
+        node.version += 1
+        node.misses += 1
+        node.last_reason = reason
+        return value
+
+    def memory_bytes(self):
+        return sum(node.nbytes for node in list(self._nodes.values()))
+
+    def evict(self):
+        """Vide toutes les valeurs : chaque nœud sera recalculé au prochain
+        rerun de la session (les versions repartent de zéro)."""
+        self._nodes = {}
+        self.evictions += 1
+
+    def stats(self):
+        """Une ligne par nœud, pour l'affichage admin."""
+        return [
+            {
+                "nœud": name,
+                "version": node.version,
+                "hits": node.hits,
+                "recalculs": node.misses,
+                "dernier calcul (ms)": round(node.last_duration * 1000, 1),
+                "mémoire (Ko)": round(node.nbytes / 1024, 1),
+                "dernier rerun": node.last_reason,
+            }
+            for name, node in self._nodes.items()
+        ]
+
+
+# Graphes de toutes les sessions du processus (références faibles : un
+# graphe disparaît du registre avec le session_state de sa session).
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def memory_budget_bytes():
+    try:
+        return int(float(os.environ.get(MEMORY_BUDGET_ENV, DEFAULT_MEMORY_BUDGET_MB)) * 1024 * 1024)
+    except ValueError:
+        return DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024
+
+
+def _live_graphs():
+    with _registry_lock:
+        live = [(session_id, ref()) for session_id, ref in _registry.items()]
+        for session_id, graph in live:
+            if graph is None:
+                del _registry[session_id]
+    return [(session_id, graph) for session_id, graph in live if graph is not None]
+
+
+def register_graph(session_id, graph):
+    with _registry_lock:
+        _registry[session_id] = weakref.ref(graph)
+
+
+def enforce_memory_budget(budget=None, current=None):
+    """Vide les graphes des sessions inactives, les moins récemment
+    utilisés d'abord, jusqu'à repasser sous le budget. Le graphe current (la
+    session en cours) n'est jamais vidé. Retourne le nombre de graphes vidés."""
+    budget = memory_budget_bytes() if budget is None else budget
+    graphs = _live_graphs()
+    total = sum(graph.memory_bytes() for _, graph in graphs)
+    if total <= budget:
+        return 0
+    now = time.monotonic()
+    evicted = 0
+    for _, graph in sorted(graphs, key=lambda item: item[1].last_used):
+        if total <= budget:
+            break
+        if graph is current or now - graph.last_used < IDLE_SECONDS_BEFORE_EVICTION:
+            continue
+        size = graph.memory_bytes()
+        if size:
+            graph.evict()
+            total -= size
+            evicted += 1
+    return evicted
+
+
+def memory_stats(current=None):
+    """Une ligne par session du processus, pour l'affichage admin."""
+    now = time.monotonic()
+    return [
+        {
+            "session": str(session_id)[:8] + (" (courante)" if graph is current else ""),
+            "mémoire (Mo)": round(graph.memory_bytes() / 1024 / 1024, 2),
+            "inactive depuis (s)": int(now - graph.last_used),
+            "vidages": graph.evictions,
+        }
+        for session_id, graph in sorted(_live_graphs(), key=lambda item: -item[1].last_used)
+    ]
+
+
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def get_session_graph():
+    """Graphe des vues dérivées de la session courante, enregistré auprès du
+    budget mémoire du processus."""
+    if SESSION_KEY not in st.session_state:
+        st.session_state[SESSION_KEY] = DerivedGraph()
+    graph = st.session_state[SESSION_KEY]
+    graph.last_used = time.monotonic()
+    register_graph(_session_id() or id(graph), graph)
+    enforce_memory_budget(current=graph)
+    return graph
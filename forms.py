@@ -1,16 +1,23 @@
 import streamlit as st
-from datetime import date, datetime
-import pytesseract
-from PIL import Image
+from datetime import date, datetime, timezone
 import re
 import os
 # IMPORTATION DU MODULE QUE TU AS CRÉÉ
 from currency import get_exchange_rate_with_source
+from dates import to_firestore_datetime
 
 # Gestion automatique du chemin Tesseract (Local Windows vs Serveur Linux)
 windows_tesseract_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-if os.path.exists(windows_tesseract_path):
-    pytesseract.pytesseract.tesseract_cmd = windows_tesseract_path
+
+
+def _load_ocr():
+    """pytesseract et PIL, importés à la première lecture de ticket plutôt
+    qu'au démarrage de l'app (imports coûteux, inutiles sans justificatif)."""
+    import pytesseract
+    from PIL import Image
+    if os.path.exists(windows_tesseract_path):
+        pytesseract.pytesseract.tesseract_cmd = windows_tesseract_path
+    return pytesseract, Image
 
 # Taille max du texte OCR brut conservé en base, pour éviter de gonfler
 # Firestore avec des tickets entiers à chaque transaction.
@@ -142,6 +149,7 @@ def entry_form(base_currency="XOF"):
     if uploaded_file is not None:
         with st.spinner("🔍 Lecture du ticket..."):
             try:
+                pytesseract, Image = _load_ocr()
                 image = Image.open(uploaded_file)
                 extracted_text = pytesseract.image_to_string(image, lang='fra+eng')
                 texte_brut_ticket = extracted_text
@@ -191,6 +199,9 @@ def entry_form(base_currency="XOF"):
             else:
                 texte_stocke = texte_brut_ticket[:MAX_OCR_TEXT_LENGTH]
 
+            # Dates écrites en horodatages Firestore natifs (pas en chaînes ISO) :
+            # prepare_data les récupère sans aucune analyse de chaîne.
+            now_utc = datetime.now(timezone.utc)
             return {
                 "type": type_entry,
                 "amount_original": montant_saisi,
@@ -199,12 +210,12 @@ def entry_form(base_currency="XOF"):
                 "currency_pivot": base_currency,
                 "exchange_rate": taux,
                 "exchange_rate_source": taux_source,
-                "exchange_rate_date": datetime.now().isoformat(),
+                "exchange_rate_date": now_utc,
                 "category": categorie,
-                "date": date_entry.isoformat(),
+                "date": to_firestore_datetime(date_entry),
                 "description": description,
                 "justificatif_name": file_name,
                 "justificatif_raw_text": texte_stocke,
-                "created_at": date.today().isoformat()
+                "created_at": now_utc
             }
     return None
\ No newline at end of file
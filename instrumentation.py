@@ -0,0 +1,219 @@
+"""Instrumentation des appels Firestore : nombre d'appels, documents et octets
+lus/écrits, histogrammes de latence, par méthode de DBClient, page affichée
+et rôle de l'utilisateur.
+
+Les compteurs sont globaux au processus (toutes sessions confondues) et
+thread-safe. La page et le rôle sont posés par app.py au début de chaque
+rerun (set_render_context) : chaque session Streamlit exécute son script dans
+son propre thread, d'où un contexte par thread.
+
+Consultables dans le panneau d'administration (rôle "admin") et exportables
+au format texte Prometheus (to_prometheus_text / export_prometheus).
+"""
+import functools
+import os
+import threading
+import time
+
+# Bornes supérieures (secondes) des tranches de l'histogramme de latence.
+LATENCY_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Fichier d'export Prometheus (collecteur "textfile" de node_exporter, par
+# exemple). Export automatique désactivé si la variable n'est pas définie.
+METRICS_FILE_ENV = "PROBUDGET_METRICS_FILE"
+METRICS_EXPORT_INTERVAL_SECONDS = 15
+
+_lock = threading.Lock()
+_operations = {}
+_extra_counters = []
+_context = threading.local()
+_last_export = 0.0
+
+
+class _OperationStats:
+    __slots__ = ("calls", "errors", "docs_read", "docs_written", "bytes_read",
+                 "bytes_written", "latency_sum", "latency_buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.docs_read = 0
+        self.docs_written = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS_SECONDS)
+
+
+def set_render_context(page=None, role=None):
+    """Étiquettes (page, rôle) appliquées aux appels Firestore du thread courant."""
+    _context.page = page or "inconnue"
+    _context.role = role or "anonyme"
+
+
+def get_render_context():
+    return getattr(_context, "page", "inconnue"), getattr(_context, "role", "anonyme")
+
+
+def register_counter(name, help_text, label, counter):
+    """Ajoute à l'export Prometheus un compteur existant (dict label -> valeur)
+    tenu par un autre module, ex. GET_ENTRIES_PATH_COUNTS."""
+    _extra_counters.append((name, help_text, label, counter))
+
+
+def record_reads(docs, nbytes=0):
+    """À appeler dans une méthode instrumentée : documents (facturés) lus."""
+    current = getattr(_context, "current", None)
+    if current is not None:
+        current["docs_read"] += docs
+        current["bytes_read"] += nbytes
+
+
+def record_writes(docs, nbytes=0):
+    """À appeler dans une méthode instrumentée : documents écrits/supprimés."""
+    current = getattr(_context, "current", None)
+    if current is not None:
+        current["docs_written"] += docs
+        current["bytes_written"] += nbytes
+
+
+def instrumented(method):
+    """Décorateur des méthodes de DBClient : compte l'appel, sa latence, et
+    les lectures/écritures déclarées via record_reads/record_writes."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_context, "current", None)
+        current = {"docs_read": 0, "docs_written": 0, "bytes_read": 0, "bytes_written": 0}
+        _context.current = current
+        failed = False
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _context.current = outer
+            page, role = get_render_context()
+            _record(method.__name__, page, role, elapsed, current, failed)
+    return wrapper
+
+
+def _record(method_name, page, role, elapsed, counts, failed):
+    with _lock:
+        stats = _operations.get((method_name, page, role))
+        if stats is None:
+            stats = _operations[(method_name, page, role)] = _OperationStats()
+        stats.calls += 1
+        stats.errors += int(failed)
+        stats.docs_read += counts["docs_read"]
+        stats.docs_written += counts["docs_written"]
+        stats.bytes_read += counts["bytes_read"]
+        stats.bytes_written += counts["bytes_written"]
+        stats.latency_sum += elapsed
+        for i, bound in enumerate(LATENCY_BUCKETS_SECONDS):
+            if elapsed <= bound:
+                stats.latency_buckets[i] += 1
+                break
+
+
+def snapshot():
+    """Une ligne (dict) par (méthode, page, rôle), pour l'affichage admin."""
+    with _lock:
+        items = sorted(_operations.items())
+        rows = []
+        for (method_name, page, role), stats in items:
+            rows.append({
+                "méthode": method_name,
+                "page": page,
+                "rôle": role,
+                "appels": stats.calls,
+                "erreurs": stats.errors,
+                "docs lus": stats.docs_read,
+                "docs écrits": stats.docs_written,
+                "octets lus": stats.bytes_read,
+                "octets écrits": stats.bytes_written,
+                "latence moy. (ms)": round(stats.latency_sum / stats.calls * 1000, 1) if stats.calls else 0.0,
+            })
+        return rows
+
+
+def reset():
+    with _lock:
+        _operations.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus_text():
+    """Toutes les métriques au format d'exposition texte Prometheus."""
+    with _lock:
+        items = sorted(_operations.items())
+        lines = []
+        counters = [
+            ("probudget_firestore_calls_total", "Appels Firestore.", "calls"),
+            ("probudget_firestore_errors_total", "Appels Firestore en erreur.", "errors"),
+            ("probudget_firestore_documents_read_total", "Documents Firestore lus.", "docs_read"),
+            ("probudget_firestore_documents_written_total", "Documents Firestore écrits.", "docs_written"),
+            ("probudget_firestore_read_bytes_total", "Octets lus (estimation).", "bytes_read"),
+            ("probudget_firestore_written_bytes_total", "Octets écrits (estimation).", "bytes_written"),
+        ]
+        for name, help_text, attribute in counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (method_name, page, role), stats in items:
+                labels = f'method="{_escape(method_name)}",page="{_escape(page)}",role="{_escape(role)}"'
+                lines.append(f"{name}{{{labels}}} {getattr(stats, attribute)}")
+
+        name = "probudget_firestore_latency_seconds"
+        lines.append(f"# HELP {name} Latence des appels Firestore.")
+        lines.append(f"# TYPE {name} histogram")
+        for (method_name, page, role), stats in items:
+            labels = f'method="{_escape(method_name)}",page="{_escape(page)}",role="{_escape(role)}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS_SECONDS, stats.latency_buckets):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {stats.calls}')
+            lines.append(f"{name}_sum{{{labels}}} {stats.latency_sum:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {stats.calls}")
+
+    for name, help_text, label, counter in _extra_counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for key, value in sorted(dict(counter).items()):
+            lines.append(f'{name}{{{label}="{_escape(key)}"}} {value}')
+
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path):
+    """Écrit les métriques dans un fichier (écriture atomique : un collecteur
+    ne lit jamais un fichier à moitié écrit)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(to_prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def maybe_export():
+    """Export périodique vers $PROBUDGET_METRICS_FILE, au plus toutes les
+    METRICS_EXPORT_INTERVAL_SECONDS. Sans effet si la variable est absente."""
+    global _last_export
+    path = os.environ.get(METRICS_FILE_ENV)
+    if not path:
+        return
+    now = time.monotonic()
+    if now - _last_export < METRICS_EXPORT_INTERVAL_SECONDS:
+        return
+    _last_export = now
+    try:
+        export_prometheus(path)
+    except OSError:
+        pass
@@ -1,29 +1,99 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px  # Ajout pour un graphique pro du portefeuille
+import plotly.graph_objects as go
 from currency import CURRENCY_SYMBOLS
+from portfolio import get_session_portfolio, initial_snapshots, new_snapshot, snapshot_collection
+from quotes import refresh_user_portfolio
 
 def calculate_roi(initial_value, current_value):
     """Calcule le Retour sur Investissement (ROI)."""
     if initial_value <= 0: return 0
     return ((current_value - initial_value) / initial_value) * 100
 
+def _future_value(principal, monthly_rate, months, monthly_contribution):
+    """Solde après `months` mois, versement en début de mois puis intérêts
+    (annuité due) : P(1+i)^n + c(1+i)((1+i)^n - 1)/i, vectorisé sur months."""
+    months = np.asarray(months, dtype="float64")
+    if monthly_rate == 0:
+        return principal + monthly_contribution * months
+    growth = (1 + monthly_rate) ** months
+    return principal * growth + monthly_contribution * (1 + monthly_rate) * (growth - 1) / monthly_rate
+
 def compound_interest_simulation(principal, annual_rate, years, monthly_contribution, symbol="FCFA"):
-    """Simule la croissance d'un capital avec intérêts composés."""
-    rate = annual_rate / 100
+    """Simule la croissance d'un capital avec intérêts composés (formule
+    fermée, sans boucle mois par mois)."""
+    monthly_rate = annual_rate / 100 / 12
+
+    # On regroupe par année pour que le graphique soit plus lisible
+    months = np.unique(np.r_[1, np.arange(12, years * 12 + 1, 12)]) if years > 0 else np.array([], dtype=int)
+    balances = _future_value(principal, monthly_rate, months, monthly_contribution)
+    return pd.DataFrame({"Année": np.round(months / 12, 1), f"Solde ({symbol})": np.round(balances, 2)})
+
+def contribution_schedule(monthly_contribution, years, annual_increase=0.0):
+    """Versements mensuels sur `years` ans, revalorisés de annual_increase %
+    chaque année (ex. épargne indexée sur le salaire)."""
+    months = np.arange(years * 12)
+    return monthly_contribution * (1 + annual_increase / 100) ** (months // 12)
+
+def monte_carlo_simulation(principal, annual_mean, annual_volatility, years, contributions,
+                           n_paths=2000, percentiles=(10, 50, 90), seed=0):
+    """Projection Monte Carlo du capital : n_paths trajectoires de rendements
+    mensuels log-normaux simulées d'un bloc (coût linéaire en trajectoires ×
+    mois), résumées par percentiles à chaque fin d'année.
+
+    annual_mean, annual_volatility : rendement annuel moyen et volatilité (%).
+    contributions : versement mensuel (scalaire) ou un versement par mois
+    (contribution_schedule). seed fixe : la courbe ne bouge pas d'un rerun
+    à l'autre à paramètres égaux.
+
+    Retourne un DataFrame indexé par année (0 = aujourd'hui), une colonne
+    par percentile (P10, P50, P90...) et les versements cumulés.
+    """
     months = years * 12
-    monthly_rate = rate / 12
+    contributions = np.broadcast_to(np.asarray(contributions, dtype="float64"), (months,))
+
+    sigma = annual_volatility / 100 / np.sqrt(12)
+    # Dérive corrigée de la volatilité : rendement mensuel moyen (espérance)
+    # de annual_mean / 12, comme le taux fixe de compound_interest_simulation.
+    mu = np.log1p(annual_mean / 100 / 12) - sigma ** 2 / 2
+    rng = np.random.default_rng(seed)
+    growth = np.exp(mu + sigma * rng.standard_normal((n_paths, months)))
+
+    # B_t = (B_{t-1} + c_t) G_t  <=>  B_t = C_t (P + somme_{s<=t} c_s G_s / C_s),
+    # C_t = produit des G jusqu'à t : deux cumuls numpy au lieu d'une boucle.
+    cumulative = np.cumprod(growth, axis=1)
+    balances = cumulative * (principal + np.cumsum(contributions * growth / cumulative, axis=1))
 
-    solde_col = f"Solde ({symbol})"
-    data = []
-    balance = principal
-    for month in range(1, months + 1):
-        balance = (balance + monthly_contribution) * (1 + monthly_rate)
-        # On regroupe par année pour que le graphique soit plus lisible
-        if month % 12 == 0 or month == 1:
-            data.append({"Année": round(month / 12, 1), solde_col: round(balance, 2)})
+    yearly = np.hstack([np.full((n_paths, 1), float(principal)), balances[:, 11::12]])
+    bands = np.percentile(yearly, percentiles, axis=0)
+    result = pd.DataFrame(
+        {f"P{p}": band for p, band in zip(percentiles, bands)},
+        index=pd.Index(np.arange(years + 1), name="Année"),
+    )
+    result["Versé"] = principal + np.r_[0, np.cumsum(contributions)[11::12]]
+    return result
 
-    return pd.DataFrame(data)
+def plot_projection(bands, symbol="FCFA"):
+    """Bande P10-P90 et médiane de la projection Monte Carlo."""
+    years = bands.index.to_numpy()
+    fig = go.Figure([
+        go.Scatter(x=years, y=bands["P90"].round(2), mode="lines", line=dict(width=0),
+                   name="P90 (scénario favorable)", showlegend=False),
+        go.Scatter(x=years, y=bands["P10"].round(2), mode="lines", line=dict(width=0), fill="tonexty",
+                   fillcolor="rgba(52, 152, 219, 0.25)", name="P10 (scénario défavorable)", showlegend=False),
+        go.Scatter(x=years, y=bands["P50"].round(2), mode="lines", line=dict(color="#3498db", width=3),
+                   name="Médiane (P50)"),
+        go.Scatter(x=years, y=bands["Versé"].round(2), mode="lines", line=dict(color="#7f8c8d", dash="dot"),
+                   name="Total versé"),
+    ])
+    fig.update_layout(
+        title="Projection de ta Richesse (P10 – P50 – P90)",
+        xaxis_title="Année", yaxis_title=f"Solde ({symbol})",
+        hovermode="x unified", plot_bgcolor="white",
+    )
+    return fig
 
 def investment_dashboard(db, uid, base_currency="XOF"):
     """Interface pour gérer les investissements."""
@@ -39,6 +109,10 @@ def investment_dashboard(db, uid, base_currency="XOF"):
             asset_type = st.selectbox("Type", ["Action", "Crypto", "Or", "Immobilier", "Autre"])
             initial_cost = st.number_input(f"Coût d'achat total ({symbol})", min_value=0.0, step=10.0)
             current_val = st.number_input(f"Valeur actuelle ({symbol})", min_value=0.0, step=10.0)
+            # Facultatif : un actif coté voit sa valeur actualisée d'après son cours.
+            tc1, tc2 = st.columns(2)
+            ticker = tc1.text_input("Symbole coté (optionnel, ex: AAPL, BTC-USD)")
+            quantity = tc2.number_input("Quantité détenue", min_value=0.0, step=1.0, format="%.6f")
 
             if st.form_submit_button("Ajouter au portefeuille", use_container_width=True):
                 if asset_name: # Sécurité : vérifier que le nom n'est pas vide
@@ -49,8 +123,14 @@ def investment_dashboard(db, uid, base_currency="XOF"):
                         "current_value": current_val,
                         "roi": calculate_roi(initial_cost, current_val)
                     }
+                    if ticker.strip() and quantity > 0:
+                        new_inv["ticker"] = ticker.strip().upper()
+                        new_inv["quantity"] = quantity
                     collection_name = f"investments_{uid}"
-                    if db.add_entry(collection_name, new_inv):
+                    asset_id = db.add_entry(collection_name, new_inv)
+                    if asset_id:
+                        # Premier relevé de l'actif : le coût d'achat est son apport initial.
+                        db.add_entry(snapshot_collection(uid), new_snapshot(asset_id, current_val, initial_cost))
                         st.success(f"🎯 {asset_name} ajouté avec succès !")
                         st.rerun()
                 else:
@@ -60,31 +140,53 @@ def investment_dashboard(db, uid, base_currency="XOF"):
         st.markdown("### 🔮 Simulateur d'Intérêts Composés")
         p = st.number_input(f"Capital initial ({symbol})", value=1000, step=100)
         r = st.slider("Taux d'intérêt annuel estimé (%)", 1, 20, 8)
+        vol = st.slider("Volatilité annuelle estimée (%)", 0, 40, 15,
+                        help="0 % : projection déterministe (taux fixe). Au-delà, 2 000 scénarios de marché simulés.")
         y = st.slider("Nombre d'années de projection", 1, 40, 10)
         m = st.number_input(f"Épargne mensuelle ajoutée ({symbol})", value=100, step=10)
+        hausse = st.slider("Hausse annuelle de l'épargne mensuelle (%)", 0, 10, 0)
 
-        df_sim = compound_interest_simulation(p, r, y, m, symbol)
-        solde_col = f"Solde ({symbol})"
-        final_val = df_sim[solde_col].iloc[-1]
-        total_invested = p + (m * y * 12)
+        contributions = contribution_schedule(m, y, hausse)
+        total_invested = p + contributions.sum()
+        if vol == 0 and hausse == 0:
+            df_sim = compound_interest_simulation(p, r, y, m, symbol)
+            final_val = df_sim[f"Solde ({symbol})"].iloc[-1]
+        else:
+            bands = monte_carlo_simulation(p, r, vol, y, contributions)
+            final_val = bands["P50"].iloc[-1]
         total_gain = final_val - total_invested
 
         # Affichage élégant des résultats du simulateur
         sc1, sc2 = st.columns(2)
         with sc1:
-            st.metric("Valeur Finale", f"{final_val:,.2f} {symbol}")
+            st.metric("Valeur Finale" if vol == 0 and hausse == 0 else "Valeur Finale (médiane)", f"{final_val:,.2f} {symbol}")
         with sc2:
             st.metric("Intérêts Générés", f"{total_gain:,.2f} {symbol}", delta=f"Total investi: {total_invested:,.0f} {symbol}", delta_color="normal")
 
         # Graphique de simulation interactif
-        fig_sim = px.area(df_sim, x="Année", y=solde_col, title="Projection de ta Richesse", color_discrete_sequence=["#3498db"])
+        if vol == 0 and hausse == 0:
+            fig_sim = px.area(df_sim, x="Année", y=f"Solde ({symbol})", title="Projection de ta Richesse", color_discrete_sequence=["#3498db"])
+        else:
+            st.caption(
+                f"8 fois sur 10, le solde final se situerait entre {bands['P10'].iloc[-1]:,.0f} "
+                f"et {bands['P90'].iloc[-1]:,.0f} {symbol}."
+            )
+            fig_sim = plot_projection(bands, symbol)
         st.plotly_chart(fig_sim, use_container_width=True)
 
     # --- AFFICHAGE ET ANALYSE DU PORTEFEUILLE REEL ---
     st.markdown("---")
     st.subheader("📂 Mon Portefeuille Actuel")
 
-    inv_data = db.get_entries(f"investments_{uid}")
+    # Actifs et relevés lus en parallèle, avec un délai commun : une lecture
+    # lente est remplacée par son dernier résultat connu.
+    fetched, stale = db.fetch_concurrently({
+        "investments": ("get_entries", f"investments_{uid}"),
+        "snapshots": ("get_entries", snapshot_collection(uid)),
+    })
+    if stale:
+        st.caption("⏳ Firestore répond lentement : certaines données affichées peuvent dater de quelques instants.")
+    inv_data = fetched["investments"]
     if inv_data:
         df_inv = pd.DataFrame(inv_data)
 
@@ -121,5 +223,78 @@ def investment_dashboard(db, uid, base_currency="XOF"):
                 color_discrete_sequence=px.colors.qualitative.Pastel
             )
             st.plotly_chart(fig_pie, use_container_width=True)
+
+        portfolio_history(db, uid, inv_data, base_currency, snapshots=fetched["snapshots"])
     else:
         st.info("💡 Aucun investissement enregistré pour le moment. Utilisez le formulaire ci-dessus pour ajouter vos premières actions ou cryptos.")
+
+
+def portfolio_history(db, uid, assets, base_currency="XOF", snapshots=None):
+    """Relevés de valeur, rendements TWR/TRI et dérive d'allocation du portefeuille.
+
+    snapshots : relevés déjà lus pour ce rendu ; relus dans Firestore sinon."""
+    symbol = CURRENCY_SYMBOLS.get(base_currency, base_currency)
+    st.markdown("### 🕰️ Historique du Portefeuille")
+    names = {asset["id"]: asset.get("name", "Inconnu") for asset in assets if asset.get("id")}
+
+    if any(asset.get("ticker") for asset in assets):
+        if st.button("🔄 Actualiser les cours des actifs cotés", use_container_width=True):
+            updated = refresh_user_portfolio(db, uid, base_currency, assets, snapshots)
+            if updated:
+                st.success(f"{updated} actif(s) réévalué(s) au dernier cours.")
+                st.rerun()
+            st.info("Aucun cours plus récent disponible.")
+
+    with st.form("snapshot_form", clear_on_submit=True):
+        st.caption("Relevé de valeur : note la valeur actuelle d'un actif, et tout apport ou retrait fait ce jour.")
+        fc1, fc2, fc3 = st.columns(3)
+        asset_id = fc1.selectbox("Actif", list(names), format_func=names.get)
+        value = fc2.number_input(f"Nouvelle valeur ({symbol})", min_value=0.0, step=10.0)
+        flow = fc3.number_input(f"Apport (+) / retrait (-) ({symbol})", value=0.0, step=10.0)
+        if st.form_submit_button("Enregistrer le relevé", use_container_width=True) and asset_id:
+            if snapshots is None:
+                snapshots = db.get_entries(snapshot_collection(uid))
+            # Actif antérieur aux relevés : son relevé implicite devient réel
+            # (même id), pour que l'historique reste identique d'une session à l'autre.
+            for implicit in initial_snapshots([a for a in assets if a.get("id") == asset_id], snapshots):
+                db.add_entry(snapshot_collection(uid), {k: v for k, v in implicit.items() if k != "id"},
+                             doc_id=implicit["id"])
+            asset = next(a for a in assets if a.get("id") == asset_id)
+            cost = (asset.get("initial_cost", 0) or 0) + flow
+            if db.add_entry(snapshot_collection(uid), new_snapshot(asset_id, value, flow)):
+                db.update_entry(f"investments_{uid}", asset_id, {
+                    "current_value": value,
+                    "initial_cost": cost,
+                    "roi": calculate_roi(cost, value),
+                })
+                st.rerun()
+
+    if snapshots is None:
+        snapshots = db.get_entries(snapshot_collection(uid))
+    engine = get_session_portfolio()
+    engine.add_snapshots(snapshots + initial_snapshots(assets, snapshots))
+
+    twr = engine.time_weighted_return()
+    mwr = engine.money_weighted_return()
+    mc1, mc2 = st.columns(2)
+    mc1.metric("Rendement pondéré dans le temps (TWR)", f"{twr:.2f} %",
+               help="Performance des placements eux-mêmes, indépendamment du moment des apports.")
+    mc2.metric("TRI annualisé (rendement pondéré par l'argent)", f"{mwr:.2f} %" if mwr is not None else "n/d",
+               help="Ce que tes apports ont réellement rapporté par an, compte tenu de leurs dates.")
+
+    values = engine.value_series()
+    if len(values) > 1:
+        fig_values = px.line(values.rename(f"Valeur ({symbol})").to_frame(), y=f"Valeur ({symbol})",
+                             title="Valeur du portefeuille", markers=True)
+        fig_values.update_layout(xaxis_title="", showlegend=False)
+        st.plotly_chart(fig_values, use_container_width=True)
+
+    allocation = engine.allocation()
+    if not allocation.empty:
+        allocation.index = [names.get(asset_id, asset_id) for asset_id in allocation.index]
+        st.caption("Dérive d'allocation : poids actuel de chaque actif comparé à sa part des sommes investies.")
+        st.dataframe(
+            allocation.round(2),
+            column_config={"valeur": st.column_config.NumberColumn("Valeur", format=f"%.2f {symbol}")},
+            use_container_width=True,
+        )
@@ -0,0 +1,556 @@
+"""Tâches de maintenance Firestore, lancées à la main (hors app Streamlit) :
+
+    python maintenance.py backfill-timestamps [--batch-size 400] [--pause 1.0]
+    python maintenance.py check-timestamps [--batch-size 400]
+    python maintenance.py migrate-dates [--batch-size 400] [--pause 1.0]
+    python maintenance.py compact-months [--pause 1.0]
+    python maintenance.py refresh-quotes [--pause 1.0]
+    python maintenance.py purge-tokens [--batch-size 500] [--concurrency 4]
+
+Les secrets Firebase sont lus comme dans l'app (.streamlit/secrets.toml, via
+DBClient). Chaque tâche est reprenable : sa progression est enregistrée dans
+un document de points de reprise (collection _maintenance), si bien qu'une
+interruption (quota, coupure réseau, Ctrl+C) ne fait pas tout recommencer.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timezone
+
+from buckets import expand_bucket, is_bucket, pack_month
+from dates import ENTRY_DATE_FIELDS, parse_legacy_date
+from instrumentation import register_counter
+
+MAINTENANCE_COLLECTION = "_maintenance"
+
+# Collections utilisateur concernées par les tâches de maintenance. Les
+# relevés de portefeuille (snapshots_*) n'en font pas partie : ils sont
+# écrits d'emblée avec dates natives et server_timestamp ; une tâche qui les
+# viserait passe prefixes= explicitement à list_user_collections.
+USER_COLLECTION_PREFIXES = ("entries_", "investments_")
+
+# Limite Firestore : 500 écritures max par batch.
+MAX_BATCH_SIZE = 500
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Purge des jetons "rester connecté" expirés (purge_expired_remember_tokens) :
+# batchs de suppression envoyés en parallèle au plus, et période du balayage
+# de fond de l'app ($PROBUDGET_TOKEN_SWEEP_SECONDS, 0 pour le désactiver).
+REMEMBER_TOKENS_COLLECTION = "remember_tokens"
+TOKEN_PURGE_CONCURRENCY = 4
+TOKEN_SWEEP_SECONDS_ENV = "PROBUDGET_TOKEN_SWEEP_SECONDS"
+DEFAULT_TOKEN_SWEEP_SECONDS = 6 * 3600
+TOKEN_SWEEP_INITIAL_DELAY_SECONDS = 60
+
+# Balayages des jetons expirés : "runs", "skipped" (un autre processus l'a
+# fait récemment), "errors", et "deleted" (jetons supprimés).
+TOKEN_SWEEP_COUNTS = Counter()
+register_counter(
+    "probudget_remember_token_sweeps_total",
+    "Purge des jetons rester connecté expirés (runs / skipped / errors / deleted).",
+    "event", TOKEN_SWEEP_COUNTS,
+)
+
+
+def list_user_collections(db, prefixes=USER_COLLECTION_PREFIXES):
+    """Noms (triés, pour une reprise déterministe) des collections utilisateur."""
+    return sorted(
+        coll.id for coll in db.collections()
+        if coll.id.startswith(prefixes)
+    )
+
+
+def derive_server_timestamp(data):
+    """Horodatage de remplacement pour un document hérité sans server_timestamp :
+    created_at en priorité, puis date. À défaut, l'epoch : le document se
+    retrouve en fin de liste (le plus ancien) plutôt qu'en tête."""
+    for field in ("created_at", "date"):
+        derived = parse_legacy_date(data.get(field))
+        if derived is not None:
+            return derived
+    return _EPOCH
+
+
+class Checkpoint:
+    """Point de reprise d'une tâche, stocké dans _maintenance/<nom_tâche>."""
+
+    def __init__(self, db, task_name):
+        self.ref = db.collection(MAINTENANCE_COLLECTION).document(task_name)
+        snapshot = self.ref.get()
+        self.state = snapshot.to_dict() if snapshot.exists else {}
+        self.state.setdefault("completed_collections", [])
+        self.state.setdefault("current_collection", None)
+        self.state.setdefault("last_doc_id", None)
+        self.state.setdefault("updated", 0)
+        self.state.setdefault("scanned", 0)
+
+    def is_completed(self, collection):
+        return collection in self.state["completed_collections"]
+
+    def resume_after(self, collection):
+        """Dernier document traité dans cette collection lors d'un run précédent."""
+        if self.state["current_collection"] == collection:
+            return self.state["last_doc_id"]
+        return None
+
+    def save(self, collection, last_doc_id, scanned, updated):
+        self.state["current_collection"] = collection
+        self.state["last_doc_id"] = last_doc_id
+        self.state["scanned"] += scanned
+        self.state["updated"] += updated
+        self.state["updated_at"] = datetime.now(timezone.utc)
+        self.ref.set(self.state)
+
+    def complete(self, collection):
+        self.state["completed_collections"].append(collection)
+        self.state["current_collection"] = None
+        self.state["last_doc_id"] = None
+        self.state["updated_at"] = datetime.now(timezone.utc)
+        self.ref.set(self.state)
+
+
+def _walk_and_update(db, task_name, fields, compute_updates, batch_size=400,
+                     pause_seconds=1.0, collections=None, dry_run=False, log=print, **_ignored):
+    """Parcourt, page par page et par ordre d'identifiant, chaque collection
+    utilisateur et applique compute_updates(data) -> dict de mises à jour
+    (ou None) à chaque document, en batchs. Partagé par toutes les tâches de
+    migration : mêmes points de reprise, même limitation de débit.
+
+    - fields : projection (seuls ces champs transitent sur le réseau).
+    - batch_size : documents lus par page et écrits par batch (<= 500).
+    - pause_seconds : pause entre deux batchs, pour ne pas saturer le quota
+      d'écriture ni les lectures de l'app en production.
+    - dry_run : compte sans rien écrire (ni données, ni point de reprise).
+
+    Retourne {"scanned": ..., "updated": ...} pour ce run.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    checkpoint = None if dry_run else Checkpoint(db, task_name)
+    totals = {"scanned": 0, "updated": 0}
+
+    for collection in collections or list_user_collections(db):
+        if checkpoint is not None and checkpoint.is_completed(collection):
+            continue
+
+        coll_ref = db.collection(collection)
+        query = coll_ref.select(list(fields)).order_by("__name__").limit(batch_size)
+
+        last_doc_id = checkpoint.resume_after(collection) if checkpoint is not None else None
+        last_snapshot = coll_ref.document(last_doc_id).get() if last_doc_id else None
+
+        while True:
+            page_query = query.start_after(last_snapshot) if last_snapshot is not None else query
+            page = list(page_query.stream())
+            if not page:
+                break
+
+            batch = db.batch()
+            updated = 0
+            for snapshot in page:
+                updates = compute_updates(snapshot.to_dict() or {})
+                if updates:
+                    batch.update(snapshot.reference, updates)
+                    updated += 1
+
+            if updated and not dry_run:
+                batch.commit()
+
+            last_snapshot = page[-1]
+            totals["scanned"] += len(page)
+            totals["updated"] += updated
+            if checkpoint is not None:
+                checkpoint.save(collection, last_snapshot.id, len(page), updated)
+            log(f"{collection} : {len(page)} lus, {updated} mis à jour (total {totals['updated']})")
+
+            if len(page) < batch_size:
+                break
+            if pause_seconds:
+                time.sleep(pause_seconds)
+
+        if checkpoint is not None:
+            checkpoint.complete(collection)
+
+    return totals
+
+
+def backfill_server_timestamps(db, **kwargs):
+    """Ajoute server_timestamp (dérivé de created_at/date) à tous les documents
+    hérités qui ne l'ont pas, dans les collections entries_* et investments_*.
+
+    La requête triée de DBClient.get_entries exclut sans erreur les
+    documents sans server_timestamp : ils n'apparaissent pas dans l'app tant
+    qu'ils ne sont pas rattrapés. count_missing_server_timestamps confirme
+    qu'il n'en reste plus. Options : voir _walk_and_update.
+    """
+    def compute_updates(data):
+        if data.get("server_timestamp") is not None:
+            return None
+        return {"server_timestamp": derive_server_timestamp(data)}
+
+    return _walk_and_update(
+        db, "backfill_server_timestamp",
+        ["server_timestamp", "created_at", "date"], compute_updates, **kwargs
+    )
+
+
+def count_missing_server_timestamps(db, log=print, **kwargs):
+    """Compte, sans rien écrire, les documents encore dépourvus de
+    server_timestamp (ceux que get_entries n'affiche pas). Seul contrôle
+    fiable : Firestore ne sait pas filtrer sur un champ absent, et la
+    requête triée les ignore sans erreur.
+
+    Retourne {"scanned": ..., "updated": 0, "missing": ...}.
+    """
+    totals = backfill_server_timestamps(db, **{**kwargs, "dry_run": True, "log": lambda *_args: None})
+    log(f"{totals['updated']} document(s) sans server_timestamp sur {totals['scanned']} lus.")
+    return {"scanned": totals["scanned"], "updated": 0, "missing": totals["updated"]}
+
+
+def typed_date_updates(data):
+    """Mises à jour convertissant en horodatages Firestore natifs les champs
+    date encore stockés en chaînes (ou epochs). None si rien à convertir."""
+    updates = {}
+    for field in ENTRY_DATE_FIELDS:
+        value = data.get(field)
+        if value is None or isinstance(value, datetime):
+            continue
+        converted = parse_legacy_date(value)
+        if converted is not None:
+            updates[field] = converted
+    return updates or None
+
+
+def migrate_typed_dates(db, **kwargs):
+    """Réécrit date/created_at/exchange_rate_date des documents hérités en
+    horodatages natifs, pour que le chargement n'ait plus de chaîne à
+    analyser. Options : voir _walk_and_update."""
+    return _walk_and_update(
+        db, "migrate_typed_dates", list(ENTRY_DATE_FIELDS), typed_date_updates, **kwargs
+    )
+
+
+def _commit_in_chunks(db, operations):
+    """Applique une liste d'opérations ("set", ref, data) / ("update", ref,
+    champs) / ("delete", ref) dans l'ordre, en batchs de MAX_BATCH_SIZE."""
+    for start in range(0, len(operations), MAX_BATCH_SIZE):
+        batch = db.batch()
+        for operation in operations[start:start + MAX_BATCH_SIZE]:
+            if operation[0] == "set":
+                batch.set(operation[1], operation[2])
+            elif operation[0] == "update":
+                batch.update(operation[1], operation[2])
+            else:
+                batch.delete(operation[1])
+        batch.commit()
+
+
+def compact_closed_months(db, today=None, pause_seconds=1.0, collections=None,
+                          dry_run=False, log=print, **_ignored):
+    """Scelle les mois clos des collections entries_* en buckets mensuels
+    (voir buckets.py) : une lecture par mois et par partie au lieu d'une
+    lecture par transaction. Le mois en cours n'est jamais compacté.
+
+    Idempotent (pas besoin de point de reprise) : une transaction ajoutée
+    après coup dans un mois déjà scellé est fusionnée dans son bucket au run
+    suivant. Les buckets sont écrits avant la suppression des originaux ;
+    une interruption entre les deux laisse des doublons que get_entries
+    ignore (expand_entries), et que le run suivant nettoie.
+
+    Retourne {"scanned": ..., "updated": ...} (updated : transactions scellées).
+    """
+    today = today or date.today()
+    current_month = today.strftime("%Y-%m")
+    totals = {"scanned": 0, "updated": 0}
+
+    for collection in collections or list_user_collections(db, prefixes=("entries_",)):
+        coll_ref = db.collection(collection)
+        loose_by_month = defaultdict(list)
+        buckets_by_month = defaultdict(list)
+
+        for snapshot in coll_ref.stream():
+            totals["scanned"] += 1
+            data = snapshot.to_dict() or {}
+            if is_bucket(data):
+                buckets_by_month[data.get("month")].append((snapshot.id, data))
+                continue
+            entry_date = parse_legacy_date(data.get("date"))
+            if entry_date is None:
+                continue  # Date illisible : laissée en document individuel.
+            month = entry_date.strftime("%Y-%m")
+            if month < current_month:
+                loose_by_month[month].append({**data, "id": snapshot.id})
+
+        for month, loose_entries in sorted(loose_by_month.items()):
+            previous_buckets = buckets_by_month.get(month, [])
+            loose_ids = {entry["id"] for entry in loose_entries}
+            merged = [
+                entry for _doc_id, bucket in previous_buckets
+                for entry in expand_bucket(bucket) if entry["id"] not in loose_ids
+            ] + loose_entries
+
+            packed = pack_month(month, merged)
+            packed_ids = {doc_id for doc_id, _data in packed}
+            operations = [("set", coll_ref.document(doc_id), data) for doc_id, data in packed]
+            operations += [
+                ("delete", coll_ref.document(doc_id))
+                for doc_id, _data in previous_buckets if doc_id not in packed_ids
+            ]
+            operations += [("delete", coll_ref.document(entry_id)) for entry_id in loose_ids]
+
+            if not dry_run:
+                _commit_in_chunks(db, operations)
+            totals["updated"] += len(loose_entries)
+            log(f"{collection} {month} : {len(loose_entries)} transactions scellées en {len(packed)} bucket(s)")
+
+            if pause_seconds:
+                time.sleep(pause_seconds)
+
+    return totals
+
+
+def refresh_all_quotes(db, pause_seconds=1.0, dry_run=False, log=print, **_ignored):
+    """Actualise les actifs cotés de tous les utilisateurs (voir quotes.py) :
+    symboles distincts rassemblés sur tous les portefeuilles, un seul appel
+    par fournisseur de cours, puis réévaluation dans la devise de référence
+    de chaque utilisateur et écriture groupée (valeurs + relevés).
+
+    Retourne {"scanned": actifs lus, "updated": actifs réévalués}.
+    """
+    # Imports tardifs : quotes/users chargent Streamlit et bcrypt, inutiles
+    # pour les autres tâches.
+    from quotes import collect_tickers, fetch_quotes, revalue_assets
+    from portfolio import initial_snapshots, new_snapshot, snapshot_collection
+    from users import _compute_uid
+
+    portfolios = []
+    for user_doc in db.collection("users").stream():
+        uid = _compute_uid(user_doc.id)
+        base_currency = (user_doc.to_dict() or {}).get("base_currency", "XOF")
+        assets = [{**doc.to_dict(), "id": doc.id} for doc in db.collection(f"investments_{uid}").stream()]
+        if any(asset.get("ticker") for asset in assets):
+            portfolios.append((uid, base_currency, assets))
+
+    tickers = {}
+    for _uid, _currency, assets in portfolios:
+        for provider, symbols in collect_tickers(assets).items():
+            tickers.setdefault(provider, set()).update(symbols)
+    quotes = fetch_quotes(tickers)
+
+    totals = {"scanned": 0, "updated": 0}
+    now = datetime.now(timezone.utc)
+    for uid, base_currency, assets in portfolios:
+        totals["scanned"] += len(assets)
+        changes = revalue_assets(assets, quotes, base_currency)
+        if changes.empty:
+            continue
+        investments = db.collection(f"investments_{uid}")
+        snapshots = db.collection(snapshot_collection(uid))
+        operations = []
+        # Actifs antérieurs aux relevés : relevé implicite écrit d'abord
+        # (même id que dans investments.py), sinon le relevé du nouveau cours
+        # le remplacerait dans l'historique.
+        existing = [doc.to_dict() for doc in snapshots.select(["asset_id"]).stream()]
+        for implicit in initial_snapshots([a for a in assets if a.get("id") in changes.index], existing):
+            operations.append(("set", snapshots.document(implicit["id"]), {
+                **{k: v for k, v in implicit.items() if k != "id"}, "server_timestamp": now,
+            }))
+        for asset_id, row in changes.iterrows():
+            operations.append(("update", investments.document(asset_id), {
+                "current_value": float(row.current_value), "roi": float(row.roi),
+                "last_price": float(row.price), "price_updated_at": now,
+            }))
+            operations.append(("set", snapshots.document(), {
+                **new_snapshot(asset_id, float(row.current_value), when=now), "server_timestamp": now,
+            }))
+        if not dry_run:
+            _commit_in_chunks(db, operations)
+        totals["updated"] += len(changes)
+        log(f"investments_{uid} : {len(changes)} actif(s) réévalué(s)")
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    return totals
+
+
+def purge_expired_remember_tokens(db, batch_size=MAX_BATCH_SIZE, concurrency=TOKEN_PURGE_CONCURRENCY,
+                                  pause_seconds=0.0, dry_run=False, log=print, now=None, **_ignored):
+    """Supprime les jetons "rester connecté" expirés de tous les utilisateurs
+    en une requête de groupe de collections filtrée côté serveur
+    (expires_at < maintenant) : seuls les jetons expirés sont lus, jamais
+    les jetons valides ni les documents utilisateur.
+
+    Les pages (batch_size <= 500 documents, curseur sur expires_at) sont
+    lues l'une après l'autre ; leurs batchs de suppression partent en
+    parallèle, au plus concurrency à la fois.
+
+    Prérequis Firestore : une exemption d'index à champ unique sur
+    remember_tokens.expires_at avec la portée "groupe de collections"
+    (ordre croissant), sans quoi la requête est refusée.
+
+    Retourne {"scanned": jetons expirés lus, "updated": jetons supprimés}.
+    """
+    # Import tardif : inutile pour afficher l'aide de la ligne de commande.
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    now = time.time() if now is None else now
+    query = (db.collection_group(REMEMBER_TOKENS_COLLECTION)
+             .where(filter=FieldFilter("expires_at", "<", now))
+             .order_by("expires_at")
+             .select(["expires_at"])
+             .limit(batch_size))
+    totals = {"scanned": 0, "updated": 0}
+
+    def delete_page(page):
+        batch = db.batch()
+        for snapshot in page:
+            batch.delete(snapshot.reference)
+        batch.commit()
+        return len(page)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="token-purge") as pool:
+        pending = set()
+        last_snapshot = None
+        while True:
+            page_query = query.start_after(last_snapshot) if last_snapshot is not None else query
+            page = list(page_query.stream())
+            if not page:
+                break
+            totals["scanned"] += len(page)
+            last_snapshot = page[-1]
+
+            if not dry_run:
+                if len(pending) >= concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    totals["updated"] += sum(future.result() for future in done)
+                pending.add(pool.submit(delete_page, page))
+            log(f"{REMEMBER_TOKENS_COLLECTION} : {len(page)} jetons expirés (total {totals['scanned']})")
+
+            if len(page) < batch_size:
+                break
+            if pause_seconds:
+                time.sleep(pause_seconds)
+
+        totals["updated"] += sum(future.result() for future in wait(pending).done)
+
+    TOKEN_SWEEP_COUNTS["deleted"] += totals["updated"]
+    return totals
+
+
+def token_sweep_seconds():
+    """Période du balayage de fond, en secondes (0 : désactivé)."""
+    try:
+        return max(0.0, float(os.environ.get(TOKEN_SWEEP_SECONDS_ENV, DEFAULT_TOKEN_SWEEP_SECONDS)))
+    except ValueError:
+        return float(DEFAULT_TOKEN_SWEEP_SECONDS)
+
+
+def _claim_token_sweep(db, interval_seconds, now=None):
+    """Bail du balayage dans _maintenance/remember_token_sweep : False si un
+    autre processus (autre réplique de l'app) l'a lancé il y a moins d'une
+    période. Sans transaction : un double balayage reste sans conséquence."""
+    now = time.time() if now is None else now
+    ref = db.collection(MAINTENANCE_COLLECTION).document("remember_token_sweep")
+    snapshot = ref.get()
+    last_run = (snapshot.to_dict() or {}).get("last_run", 0) if snapshot.exists else 0
+    if now - last_run < interval_seconds * 0.9:
+        return False
+    ref.set({"last_run": now})
+    return True
+
+
+class TokenSweeper:
+    """Thread de fond qui purge périodiquement les jetons expirés (un par
+    processus, voir temp_db_client.start_token_sweeper), à la place de la
+    purge faite auparavant à chaque connexion réussie.
+
+    get_db : fonction renvoyant le client Firestore, appelée à chaque
+    balayage (la connexion n'est pas créée au démarrage du thread)."""
+
+    def __init__(self, get_db, interval_seconds=None, initial_delay=TOKEN_SWEEP_INITIAL_DELAY_SECONDS):
+        self.get_db = get_db
+        self.interval_seconds = token_sweep_seconds() if interval_seconds is None else interval_seconds
+        self.initial_delay = initial_delay
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval_seconds and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="token-sweeper", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # Décalage aléatoire : les répliques démarrées ensemble ne balaient
+        # pas au même instant.
+        delay = self.initial_delay + random.uniform(0, self.initial_delay)
+        while not self._stop.wait(delay):
+            self.run_once()
+            delay = self.interval_seconds
+
+    def run_once(self):
+        """Un balayage (best effort). Retourne les totaux, ou None s'il n'a
+        pas eu lieu (bail pris ailleurs, erreur)."""
+        try:
+            db = self.get_db()
+            if not _claim_token_sweep(db, self.interval_seconds):
+                TOKEN_SWEEP_COUNTS["skipped"] += 1
+                return None
+            totals = purge_expired_remember_tokens(db, log=lambda *_args: None)
+            TOKEN_SWEEP_COUNTS["runs"] += 1
+            return totals
+        except Exception:
+            TOKEN_SWEEP_COUNTS["errors"] += 1
+            return None
+
+
+def _get_firestore_client():
+    # Import tardif : DBClient lit les secrets via Streamlit, inutile de le
+    # charger pour afficher l'aide de la ligne de commande.
+    from temp_db_client import DBClient
+    return DBClient().db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tâches de maintenance Firestore de ProBudget AI.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    tasks = {
+        "backfill-timestamps": (backfill_server_timestamps, "Ajoute server_timestamp aux documents hérités."),
+        "check-timestamps": (count_missing_server_timestamps, "Compte les documents sans server_timestamp."),
+        "migrate-dates": (migrate_typed_dates, "Convertit les dates stockées en chaînes en horodatages natifs."),
+        "compact-months": (compact_closed_months, "Regroupe les mois clos en buckets mensuels."),
+        "refresh-quotes": (refresh_all_quotes, "Actualise les cours des actifs cotés de tous les utilisateurs."),
+        "purge-tokens": (purge_expired_remember_tokens, "Supprime les jetons rester connecté expirés."),
+    }
+    for name, (_task, help_text) in tasks.items():
+        task_parser = sub.add_parser(name, help=help_text)
+        task_parser.add_argument("--batch-size", type=int, default=400)
+        task_parser.add_argument("--pause", type=float, default=1.0, help="Pause (s) entre deux batchs.")
+        task_parser.add_argument("--dry-run", action="store_true")
+        task_parser.add_argument("--concurrency", type=int, default=TOKEN_PURGE_CONCURRENCY,
+                                 help="Batchs envoyés en parallèle (purge-tokens).")
+
+    args = parser.parse_args(argv)
+
+    task, _help_text = tasks[args.command]
+    totals = task(
+        _get_firestore_client(),
+        batch_size=args.batch_size,
+        pause_seconds=args.pause,
+        dry_run=args.dry_run,
+        concurrency=args.concurrency,
+    )
+    print(f"Terminé : {totals['scanned']} documents lus, {totals['updated']} mis à jour.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,184 @@
-import plotly.express as px
-import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
 from currency import CURRENCY_SYMBOLS
+from analysis import compute_monthly_aggregate
+from profiling import profiled
 
-def plot_revenue_expense(df, base_currency="XOF"):
-    """Trace les revenus et les dépenses mensuelles avec un design épuré."""
+# Au-delà de ce nombre de mois, les barres groupées deviennent des courbes :
+# bien plus légères à dessiner sur un téléphone d'entrée de gamme, et le
+# graphique reste lisible là où des centaines de barres ne le seraient plus.
+LONG_SERIES_MONTHS = 36
+
+# Mise en page minimale écrite à la main, sans template Plotly : le template
+# complet (plotly_white comme celui par défaut, 4 à 7 Ko de JSON) était
+# renvoyé au navigateur à chaque rerun, pour chaque graphique. Le thème
+# Streamlit s'applique de toute façon par-dessus.
+_BASE_LAYOUT = dict(
+    template="none",
+    plot_bgcolor="white",
+    paper_bgcolor="white",
+    margin=dict(l=10, r=10, t=50, b=10),
+    xaxis=dict(showgrid=True, gridcolor="#ecf0f1"),
+    yaxis=dict(showgrid=True, gridcolor="#ecf0f1", zerolinecolor="#bdc3c7"),
+    hovermode="x unified",
+)
+
+
+def _empty_figure():
+    return go.Figure(layout=dict(_BASE_LAYOUT, title="Aucune donnée pour le graphique"))
+
+
+def _trimmed(values, decimals):
+    """Arrondit les valeurs envoyées au navigateur : 2 décimales suffisent
+    pour un montant affiché, au lieu des 17 chiffres d'un float64 sérialisé."""
+    return np.round(np.asarray(values, dtype="float64"), decimals)
+
+
+@profiled
+def plot_revenue_expense(df, base_currency="XOF", monthly=None):
+    """Trace les revenus et les dépenses mensuelles avec un design épuré.
+
+    monthly : agrégat mensuel partagé du rendu (analysis.MonthlyAggregate) ;
+    recalculé depuis df s'il n'est pas fourni.
+    """
     if df.empty:
-        return px.scatter(title="Aucune donnée pour le graphique")
+        return _empty_figure()
 
-    # Resampling sur l'index Datetime
-    rev = df[df['type'] == 'Revenu'].resample('ME')['amount'].sum().rename('Revenu')
-    dep = df[df['type'] == 'Dépense'].resample('ME')['amount'].sum().rename('Dépense')
+    if monthly is None:
+        monthly = compute_monthly_aggregate(df)
 
-    plot_df = pd.concat([rev, dep], axis=1).fillna(0)
     # CORRECTION CRITIQUE : On extrait le mois depuis l'index, pas depuis une colonne absente
-    plot_df['month'] = plot_df.index.strftime('%b %Y')
+    months = list(monthly.months.strftime('%b %Y'))
+    long_series = len(months) > LONG_SERIES_MONTHS
+
+    fig = go.Figure()
+    for name, values, color in (
+        ('Revenu', monthly.revenue, '#2ecc71'),
+        ('Dépense', monthly.expense, '#e74c3c'),
+    ):
+        trace = go.Scatter(mode="lines", line=dict(color=color, width=2)) if long_series else go.Bar(marker_color=color)
+        trace.update(x=months, y=_trimmed(values, 2), name=name)
+        fig.add_trace(trace)
 
-    fig = px.bar(
-        plot_df, x='month', y=['Revenu', 'Dépense'],
+    symbol = CURRENCY_SYMBOLS.get(base_currency, base_currency)
+    fig.update_layout(
+        _BASE_LAYOUT,
         title='📊 Flux de Trésorerie Mensuel',
         barmode='group',
-        color_discrete_map={'Revenu': '#2ecc71', 'Dépense': '#e74c3c'},
-        template="plotly_white"
+        xaxis_title="", yaxis_title=f"Montant ({symbol})", legend_title="",
     )
-    symbol = CURRENCY_SYMBOLS.get(base_currency, base_currency)
-    fig.update_layout(xaxis_title="", yaxis_title=f"Montant ({symbol})", legend_title="")
     return fig
 
-def plot_savings_rate(df):
+
+@profiled
+def plot_savings_rate(df, monthly=None):
     """Trace le taux d'épargne ((revenus - dépenses) / revenus, en %) à partir des données calculées."""
     if df.empty:
-        return px.scatter(title="Aucune donnée pour le graphique")
+        return _empty_figure()
+
+    if monthly is None:
+        monthly = compute_monthly_aggregate(df)
 
-    # On récupère le taux d'épargne moyen par fin de mois depuis l'index
-    monthly_savings = df.resample('ME')['taux_epargne'].mean().to_frame()
-    monthly_savings['month'] = monthly_savings.index.strftime('%b %Y')
+    # Taux d'épargne mensuel lu dans l'agrégat partagé
+    months = list(monthly.months.strftime('%b %Y'))
+    long_series = len(months) > LONG_SERIES_MONTHS
 
-    fig = px.line(
-        monthly_savings, x='month', y='taux_epargne',
+    fig = go.Figure(go.Scatter(
+        x=months,
+        y=_trimmed(monthly.savings_rate, 1),
+        mode="lines" if long_series else "lines+markers",
+        line=dict(color='#3498db', width=3),
+        name="Taux d'épargne",
+    ))
+    fig.update_layout(
+        _BASE_LAYOUT,
         title="📈 Évolution du Taux d'Épargne (%)",
-        markers=True,
-        template="plotly_white"
+        yaxis_range=[-100, 100], xaxis_title="", yaxis_title="Taux d'épargne %",
+    )
+    return fig
+
+
+# Nombre maximal de points envoyés au navigateur pour la courbe de solde
+# quotidien : au-delà, la série est sous-échantillonnée par LTTB.
+MAX_BALANCE_POINTS = 500
+
+
+def lttb_indices(y, n_out):
+    """Indices retenus par l'algorithme Largest-Triangle-Three-Buckets pour
+    réduire une série régulière (abscisses équidistantes) à n_out points en
+    gardant sa forme visuelle (pics et creux compris).
+
+    Premier et dernier points toujours conservés ; les autres sont répartis
+    en n_out - 2 tranches, où l'on garde le point formant le plus grand
+    triangle avec le point retenu précédent et la moyenne de la tranche
+    suivante. Une boucle par tranche, calculs vectorisés dans la tranche.
+    """
+    y = np.asarray(y, dtype="float64")
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.arange(n, dtype="float64")
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start, next_end = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        next_end = max(next_end, next_start + 1)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return selected
+
+
+@profiled
+def plot_daily_balance(balance, base_currency="XOF", start=None, end=None, max_points=MAX_BALANCE_POINTS):
+    """Courbe du solde cumulé quotidien (analysis.daily_balance_series).
+
+    Sur la fenêtre [start, end] demandée, au plus max_points points sont
+    envoyés (LTTB) : un historique de plusieurs années reste léger, et une
+    fenêtre réduite (zoom) retrouve la pleine résolution jour par jour.
+    """
+    if balance.empty:
+        return _empty_figure()
+
+    window = balance.loc[start:end] if (start is not None or end is not None) else balance
+    if window.empty:
+        return _empty_figure()
+
+    indices = lttb_indices(window.to_numpy(), max_points)
+    sampled = window.iloc[indices]
+    full_resolution = len(sampled) == len(window)
+
+    fig = go.Figure(go.Scatter(
+        x=sampled.index.strftime('%Y-%m-%d'),
+        y=_trimmed(sampled, 2),
+        mode="lines",
+        line=dict(color='#8e44ad', width=2),
+        name="Solde",
+    ))
+    symbol = CURRENCY_SYMBOLS.get(base_currency, base_currency)
+    resolution_txt = "jour par jour" if full_resolution else f"{len(sampled)} points sur {len(window)} jours"
+    fig.update_layout(
+        _BASE_LAYOUT,
+        title=f"💰 Solde cumulé quotidien ({resolution_txt})",
+        xaxis_title="", yaxis_title=f"Solde ({symbol})",
     )
-    fig.update_traces(line_color='#3498db', line_width=3)
-    fig.update_layout(yaxis_range=[-100, 100], xaxis_title="", yaxis_title="Taux d'épargne %")
-    return fig
\ No newline at end of file
+    return fig
+
+
+def figure_payload_bytes(fig):
+    """Taille (octets) du JSON de la figure tel que Streamlit l'envoie au navigateur."""
+    import plotly.io as pio
+    return len(pio.to_json(fig, validate=False).encode("utf-8"))
@@ -0,0 +1,197 @@
+"""Suivi du portefeuille dans le temps : relevés de valeur par actif
+(collection snapshots_<uid>) et moteur de calcul de la valeur totale, du
+rendement pondéré dans le temps (TWR), du rendement pondéré par l'argent
+(TRI) et de la dérive d'allocation.
+
+Un relevé = un document {asset_id, value, flow, date} : valeur de l'actif
+à la date, après un éventuel apport (flow > 0) ou retrait (flow < 0) fait le
+jour même. L'ajout d'un actif écrit son premier relevé (flow = coût d'achat) ;
+un actif enregistré avant les relevés en reçoit un implicite (initial_snapshots).
+
+PortfolioEngine est incrémental : add_snapshots n'intègre que les relevés
+pas encore vus et, s'ils sont postérieurs au dernier relevé intégré, ne
+calcule que les nouvelles dates (pivot date × actif, report de la dernière
+valeur connue, rendements des sous-périodes et produit cumulé en numpy).
+Un relevé antidaté, plus rare, déclenche un recalcul complet.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from dates import to_naive_datetime_series
+
+SESSION_KEY = "portfolio_engine"
+
+IRR_MAX_ITERATIONS = 100
+IRR_TOLERANCE = 1e-10
+DAYS_PER_YEAR = 365.25
+
+
+def snapshot_collection(uid):
+    return f"snapshots_{uid}"
+
+
+def new_snapshot(asset_id, value, flow=0.0, when=None):
+    """Document de relevé prêt à écrire (date Firestore native)."""
+    return {
+        "asset_id": asset_id,
+        "value": float(value),
+        "flow": float(flow),
+        "date": when or datetime.now(timezone.utc),
+    }
+
+
+def initial_snapshots(assets, snapshots):
+    """Relevés implicites des actifs sans aucun relevé (enregistrés avant le
+    suivi) : coût d'achat comme apport, valeur actuelle à leur date d'ajout."""
+    tracked = {s.get("asset_id") for s in snapshots}
+    return [
+        {
+            **new_snapshot(
+                asset["id"], asset.get("current_value", 0) or 0, asset.get("initial_cost", 0) or 0,
+                asset.get("server_timestamp") or datetime(1970, 1, 1, tzinfo=timezone.utc),
+            ),
+            "id": f"initial_{asset['id']}",
+        }
+        for asset in assets
+        if asset.get("id") and asset["id"] not in tracked
+    ]
+
+
+def irr(cashflows, years):
+    """Taux de rendement interne annualisé (méthode de Newton) : taux r qui
+    annule sum(cashflows / (1 + r) ** years). Flux du point de vue de
+    l'investisseur (apports négatifs, valeur finale positive). None si la
+    méthode ne converge pas (ex. flux tous du même signe)."""
+    cashflows = np.asarray(cashflows, dtype="float64")
+    years = np.asarray(years, dtype="float64")
+    if len(cashflows) < 2 or (cashflows >= 0).all() or (cashflows <= 0).all():
+        return None
+    rate = 0.1
+    for _ in range(IRR_MAX_ITERATIONS):
+        discount = (1 + rate) ** -years
+        npv = (cashflows * discount).sum()
+        derivative = (-years * cashflows * discount / (1 + rate)).sum()
+        if derivative == 0:
+            return None
+        step = npv / derivative
+        rate = max(rate - step, -0.9999)
+        if abs(step) < IRR_TOLERANCE:
+            return rate
+    return None
+
+
+class PortfolioEngine:
+    """Valeur du portefeuille et rendements, mis à jour relevé par relevé."""
+
+    def __init__(self):
+        self._snapshots = {}
+        self._reset()
+
+    def _reset(self):
+        self._last_values = pd.Series(dtype="float64")
+        self._cost_basis = pd.Series(dtype="float64")
+        self._dates = pd.DatetimeIndex([])
+        self._totals = np.empty(0)
+        self._flows = np.empty(0)
+        self._growth = np.empty(0)
+
+    def add_snapshots(self, snapshots):
+        """Intègre les relevés (dicts avec 'id') pas encore vus. Retourne leur nombre."""
+        new = [s for s in snapshots if s.get("id") not in self._snapshots]
+        if not new:
+            return 0
+        for snapshot in new:
+            self._snapshots[snapshot.get("id")] = snapshot
+
+        frame = self._frame(new)
+        if len(self._dates) and frame["date"].min() <= self._dates[-1]:
+            # Relevé antidaté : recalcul complet à partir de tous les relevés.
+            self._reset()
+            frame = self._frame(list(self._snapshots.values()))
+        self._append(frame)
+        return len(new)
+
+    @staticmethod
+    def _frame(snapshots):
+        frame = pd.DataFrame(snapshots)
+        frame["date"] = to_naive_datetime_series(frame["date"]).dt.normalize()
+        frame["value"] = pd.to_numeric(frame["value"], errors="coerce").fillna(0.0)
+        frame["flow"] = pd.to_numeric(frame.get("flow", 0.0), errors="coerce").fillna(0.0)
+        return frame
+
+    def _append(self, frame):
+        # Valeurs date × actif (dernier relevé du jour), complétées par la
+        # dernière valeur connue de chaque actif.
+        values = frame.pivot_table(index="date", columns="asset_id", values="value", aggfunc="last")
+        values = pd.concat([self._last_values.to_frame().T, values]) if len(self._last_values) else values
+        values = values.ffill().fillna(0.0)
+        if len(self._last_values):
+            values = values.iloc[1:]
+        totals = values.sum(axis=1).to_numpy()
+        flows = frame.groupby("date")["flow"].sum().reindex(values.index, fill_value=0.0).to_numpy()
+
+        # Rendement de chaque sous-période : (V_t - apports_t) / V_{t-1}. Une
+        # période partant d'un portefeuille vide ne compte pas (facteur 1).
+        previous = np.r_[self._totals[-1:] if len(self._totals) else [0.0], totals[:-1]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = np.where(previous > 0, (totals - flows) / previous, 1.0)
+
+        self._dates = self._dates.append(values.index)
+        self._totals = np.r_[self._totals, totals]
+        self._flows = np.r_[self._flows, flows]
+        self._growth = np.r_[self._growth, growth]
+        self._last_values = values.iloc[-1]
+        self._cost_basis = self._cost_basis.add(frame.groupby("asset_id")["flow"].sum(), fill_value=0.0)
+
+    def value_series(self):
+        """Valeur totale du portefeuille à chaque date de relevé."""
+        return pd.Series(self._totals, index=self._dates, name="valeur")
+
+    def twr_series(self):
+        """Rendement cumulé pondéré dans le temps (en %), insensible au
+        calendrier des apports et retraits."""
+        return pd.Series((np.cumprod(self._growth) - 1) * 100, index=self._dates, name="twr")
+
+    def time_weighted_return(self):
+        return float((np.prod(self._growth) - 1) * 100) if len(self._growth) else 0.0
+
+    def money_weighted_return(self):
+        """TRI annualisé (en %) : apports et retraits datés, valeur actuelle
+        comme flux final. None si non calculable."""
+        if len(self._dates) < 2:
+            return None
+        years = (self._dates - self._dates[0]).days.to_numpy() / DAYS_PER_YEAR
+        cashflows = -self._flows.copy()
+        cashflows[-1] += self._totals[-1]
+        rate = irr(cashflows, years)
+        return None if rate is None else rate * 100
+
+    def allocation(self, targets=None):
+        """Poids actuel de chaque actif et dérive par rapport à une cible
+        (dict asset_id -> poids en %) ; sans cible, la référence est la part
+        de chaque actif dans les sommes investies."""
+        values = self._last_values[self._last_values.index.notna()]
+        if values.empty or values.sum() <= 0:
+            return pd.DataFrame(columns=["valeur", "poids (%)", "cible (%)", "dérive (pts)"])
+        weights = values / values.sum() * 100
+        if targets:
+            target = pd.Series(targets, dtype="float64").reindex(weights.index, fill_value=0.0)
+        else:
+            basis = self._cost_basis.reindex(weights.index, fill_value=0.0).clip(lower=0)
+            target = basis / basis.sum() * 100 if basis.sum() > 0 else weights
+        return pd.DataFrame({
+            "valeur": values,
+            "poids (%)": weights,
+            "cible (%)": target,
+            "dérive (pts)": weights - target,
+        })
+
+
+def get_session_portfolio():
+    """Moteur de portefeuille de la session courante (vidé à la déconnexion)."""
+    if SESSION_KEY not in st.session_state:
+        st.session_state[SESSION_KEY] = PortfolioEngine()
+    return st.session_state[SESSION_KEY]
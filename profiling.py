@@ -0,0 +1,179 @@
+"""Mode profilage du tableau de bord : chronométrage de chaque section d'un
+rerun de app.py et de chaque fonction utilitaire appelée (décorateur
+profiled), affiché en cascade dans la barre latérale.
+
+Activé par le paramètre d'URL ?profile=1 ou par l'interrupteur du panneau
+d'administration. Les administrateurs peuvent en plus enregistrer un profil
+cProfile par rerun (fichier .pstats, exploitable avec snakeviz, py-spy,
+flameprof...) dans le dossier $PROBUDGET_PROFILE_DIR (défaut : profiles/).
+
+Un seul profil cProfile à la fois dans le processus (depuis Python 3.12,
+cProfile repose sur sys.monitoring, commun à tout le processus) : un rerun
+qui en demande un pendant qu'un autre est actif s'en passe (dump_skipped).
+app.py appelle finish_rerun dans un finally, pour que même un rerun
+interrompu (st.rerun, st.stop) arrête son profil.
+
+Hors mode profilage, section() et profiled ne coûtent qu'un test d'attribut.
+"""
+import contextlib
+import cProfile
+import functools
+import os
+import threading
+import time
+from datetime import datetime
+
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_DIR_ENV = "PROBUDGET_PROFILE_DIR"
+DEFAULT_PROFILE_DIR = "profiles"
+
+_local = threading.local()
+# Détenu par le rerun dont le profil cProfile est actif.
+_cprofile_lock = threading.Lock()
+
+
+class RerunProfiler:
+    """Chronométrage d'un rerun : liste de (nom, profondeur, début, durée)
+    en secondes depuis le début du rerun."""
+
+    def __init__(self, dump_dir=None):
+        self.records = []
+        self.dump_dir = dump_dir
+        self.dump_path = None
+        self._depth = 0
+        self._origin = time.perf_counter()
+        self._cprofile = None
+        self.dump_skipped = False
+        if dump_dir:
+            self._start_cprofile()
+
+    def _start_cprofile(self):
+        if not _cprofile_lock.acquire(blocking=False):
+            self.dump_skipped = True
+            return
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+        except ValueError:
+            # Un autre outil de profilage est déjà actif (py-spy, débogueur...).
+            _cprofile_lock.release()
+            self.dump_skipped = True
+            return
+        self._cprofile = profile
+
+    @contextlib.contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        record = [name, self._depth, start - self._origin, 0.0]
+        self.records.append(record)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            record[3] = time.perf_counter() - start
+
+    @property
+    def total(self):
+        return time.perf_counter() - self._origin
+
+    def finish(self):
+        """Arrête cProfile et écrit le .pstats du rerun (si demandé).
+        Sans effet au second appel."""
+        profile, self._cprofile = self._cprofile, None
+        if profile is None:
+            return self.dump_path
+        try:
+            profile.disable()
+        finally:
+            _cprofile_lock.release()
+        os.makedirs(self.dump_dir, exist_ok=True)
+        self.dump_path = os.path.join(
+            self.dump_dir, f"rerun_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.pstats"
+        )
+        profile.dump_stats(self.dump_path)
+        return self.dump_path
+
+
+def start_rerun(enabled, dump=False):
+    """Démarre (ou désactive) le profilage pour le rerun du thread courant."""
+    # Profileur d'un rerun précédent resté attaché (finish_rerun non appelé).
+    finish_rerun(current_profiler())
+    if not enabled:
+        _local.profiler = None
+        return None
+    dump_dir = os.environ.get(PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR) if dump else None
+    _local.profiler = RerunProfiler(dump_dir=dump_dir)
+    return _local.profiler
+
+
+def finish_rerun(profiler):
+    """Fin du rerun, quelle qu'en soit l'issue : arrête le profil cProfile
+    éventuel et détache le profileur du thread."""
+    if profiler is not None:
+        profiler.finish()
+    if current_profiler() is profiler:
+        _local.profiler = None
+
+
+def current_profiler():
+    return getattr(_local, "profiler", None)
+
+
+@contextlib.contextmanager
+def section(name):
+    """Chronomètre un bloc du rerun courant (sans effet hors mode profilage)."""
+    profiler = current_profiler()
+    if profiler is None:
+        yield
+        return
+    with profiler.section(name):
+        yield
+
+
+def profiled(func):
+    """Chronomètre chaque appel de la fonction en mode profilage."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = current_profiler()
+        if profiler is None:
+            return func(*args, **kwargs)
+        with profiler.section(f"{func.__name__}()"):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def render_waterfall(profiler):
+    """Cascade des sections du rerun dans la barre latérale, puis fin du profilage."""
+    import streamlit as st
+    import plotly.graph_objects as go
+
+    dump_path = profiler.finish()
+    total_ms = profiler.total * 1000
+    records = profiler.records
+
+    with st.sidebar.expander(f"⏱️ Profilage du rerun ({total_ms:,.0f} ms)", expanded=True):
+        if not records:
+            st.caption("Aucune section chronométrée.")
+        else:
+            labels = [f"{'· ' * depth}{name}" for name, depth, _start, _duration in records]
+            fig = go.Figure(go.Bar(
+                y=labels,
+                x=[duration * 1000 for _name, _depth, _start, duration in records],
+                base=[start * 1000 for _name, _depth, start, _duration in records],
+                orientation="h",
+                marker_color=["#3498db" if depth == 0 else "#95a5a6" for _name, depth, _s, _d in records],
+                hovertemplate="%{y}<br>début %{base:.1f} ms<br>durée %{x:.1f} ms<extra></extra>",
+            ))
+            fig.update_layout(
+                height=max(200, 22 * len(records) + 60),
+                margin=dict(l=0, r=0, t=10, b=0),
+                xaxis_title="ms depuis le début du rerun",
+                yaxis=dict(autorange="reversed"),
+                plot_bgcolor="white",
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        if dump_path:
+            st.caption(f"Profil cProfile enregistré : `{dump_path}`")
+        elif profiler.dump_skipped:
+            st.caption("Profil cProfile non enregistré : un autre profil est déjà en cours dans ce processus.")
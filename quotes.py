@@ -0,0 +1,214 @@
+"""Actualisation des cours des actifs cotés du portefeuille.
+
+Un actif coté porte un symbole (champ "ticker") et une quantité détenue
+("quantity"), et éventuellement le nom du fournisseur de cours à utiliser
+("quote_provider", défaut : $PROBUDGET_QUOTE_PROVIDER ou "stub"). Sa valeur
+actuelle et son ROI sont alors recalculés à partir du cours, converti dans
+la devise de référence de l'utilisateur, au lieu d'être saisis à la main.
+
+- Un seul appel par fournisseur pour tous les symboles distincts demandés
+  (ceux d'un portefeuille, ou de tous les utilisateurs via la tâche de
+  maintenance refresh-quotes).
+- Cache des cours en mémoire, QUOTE_TTL_SECONDS par (fournisseur, symbole).
+- Fournisseur "stub" : fichier JSON local ($PROBUDGET_QUOTES_FILE, défaut
+  quotes_stub.json), pour travailler hors ligne.
+- Réévaluation vectorisée (pandas), écritures Firestore groupées en batchs,
+  avec un relevé de valeur par actif modifié (portfolio.py).
+"""
+import abc
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from currency import get_exchange_rate
+from portfolio import initial_snapshots, new_snapshot, snapshot_collection
+
+QUOTE_PROVIDER_ENV = "PROBUDGET_QUOTE_PROVIDER"
+QUOTES_FILE_ENV = "PROBUDGET_QUOTES_FILE"
+DEFAULT_PROVIDER = "stub"
+DEFAULT_QUOTES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quotes_stub.json")
+QUOTE_TTL_SECONDS = 900
+
+
+class QuoteProvider(abc.ABC):
+    """Source de cours : fetch reçoit tous les symboles d'un coup et renvoie
+    {symbole: {"price": float, "currency": "USD", "as_of": datetime}} pour
+    ceux qu'elle connaît (les autres sont simplement absents)."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def fetch(self, symbols):
+        ...
+
+
+class FileQuoteProvider(QuoteProvider):
+    """Cours lus dans un fichier JSON {"AAPL": {"price": 227.5, "currency": "USD"}, ...}."""
+
+    name = "stub"
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def fetch(self, symbols):
+        path = self.path or os.environ.get(QUOTES_FILE_ENV, DEFAULT_QUOTES_FILE)
+        try:
+            with open(path, encoding="utf-8") as f:
+                table = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        as_of = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+        return {
+            symbol: {"price": float(table[symbol]["price"]), "currency": table[symbol].get("currency", "USD"),
+                     "as_of": as_of}
+            for symbol in symbols if symbol in table
+        }
+
+
+_providers = {DEFAULT_PROVIDER: FileQuoteProvider()}
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def register_provider(provider, name=None):
+    """Ajoute (ou remplace) un fournisseur de cours."""
+    _providers[name or provider.name] = provider
+
+
+def default_provider_name():
+    return os.environ.get(QUOTE_PROVIDER_ENV, DEFAULT_PROVIDER)
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def collect_tickers(assets):
+    """Symboles distincts par fournisseur : {fournisseur: {symbole, ...}}."""
+    tickers = {}
+    for asset in assets:
+        symbol = (asset.get("ticker") or "").strip().upper()
+        if symbol:
+            provider = asset.get("quote_provider") or default_provider_name()
+            tickers.setdefault(provider, set()).add(symbol)
+    return tickers
+
+
+def fetch_quotes(tickers):
+    """Cours {(fournisseur, symbole): quote} : ceux encore frais sont lus dans
+    le cache, les autres demandés en un seul appel par fournisseur. Un
+    fournisseur inconnu ou en erreur laisse ses symboles sans cours."""
+    now = time.monotonic()
+    quotes = {}
+    missing = {}
+    with _cache_lock:
+        for provider, symbols in tickers.items():
+            for symbol in symbols:
+                cached = _cache.get((provider, symbol))
+                if cached is not None and cached[1] > now:
+                    quotes[(provider, symbol)] = cached[0]
+                else:
+                    missing.setdefault(provider, []).append(symbol)
+
+    for provider_name, symbols in missing.items():
+        provider = _providers.get(provider_name)
+        if provider is None:
+            continue
+        try:
+            fetched = provider.fetch(sorted(symbols))
+        except Exception:
+            continue
+        with _cache_lock:
+            for symbol, quote in fetched.items():
+                _cache[(provider_name, symbol)] = (quote, now + QUOTE_TTL_SECONDS)
+                quotes[(provider_name, symbol)] = quote
+    return quotes
+
+
+def _numeric_column(frame, column):
+    if column not in frame.columns:
+        return pd.Series(np.nan, index=frame.index, dtype="float64")
+    return pd.to_numeric(frame[column], errors="coerce")
+
+
+def revalue_assets(assets, quotes, base_currency="XOF"):
+    """Nouvelles valeurs des actifs cotés dont le cours est connu, calculées
+    en bloc : quantité × cours × taux de change vers base_currency (un taux
+    par devise de cotation distincte).
+
+    Retourne un DataFrame indexé par id d'actif (colonnes current_value, roi,
+    price, quote_currency), limité aux actifs dont la valeur change.
+    """
+    columns = ["current_value", "roi", "price", "quote_currency"]
+    frame = pd.DataFrame(assets)
+    if frame.empty or not {"id", "ticker", "quantity"} <= set(frame.columns):
+        return pd.DataFrame(columns=columns)
+
+    frame = frame.set_index("id")
+    frame["symbol"] = frame["ticker"].fillna("").astype(str).str.strip().str.upper()
+    provider = frame["quote_provider"] if "quote_provider" in frame.columns else pd.Series(None, index=frame.index)
+    frame["provider"] = provider.fillna(default_provider_name())
+    keys = list(zip(frame["provider"], frame["symbol"]))
+    frame["price"] = [quotes[key]["price"] if key in quotes else np.nan for key in keys]
+    frame["quote_currency"] = [quotes[key]["currency"] if key in quotes else None for key in keys]
+    frame["quantity"] = _numeric_column(frame, "quantity")
+    frame = frame[frame["price"].notna() & frame["quantity"].notna()]
+    if frame.empty:
+        return pd.DataFrame(columns=columns)
+
+    rates = {currency: get_exchange_rate(currency, base_currency) for currency in frame["quote_currency"].unique()}
+    value = (frame["quantity"] * frame["price"] * frame["quote_currency"].map(rates)).round(2)
+    cost = _numeric_column(frame, "initial_cost").fillna(0.0)
+    roi = np.where(cost > 0, (value - cost) / cost.where(cost > 0, 1.0) * 100, 0.0)
+
+    result = pd.DataFrame({
+        "current_value": value,
+        "roi": roi,
+        "price": frame["price"],
+        "quote_currency": frame["quote_currency"],
+    })
+    previous = _numeric_column(frame, "current_value")
+    return result[~np.isclose(result["current_value"], previous.fillna(-1.0))]
+
+
+def refresh_user_portfolio(db, uid, base_currency="XOF", assets=None, snapshots=None):
+    """Réévalue les actifs cotés d'un utilisateur (DBClient) et écrit en
+    batchs les nouvelles valeurs et les relevés correspondants. Retourne le
+    nombre d'actifs mis à jour.
+
+    snapshots : relevés déjà lus pour ce rendu ; relus dans Firestore sinon."""
+    if assets is None:
+        assets = db.get_entries(f"investments_{uid}")
+    changes = revalue_assets(assets, fetch_quotes(collect_tickers(assets)), base_currency)
+    if changes.empty:
+        return 0
+
+    # Actif antérieur aux relevés : son relevé implicite devient réel (même
+    # id, comme dans investments.py) avant le relevé du nouveau cours, sinon
+    # il disparaîtrait de l'historique (et le TRI avec lui).
+    if snapshots is None:
+        snapshots = db.get_entries(snapshot_collection(uid))
+    implicit = initial_snapshots([a for a in assets if a.get("id") in changes.index], snapshots)
+    if implicit and not db.set_entries(snapshot_collection(uid), {
+        snapshot["id"]: {k: v for k, v in snapshot.items() if k != "id"} for snapshot in implicit
+    }):
+        return 0
+
+    now = datetime.now(timezone.utc)
+    updates = {
+        asset_id: {"current_value": float(row.current_value), "roi": float(row.roi),
+                   "last_price": float(row.price), "price_updated_at": now}
+        for asset_id, row in changes.iterrows()
+    }
+    if not db.update_entries(f"investments_{uid}", updates):
+        return 0
+    db.add_entries(snapshot_collection(uid), [
+        new_snapshot(asset_id, fields["current_value"], when=now) for asset_id, fields in updates.items()
+    ])
+    return len(updates)
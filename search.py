@@ -0,0 +1,171 @@
+"""Recherche instantanée dans l'historique des transactions : Firestore n'a pas
+de recherche plein texte, on tient donc un index inversé en mémoire, par
+utilisateur (un par session), construit à partir de la description, de la
+catégorie, du nom du justificatif et du texte OCR conservé.
+
+- Jetons normalisés sans accents ni casse ("Café" et "cafe" se valent) ;
+  quelques mots vides du français sont ignorés.
+- Recherche par préfixe ("resta" trouve "restaurant") : les jetons sont
+  gardés triés et les plages de préfixe trouvées par bisect ; tous les mots
+  de la requête doivent correspondre (ET).
+- Filtres montant/date vectorisés (numpy) sur les colonnes de l'index.
+- Incrémental : SearchIndex.update n'indexe que les transactions dont l'id
+  n'a pas encore été vu. Mémoire bornée : au plus MAX_INDEXED_ENTRIES
+  transactions (les plus récentes) et MAX_TOKENS_PER_ENTRY jetons chacune.
+"""
+import bisect
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+SEARCH_FIELDS = ("description", "category", "justificatif_name", "justificatif_raw_text")
+MAX_INDEXED_ENTRIES = 200_000
+MAX_TOKENS_PER_ENTRY = 64
+MIN_TOKEN_LENGTH = 2
+
+# Valeurs de remplissage posées par le formulaire, sans intérêt pour la recherche.
+_PLACEHOLDER_TEXTS = {
+    "Aucun justificatif",
+    "Aucun scan effectué",
+    "Non conservé (désactivé par l'utilisateur)",
+}
+STOP_WORDS = frozenset({
+    "au", "aux", "avec", "ce", "de", "des", "du", "en", "et", "la", "le", "les",
+    "par", "pour", "sur", "un", "une",
+})
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+SESSION_KEY = "search_index"
+
+
+def normalize(text):
+    """Minuscules sans accents : "Café Éléphant" -> "cafe elephant"."""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text):
+    """Jetons de recherche d'un texte (sans doublons, ordre d'apparition)."""
+    tokens = dict.fromkeys(
+        token for token in _TOKEN_RE.findall(normalize(text))
+        if len(token) >= MIN_TOKEN_LENGTH and token not in STOP_WORDS
+    )
+    return list(tokens)
+
+
+class SearchIndex:
+    """Index inversé jeton -> positions des transactions, plus colonnes numpy
+    (montant, date) pour les filtres."""
+
+    def __init__(self, max_entries=MAX_INDEXED_ENTRIES):
+        self.max_entries = max_entries
+        self._reset()
+
+    def _reset(self):
+        self._ids = []
+        self._positions = {}
+        self._amounts = np.empty(0, dtype="float64")
+        self._dates = np.empty(0, dtype="int64")
+        self._postings = {}
+        self._sorted_tokens = []
+
+    def __len__(self):
+        return len(self._ids)
+
+    def update(self, df):
+        """Indexe les transactions de df (DataFrame préparé, indexé par date)
+        qui ne le sont pas encore. Retourne le nombre de transactions ajoutées."""
+        if df.empty or 'id' not in df.columns:
+            return 0
+        # Test d'appartenance direct au dict : Series.isin sur des chaînes
+        # Arrow recopierait tout le dictionnaire à chaque appel.
+        positions = self._positions
+        new = df[[entry_id not in positions for entry_id in df['id'].to_numpy()]]
+        if new.empty:
+            return 0
+
+        if len(self._ids) + len(new) > self.max_entries:
+            # Dépassement : on repart des transactions les plus récentes.
+            self._reset()
+            new = df.sort_index().tail(self.max_entries)
+
+        start = len(self._ids)
+        touched = {}
+        texts = [new[field].to_numpy() if field in new.columns else None for field in SEARCH_FIELDS]
+        for offset, entry_id in enumerate(new['id'].to_numpy()):
+            position = start + offset
+            self._positions[entry_id] = position
+            self._ids.append(entry_id)
+            text = " ".join(
+                str(values[offset]) for values in texts
+                if values is not None and not pd.isna(values[offset]) and values[offset] not in _PLACEHOLDER_TEXTS
+            )
+            for token in tokenize(text)[:MAX_TOKENS_PER_ENTRY]:
+                touched.setdefault(token, []).append(position)
+
+        new_tokens = False
+        for token, positions in touched.items():
+            existing = self._postings.get(token)
+            added = np.asarray(positions, dtype="int32")
+            if existing is None:
+                self._postings[token] = added
+                new_tokens = True
+            else:
+                self._postings[token] = np.concatenate([existing, added])
+        if new_tokens:
+            self._sorted_tokens = sorted(self._postings)
+
+        amounts = pd.to_numeric(new['amount'], errors='coerce').to_numpy(dtype="float64") if 'amount' in new.columns \
+            else np.full(len(new), np.nan)
+        dates = new.index.to_numpy().astype("datetime64[ns]").astype("int64")
+        self._amounts = np.concatenate([self._amounts, amounts])
+        self._dates = np.concatenate([self._dates, dates])
+        return len(new)
+
+    def _prefix_mask(self, prefix):
+        """Masque des transactions ayant un jeton commençant par prefix."""
+        mask = np.zeros(len(self._ids), dtype=bool)
+        lo = bisect.bisect_left(self._sorted_tokens, prefix)
+        hi = bisect.bisect_left(self._sorted_tokens, prefix + "\uffff", lo)
+        for token in self._sorted_tokens[lo:hi]:
+            mask[self._postings[token]] = True
+        return mask
+
+    def search(self, query="", amount_min=None, amount_max=None, date_min=None, date_max=None, limit=None):
+        """Ids des transactions correspondantes, de la plus récente à la plus
+        ancienne. Chaque mot de la requête est cherché comme préfixe."""
+        mask = np.ones(len(self._ids), dtype=bool)
+        for term in _TOKEN_RE.findall(normalize(query)):
+            mask &= self._prefix_mask(term)
+        if amount_min is not None:
+            mask &= self._amounts >= amount_min
+        if amount_max is not None:
+            mask &= self._amounts <= amount_max
+        if date_min is not None:
+            mask &= self._dates >= pd.Timestamp(date_min).value
+        if date_max is not None:
+            # Date de fin incluse en entier (jusqu'à minuit le lendemain).
+            mask &= self._dates < (pd.Timestamp(date_max).normalize() + pd.Timedelta(days=1)).value
+
+        positions = np.flatnonzero(mask)
+        positions = positions[np.argsort(self._dates[positions], kind="stable")[::-1]]
+        if limit is not None:
+            positions = positions[:limit]
+        return [self._ids[p] for p in positions]
+
+    def memory_bytes(self):
+        """Estimation de la mémoire des structures numpy de l'index (octets)."""
+        return int(
+            self._amounts.nbytes + self._dates.nbytes
+            + sum(postings.nbytes for postings in self._postings.values())
+        )
+
+
+def get_session_index():
+    """Index de recherche de la session courante (vidé à la déconnexion)."""
+    if SESSION_KEY not in st.session_state:
+        st.session_state[SESSION_KEY] = SearchIndex()
+    return st.session_state[SESSION_KEY]
@@ -0,0 +1,150 @@
+"""Instantané local du DataFrame préparé de chaque utilisateur, pour des
+démarrages à froid rapides.
+
+Après un déploiement ou un redémarrage, le premier affichage du tableau de
+bord relisait toute la collection Firestore puis reconstruisait le
+DataFrame. Le DataFrame préparé (prepare_dashboard_data) est maintenant
+écrit dans un fichier Arrow/Feather non compressé, clé = (uid, version de la
+collection), et relu en mémoire mappée : un démarrage à froid coûte des
+lectures disque au lieu d'allers-retours réseau.
+
+- Version : DBClient.get_collection_version (nombre de documents + dernier
+  server_timestamp), lue sans rapatrier la collection. Toute écriture via
+  add_entry (nouveau server_timestamp) ou suppression (nombre) la change.
+  La clé inclut aussi analysis.SNAPSHOT_FORMAT_VERSION : après un
+  déploiement qui change le format du DataFrame préparé, les anciens
+  fichiers ne sont plus relus. Un fichier dont le schéma ne correspond pas
+  (colonnes, dtypes) est traité comme absent.
+- Emplacement : $PROBUDGET_SNAPSHOT_DIR (défaut .cache/snapshots ; vide pour
+  désactiver). Noms de fichiers dérivés d'un hachage de l'uid.
+- Nettoyage : l'écriture d'une version supprime les versions précédentes du
+  même utilisateur, et les instantanés non relus depuis
+  SNAPSHOT_MAX_AGE_DAYS jours sont supprimés.
+- Best-effort : toute erreur (disque plein, colonne non convertible en
+  Arrow...) revient simplement à la lecture Firestore.
+"""
+import glob
+import hashlib
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from analysis import (
+    CATEGORICAL_COLUMNS, INVALID_DATES_ATTR, SNAPSHOT_FORMAT_VERSION, compute_monthly_aggregate,
+    prepare_dashboard_data,
+)
+
+SNAPSHOT_DIR_ENV = "PROBUDGET_SNAPSHOT_DIR"
+DEFAULT_SNAPSHOT_DIR = os.path.join(".cache", "snapshots")
+SNAPSHOT_MAX_AGE_DAYS = 30
+INDEX_COLUMN = "date"
+# Colonnes toujours présentes dans un DataFrame préparé non vide.
+REQUIRED_COLUMNS = ("type", "amount", "category", "profit", "taux_epargne")
+
+
+def snapshot_dir():
+    return os.environ.get(SNAPSHOT_DIR_ENV, DEFAULT_SNAPSHOT_DIR)
+
+
+def _digest(value):
+    return hashlib.sha256(repr(value).encode("utf-8")).hexdigest()[:24]
+
+
+def snapshot_path(uid, version, directory=None):
+    directory = snapshot_dir() if directory is None else directory
+    return os.path.join(directory, f"{_digest(uid)}.{_digest((SNAPSHOT_FORMAT_VERSION, version))}.feather")
+
+
+def _has_expected_schema(df):
+    """Vérifie qu'un instantané relu a bien le format du code courant."""
+    if not isinstance(df.index, pd.DatetimeIndex) or INVALID_DATES_ATTR not in df.attrs:
+        return False
+    if any(col not in df.columns for col in REQUIRED_COLUMNS):
+        return False
+    return all(isinstance(df[col].dtype, pd.CategoricalDtype) for col in CATEGORICAL_COLUMNS if col in df.columns)
+
+
+def load_snapshot(uid, version, directory=None):
+    """(df, monthly) depuis l'instantané (uid, version), ou None s'il n'existe
+    pas, est illisible ou n'a pas le schéma attendu (fichier alors supprimé).
+    Le fichier est mappé en mémoire ; seul l'agrégat mensuel est recalculé."""
+    directory = snapshot_dir() if directory is None else directory
+    if not directory or version is None:
+        return None
+    path = snapshot_path(uid, version, directory)
+    try:
+        with pa.memory_map(path, "r") as source:
+            df = feather.read_table(source, memory_map=True).to_pandas()
+        os.utime(path)
+    except (OSError, pa.ArrowException, KeyError, TypeError, ValueError):
+        return None
+    if INDEX_COLUMN in df.columns:
+        df = df.set_index(INDEX_COLUMN)
+    if not _has_expected_schema(df):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    return df, compute_monthly_aggregate(df)
+
+
+def save_snapshot(uid, version, df, directory=None):
+    """Écrit l'instantané (uid, version) de df (écriture atomique), puis
+    supprime les instantanés périmés. Retourne True si le fichier est écrit."""
+    directory = snapshot_dir() if directory is None else directory
+    if not directory or version is None or df.empty:
+        return False
+    path = snapshot_path(uid, version, directory)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        table = pa.Table.from_pandas(df.reset_index() if df.index.name == INDEX_COLUMN else df, preserve_index=False)
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+    except (OSError, pa.ArrowException, TypeError, ValueError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    purge_stale_snapshots(directory, keep=path)
+    return True
+
+
+def purge_stale_snapshots(directory=None, keep=None, max_age_days=SNAPSHOT_MAX_AGE_DAYS):
+    """Supprime les autres versions de l'utilisateur de keep et les
+    instantanés non relus depuis max_age_days. Retourne le nombre supprimé."""
+    directory = snapshot_dir() if directory is None else directory
+    if not directory:
+        return 0
+    same_user = os.path.basename(keep).split(".", 1)[0] if keep else None
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for path in glob.glob(os.path.join(directory, "*.feather")):
+        if path == keep:
+            continue
+        try:
+            if os.path.basename(path).split(".", 1)[0] == same_user or os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def load_prepared(db, collection, uid, version, entries=None):
+    """(df, monthly) du tableau de bord : depuis l'instantané de la version
+    si possible, sinon depuis les transactions (entries, ou relues dans
+    Firestore), puis écrit l'instantané de cette version."""
+    if entries is None:
+        prepared = load_snapshot(uid, version)
+        if prepared is not None:
+            return prepared
+        entries = db.get_entries(collection)
+    prepared = prepare_dashboard_data(entries)
+    save_snapshot(uid, version, prepared[0])
+    return prepared
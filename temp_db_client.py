@@ -1,71 +1,253 @@
+import functools
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 import firebase_admin
 from firebase_admin import credentials, firestore
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+try:
+    from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+except ImportError:
+    SCRIPT_RUN_CONTEXT_ATTR_NAME = "streamlit_script_run_ctx"
+from buckets import estimate_document_size, expand_entries
+from instrumentation import (
+    get_render_context, instrumented, record_reads, record_writes, register_counter, set_render_context,
+)
+
+# Compteurs (par processus) du chemin emprunté par get_entries : "ordered"
+# quand la requête triée sur server_timestamp répond, "fallback" quand elle
+# lève une erreur (index, quota...) et qu'on relit toute la collection sans
+# tri (double lecture facturée). Ce n'est PAS un indicateur de documents
+# hérités : la requête triée ignore silencieusement les documents sans
+# server_timestamp, sans erreur. Pour les compter, voir
+# maintenance.count_missing_server_timestamps.
+GET_ENTRIES_PATH_COUNTS = Counter()
+register_counter(
+    "probudget_get_entries_path_total",
+    "Chemin emprunté par get_entries (ordered / fallback : requête triée en erreur).",
+    "path", GET_ENTRIES_PATH_COUNTS,
+)
+
+
+def _record_read_docs(docs):
+    """Déclare à l'instrumentation les documents (dicts) lus par un appel.
+    Une requête sans résultat est facturée une lecture par Firestore."""
+    record_reads(max(1, len(docs)), sum(estimate_document_size(doc) for doc in docs))
+
+# Nombre maximal d'appels Firestore simultanés pour tout le processus (toutes
+# sessions confondues) : au-delà, les appels attendent un créneau plutôt que
+# de multiplier les requêtes concurrentes sur le canal gRPC partagé.
+MAX_CONCURRENT_FIRESTORE_CALLS = 32
+
+# Limite Firestore : 500 écritures max par batch.
+MAX_BATCH_WRITES = 500
+
+# Lectures indépendantes d'un même rendu exécutées en parallèle
+# (DBClient.fetch_concurrently) : délai commun, threads du pool de lectures
+# du processus, et nombre de derniers résultats gardés pour les lectures lentes.
+FETCH_DEADLINE_SECONDS = 4.0
+FETCH_MAX_WORKERS = 8
+LAST_GOOD_RESULTS_MAX = 64
+
+# Lectures servies depuis le dernier résultat connu faute de réponse dans le délai.
+STALE_FETCH_COUNTS = Counter()
+register_counter(
+    "probudget_stale_fetches_total",
+    "Lectures parallèles remplacées par leur dernier résultat connu (délai dépassé).",
+    "method", STALE_FETCH_COUNTS,
+)
+
+
+def _init_firebase_app():
+    """Initialise l'app Firebase du processus (une seule fois) depuis les secrets Streamlit."""
+    if not firebase_admin._apps:
+        try:
+            # Utilisation sécurisée des secrets Streamlit
+            key_dict = dict(st.secrets["firebase"])
+        except (KeyError, FileNotFoundError):
+            st.error(
+                "❌ Secret Firebase absent : la section [firebase] est introuvable dans "
+                ".streamlit/secrets.toml. Copie .streamlit/secrets.toml.example vers "
+                ".streamlit/secrets.toml (ou configure les secrets sur Streamlit Cloud) "
+                "et renseigne tes vraies valeurs."
+            )
+            st.stop()
+
+        try:
+            if "private_key" in key_dict:
+                key_dict["private_key"] = key_dict["private_key"].replace("\\n", "\n")
+
+            cred = credentials.Certificate(key_dict)
+            firebase_admin.initialize_app(cred)
+
+        except Exception:
+            # On n'affiche jamais le détail brut de l'exception : il peut
+            # contenir des fragments de la clé privée Firebase.
+            st.error(
+                "❌ Clé Firebase invalide : la section [firebase] existe mais son contenu "
+                "est mal formé ou incomplet. Vérifie que chaque champ de "
+                ".streamlit/secrets.toml correspond bien au JSON de la clé de service "
+                "Firebase (notamment private_key)."
+            )
+            st.stop() # On arrête tout si la DB ne répond pas
+
+
+def _bounded(method):
+    """Réserve un créneau parmi MAX_CONCURRENT_FIRESTORE_CALLS pendant l'appel."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._call_slots:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class DBClient:
+    """Accès Firestore de l'app. Une seule instance par processus (voir
+    get_db_client), partagée par toutes les sessions : le client Firestore
+    sous-jacent est thread-safe et multiplexe tous les appels sur un même
+    canal gRPC (dont le SDK configure déjà le keep-alive)."""
+
     def __init__(self):
-        if not firebase_admin._apps:
-            try:
-                # Utilisation sécurisée des secrets Streamlit
-                key_dict = dict(st.secrets["firebase"])
-            except (KeyError, FileNotFoundError):
-                st.error(
-                    "❌ Secret Firebase absent : la section [firebase] est introuvable dans "
-                    ".streamlit/secrets.toml. Copie .streamlit/secrets.toml.example vers "
-                    ".streamlit/secrets.toml (ou configure les secrets sur Streamlit Cloud) "
-                    "et renseigne tes vraies valeurs."
-                )
-                st.stop()
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._call_slots = threading.BoundedSemaphore(MAX_CONCURRENT_FIRESTORE_CALLS)
+        self._last_good = OrderedDict()
+        self._last_good_lock = threading.Lock()
+        # Pool borné : une lecture bloquée au-delà de l'échéance occupe un
+        # thread du pool, jamais un thread de plus.
+        self._fetch_pool = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS, thread_name_prefix="firestore-fetch")
+        self._in_flight = {}
 
-            try:
-                if "private_key" in key_dict:
-                    key_dict["private_key"] = key_dict["private_key"].replace("\\n", "\n")
+    @property
+    def db(self):
+        """Client Firestore, créé au premier appel réel (pas à l'import ni à
+        l'ouverture d'une session)."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    _init_firebase_app()
+                    self._client = firestore.client()
+        return self._client
 
-                cred = credentials.Certificate(key_dict)
-                firebase_admin.initialize_app(cred)
+    # --- LECTURES PARALLÈLES ---
 
-            except Exception:
-                # On n'affiche jamais le détail brut de l'exception : il peut
-                # contenir des fragments de la clé privée Firebase.
-                st.error(
-                    "❌ Clé Firebase invalide : la section [firebase] existe mais son contenu "
-                    "est mal formé ou incomplet. Vérifie que chaque champ de "
-                    ".streamlit/secrets.toml correspond bien au JSON de la clé de service "
-                    "Firebase (notamment private_key)."
-                )
-                st.stop() # On arrête tout si la DB ne répond pas
-
-        self.db = firestore.client()
+    def _start_fetch(self, ctx, render_context, key):
+        """Soumet la lecture key = (méthode, *arguments) au pool de lectures
+        du processus. Une lecture identique encore en cours (ex. restée
+        bloquée après l'échéance d'un rendu précédent) est réutilisée au lieu
+        d'être relancée."""
+        with self._last_good_lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            future = self._in_flight[key] = self._fetch_pool.submit(self._run_fetch, ctx, render_context, key)
+        # Même terminée après l'échéance, une lecture rafraîchit le dernier
+        # résultat connu pour les rendus suivants.
+        future.add_done_callback(functools.partial(self._finish_fetch, key))
+        return future
+
+    def _run_fetch(self, ctx, render_context, key):
+        """Exécute une lecture dans un thread du pool, avec le contexte du
+        script appelant (st.error affiché dans sa session) et ses étiquettes
+        d'instrumentation (page, rôle) ; le contexte est retiré ensuite, le
+        thread servant à d'autres sessions. Le nombre d'appels simultanés
+        reste borné par _bounded."""
+        thread = threading.current_thread()
+        if ctx is not None:
+            add_script_run_ctx(thread, ctx)
+        set_render_context(*render_context)
+        try:
+            return getattr(self, key[0])(*key[1:])
+        finally:
+            setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+
+    def fetch_concurrently(self, requests, deadline=FETCH_DEADLINE_SECONDS):
+        """Lance en parallèle des lectures indépendantes d'un même rendu.
+
+        requests : {nom: (méthode, *arguments)}, ex.
+        {"investments": ("get_entries", "investments_<uid>")}.
+
+        Délai commun à toutes les lectures : une lecture encore en cours à
+        l'échéance est remplacée par son dernier résultat connu dans ce
+        processus ; sans résultat connu, on l'attend quand même.
+
+        Retourne (résultats {nom: valeur}, ensemble des noms servis depuis
+        le dernier résultat connu)."""
+        ctx = get_script_run_ctx(suppress_warning=True)
+        render_context = get_render_context()
+        futures = {name: self._start_fetch(ctx, render_context, tuple(call)) for name, call in requests.items()}
+        wait(futures.values(), timeout=deadline)
+
+        results, stale = {}, set()
+        for name, future in futures.items():
+            if not future.done():
+                with self._last_good_lock:
+                    key = tuple(requests[name])
+                    found = key in self._last_good
+                    value = self._last_good.get(key)
+                if found:
+                    results[name] = value
+                    stale.add(name)
+                    STALE_FETCH_COUNTS[requests[name][0]] += 1
+                    continue
+            results[name] = future.result()
+        return results, stale
+
+    def _finish_fetch(self, key, future):
+        """Retire la lecture des lectures en cours et garde son résultat.
+        Les méthodes de lecture renvoient []/None en cas d'erreur Firestore :
+        un résultat vide n'est donc jamais gardé comme "dernier résultat
+        connu" (il ferait passer une lecture lente pour une collection vide)."""
+        with self._last_good_lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            if future.cancelled() or future.exception() is not None or not future.result():
+                return
+            self._last_good[key] = future.result()
+            self._last_good.move_to_end(key)
+            while len(self._last_good) > LAST_GOOD_RESULTS_MAX:
+                self._last_good.popitem(last=False)
 
     # --- GESTION UTILISATEURS ---
 
+    @instrumented
+    @_bounded
     def get_user(self, email):
         """Récupère les infos de l'utilisateur."""
         if not self.db: return None
         try:
             doc_ref = self.db.collection('users').document(email.lower()) # Toujours en minuscule pour éviter les doublons
             doc = doc_ref.get()
-            return doc.to_dict() if doc.exists else None
+            data = doc.to_dict() if doc.exists else None
+            _record_read_docs([data] if data else [])
+            return data
         except Exception:
             return None
 
+    @instrumented
+    @_bounded
     def save_user(self, email, user_data):
         """Enregistre (écrase) le document utilisateur complet avec mise en minuscule de l'email."""
         if not self.db: return False
         try:
             # On s'assure que l'email est l'ID du document en minuscules
             self.db.collection('users').document(email.lower()).set(user_data)
+            record_writes(1, estimate_document_size(user_data))
             return True
         except Exception:
             st.error("Erreur lors de la sauvegarde du compte.")
             return False
 
+    @instrumented
+    @_bounded
     def update_user(self, email, updates):
         """Met à jour partiellement le profil utilisateur sans écraser les autres champs
         (contrairement à save_user, qui remplace tout le document)."""
         if not self.db: return False
         try:
             self.db.collection('users').document(email.lower()).set(updates, merge=True)
+            record_writes(1, estimate_document_size(updates))
             return True
         except Exception:
             st.error("Erreur lors de la mise à jour du profil.")
@@ -77,48 +259,84 @@ class DBClient:
     # déconnecte pas silencieusement les autres, et qu'une déconnexion
     # n'invalide que l'appareil courant.
 
+    @instrumented
+    @_bounded
     def set_remember_token(self, email, token_id, data):
         """Crée/écrase le document d'un jeton "rester connecté" (un par appareil)."""
         if not self.db: return False
         try:
             (self.db.collection('users').document(email.lower())
                 .collection('remember_tokens').document(token_id).set(data))
+            record_writes(1, estimate_document_size(data))
             return True
         except Exception:
             return False
 
+    @instrumented
+    @_bounded
     def get_remember_token(self, email, token_id):
         """Récupère le document d'un jeton "rester connecté" précis."""
         if not self.db: return None
         try:
             doc = (self.db.collection('users').document(email.lower())
                 .collection('remember_tokens').document(token_id).get())
-            return doc.to_dict() if doc.exists else None
+            data = doc.to_dict() if doc.exists else None
+            _record_read_docs([data] if data else [])
+            return data
         except Exception:
             return None
 
+    @instrumented
+    @_bounded
+    def get_user_and_remember_token(self, email, token_id):
+        """Document utilisateur et jeton "rester connecté" lus en un seul
+        aller-retour (get_all). Retourne (user_data, token_data), chacun None
+        s'il n'existe pas ; (None, None) en cas d'erreur."""
+        if not self.db: return None, None
+        try:
+            user_ref = self.db.collection('users').document(email.lower())
+            token_ref = user_ref.collection('remember_tokens').document(token_id)
+            found = {
+                snapshot.reference.path: snapshot.to_dict()
+                for snapshot in self.db.get_all([user_ref, token_ref]) if snapshot.exists
+            }
+            user_data, token_data = found.get(user_ref.path), found.get(token_ref.path)
+            _record_read_docs([doc for doc in (user_data, token_data) if doc])
+            return user_data, token_data
+        except Exception:
+            return None, None
+
+    @instrumented
+    @_bounded
     def delete_remember_token(self, email, token_id):
         """Invalide le jeton "rester connecté" d'un seul appareil (les autres restent valides)."""
         if not self.db: return False
         try:
             (self.db.collection('users').document(email.lower())
                 .collection('remember_tokens').document(token_id).delete())
+            record_writes(1)
             return True
         except Exception:
             return False
 
+    @instrumented
+    @_bounded
     def list_remember_tokens(self, email):
         """Liste tous les jetons "rester connecté" actifs (tous appareils) pour un utilisateur."""
         if not self.db: return []
         try:
             docs = (self.db.collection('users').document(email.lower())
                 .collection('remember_tokens').stream())
-            return [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+            tokens = [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+            _record_read_docs(tokens)
+            return tokens
         except Exception:
             return []
 
     # --- SOUTIEN DU PROJET ---
 
+    @instrumented
+    @_bounded
     def log_donation_click(self, email):
         """Enregistre un clic sur le bouton de don (email + horodatage, rien
         d'autre : on ne connaît ni le montant ni la confirmation du don)."""
@@ -128,36 +346,182 @@ class DBClient:
                 "email": email,
                 "timestamp": firestore.SERVER_TIMESTAMP,
             })
+            record_writes(1)
             return True
         except Exception:
             return False
 
     # --- GESTION BUDGET (OPTIMISÉE) ---
 
-    def add_entry(self, collection, entry):
-        """Ajoute une transaction avec horodatage automatique."""
+    @instrumented
+    @_bounded
+    def add_entry(self, collection, entry, doc_id=None):
+        """Ajoute une transaction avec horodatage automatique. Retourne l'id
+        du document créé (valeur vraie), ou False en cas d'échec.
+
+        doc_id : id imposé (document écrit avec set, réécrire le même id ne
+        crée pas de doublon) ; id aléatoire Firestore sinon.
+        """
         if not self.db: return False
         try:
             # Ajout d'un timestamp serveur pour un tri précis plus tard
             entry['server_timestamp'] = firestore.SERVER_TIMESTAMP
-            self.db.collection(collection).add(entry)
-            return True
+            if doc_id is None:
+                _update_time, doc_ref = self.db.collection(collection).add(entry)
+                doc_id = doc_ref.id
+            else:
+                self.db.collection(collection).document(doc_id).set(entry)
+            record_writes(1, estimate_document_size(entry))
+            return doc_id
         except Exception:
             st.error("Erreur lors de l'ajout de l'opération.")
             return False
 
+    @instrumented
+    @_bounded
+    def update_entry(self, collection, doc_id, fields):
+        """Met à jour quelques champs d'un document existant (ex. valeur
+        actuelle d'un actif), sans toucher aux autres."""
+        if not self.db: return False
+        try:
+            self.db.collection(collection).document(doc_id).update(fields)
+            record_writes(1, estimate_document_size(fields))
+            return True
+        except Exception:
+            st.error("Erreur lors de la mise à jour de l'opération.")
+            return False
+
+    @instrumented
+    @_bounded
+    def update_entries(self, collection, updates):
+        """Met à jour plusieurs documents ({doc_id: champs}) en batchs
+        Firestore de MAX_BATCH_WRITES écritures, au lieu d'un appel par document."""
+        if not self.db: return False
+        try:
+            items = list(updates.items())
+            for start in range(0, len(items), MAX_BATCH_WRITES):
+                batch = self.db.batch()
+                for doc_id, fields in items[start:start + MAX_BATCH_WRITES]:
+                    batch.update(self.db.collection(collection).document(doc_id), fields)
+                batch.commit()
+            record_writes(len(items), sum(estimate_document_size(fields) for _id, fields in items))
+            return True
+        except Exception:
+            st.error("Erreur lors de la mise à jour des opérations.")
+            return False
+
+    @instrumented
+    @_bounded
+    def add_entries(self, collection, entries):
+        """Ajoute plusieurs documents (horodatage serveur compris) en batchs
+        de MAX_BATCH_WRITES écritures."""
+        if not self.db: return False
+        try:
+            for start in range(0, len(entries), MAX_BATCH_WRITES):
+                batch = self.db.batch()
+                for entry in entries[start:start + MAX_BATCH_WRITES]:
+                    entry['server_timestamp'] = firestore.SERVER_TIMESTAMP
+                    batch.set(self.db.collection(collection).document(), entry)
+                batch.commit()
+            record_writes(len(entries), sum(estimate_document_size(entry) for entry in entries))
+            return True
+        except Exception:
+            st.error("Erreur lors de l'ajout des opérations.")
+            return False
+
+    @instrumented
+    @_bounded
+    def set_entries(self, collection, entries):
+        """Écrit des documents à identifiant imposé ({doc_id: entry},
+        horodatage serveur compris) en batchs de MAX_BATCH_WRITES écritures.
+        Réécrire les mêmes ids ne crée pas de doublon. Pas de message
+        d'erreur : appelé hors rerun par la file d'écriture (write_queue.py),
+        qui réessaie plus tard si False."""
+        if not self.db: return False
+        try:
+            items = list(entries.items())
+            for start in range(0, len(items), MAX_BATCH_WRITES):
+                batch = self.db.batch()
+                for doc_id, entry in items[start:start + MAX_BATCH_WRITES]:
+                    batch.set(self.db.collection(collection).document(doc_id),
+                              {**entry, 'server_timestamp': firestore.SERVER_TIMESTAMP})
+                batch.commit()
+            record_writes(len(items), sum(estimate_document_size(entry) for _id, entry in items))
+            return True
+        except Exception:
+            return False
+
+    @instrumented
+    @_bounded
     def get_entries(self, collection):
-        """Récupère les transactions triées par date de création."""
+        """Récupère les transactions triées par date de création. Les buckets
+        mensuels (stockage compact, voir buckets.py) sont redépliés en
+        transactions ordinaires.
+
+        Les documents sans server_timestamp sont absents du résultat trié
+        (Firestore les exclut sans erreur) : les rattraper avec
+        maintenance.backfill_server_timestamps."""
         if not self.db: return []
         try:
             # Tri par date pour éviter que l'application ne mélange les transactions
             docs = self.db.collection(collection).order_by('server_timestamp', direction=firestore.Query.DESCENDING).stream()
-            return [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+            entries = [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+            _record_read_docs(entries)
+            GET_ENTRIES_PATH_COUNTS["ordered"] += 1
+            return expand_entries(entries)
         except Exception:
-            # Si le tri échoue (ex: pas de timestamp sur les vieilles entrées), on récupère tout sans tri
+            # Si la requête triée échoue (index, quota...), on récupère tout sans tri
+            GET_ENTRIES_PATH_COUNTS["fallback"] += 1
             try:
                 docs = self.db.collection(collection).stream()
-                return [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+                entries = [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+                _record_read_docs(entries)
+                return expand_entries(entries)
             except Exception:
                 st.error("Erreur lors de la récupération des transactions.")
-                return []
\ No newline at end of file
+                return []
+
+    @instrumented
+    @_bounded
+    def get_collection_version(self, collection):
+        """Version de la collection sans la rapatrier : (nombre de documents,
+        plus récent server_timestamp en ISO). Une lecture pour le dernier
+        document, une par tranche de 1000 documents pour le comptage. None en
+        cas d'erreur (l'appelant relit alors la collection)."""
+        if not self.db: return None
+        try:
+            ref = self.db.collection(collection)
+            latest = list(ref.order_by('server_timestamp', direction=firestore.Query.DESCENDING).limit(1).stream())
+            count = int(ref.count().get()[0][0].value)
+            record_reads(1 + count // 1000)
+            ts = latest[0].to_dict().get('server_timestamp') if latest else None
+            return (count, ts.isoformat() if hasattr(ts, 'isoformat') else None)
+        except Exception:
+            return None
+
+
+@st.cache_resource(show_spinner=False)
+def get_db_client():
+    """DBClient unique du processus, partagé entre toutes les sessions
+    Streamlit (st.cache_resource) : une session ne garde que l'identité de
+    l'utilisateur, jamais sa propre connexion."""
+    return DBClient()
+
+
+@st.cache_resource(show_spinner=False)
+def start_token_sweeper(_db):
+    """Lance (une fois par processus) le balayage de fond des jetons "rester
+    connecté" expirés (maintenance.TokenSweeper), hors du chemin de connexion."""
+    from maintenance import TokenSweeper
+    return TokenSweeper(lambda: _db.db).start()
+
+
+@st.cache_resource(show_spinner=False)
+def start_write_queue(_db):
+    """File d'écriture locale du processus et son thread d'envoi
+    (write_queue.py), ou None si la file est désactivée."""
+    from write_queue import FlushWorker, open_write_queue
+    queue = open_write_queue()
+    if queue is None:
+        return None
+    return FlushWorker(queue, _db).start()
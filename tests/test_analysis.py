@@ -0,0 +1,160 @@
+"""Tests de l'agrégat mensuel partagé (analysis.MonthlyAggregate) : il doit
+donner les mêmes chiffres que les rééchantillonnages qu'il remplace."""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from datetime import date
+
+from analysis import INVALID_DATES_ATTR, daily_balance_series, prepare_dashboard_data, project_month_end_balance
+
+
+ENTRIES = [
+    {"type": "Revenu", "amount": 1000, "category": "Salaire", "date": "2024-01-05"},
+    {"type": "Dépense", "amount": 300, "category": "Loyer/Logement", "date": "2024-01-10"},
+    {"type": "Dépense", "amount": 50, "category": "Transport", "date": "2024-01-20"},
+    # Février : aucune transaction. Mars : dépense sans revenu.
+    {"type": "Dépense", "amount": 80, "category": "Transport", "date": "2024-03-02"},
+]
+
+
+def test_monthly_series_match_resampled_values():
+    df, monthly = prepare_dashboard_data(ENTRIES)
+
+    assert list(monthly.months.astype(str)) == ["2024-01", "2024-02", "2024-03"]
+    assert list(monthly.revenue) == [1000, 0, 0]
+    assert list(monthly.expense) == [350, 0, 80]
+    assert list(monthly.profit) == list(df['profit'].resample('ME').sum())
+
+
+def test_savings_rate_is_mapped_onto_each_transaction():
+    df, monthly = prepare_dashboard_data(ENTRIES)
+
+    assert monthly.savings_rate.iloc[0] == 65.0
+    assert monthly.savings_rate.iloc[2] == 0  # pas de revenu : convention 0 %
+    assert list(df['taux_epargne']) == [65.0, 65.0, 65.0, 0.0]
+
+
+def test_low_cardinality_columns_are_categorical():
+    df, _ = prepare_dashboard_data(ENTRIES)
+
+    assert isinstance(df['type'].dtype, pd.CategoricalDtype)
+    assert isinstance(df['category'].dtype, pd.CategoricalDtype)
+    assert list(df.loc[df['type'] == 'Dépense', 'amount']) == [300, 50, 80]
+
+
+def test_profit_by_month_end_is_indexed_for_prophet():
+    _df, monthly = prepare_dashboard_data(ENTRIES)
+    series = monthly.profit_by_month_end()
+    assert list(series.index) == [pd.Timestamp("2024-01-31"), pd.Timestamp("2024-02-29"), pd.Timestamp("2024-03-31")]
+
+
+def test_daily_balance_is_continuous_and_cumulative():
+    df, _monthly = prepare_dashboard_data(ENTRIES[:3])
+    balance = daily_balance_series(df)
+
+    assert balance.index[0] == pd.Timestamp("2024-01-05")
+    assert len(balance) == 16  # du 5 au 20 janvier inclus, jours vides compris
+    assert balance[pd.Timestamp("2024-01-09")] == 1000
+    assert balance.iloc[-1] == 650
+
+
+def _regular_months(months, salary=3000, daily_spend=100):
+    entries = []
+    for month in months:
+        start = pd.Timestamp(month)
+        entries.append({"date": start.isoformat(), "type": "Revenu", "amount": salary, "category": "Salaire"})
+        for day in range(start.days_in_month):
+            entries.append({"date": (start + pd.Timedelta(days=day)).isoformat(), "type": "Dépense",
+                            "amount": daily_spend, "category": "Courses"})
+    return entries
+
+
+def test_month_end_projection_replays_the_usual_rhythm():
+    entries = _regular_months(["2024-01-01", "2024-02-01", "2024-03-01"])
+    entries += [e for e in _regular_months(["2024-04-01"]) if e["date"] < "2024-04-11"]
+    df, _monthly = prepare_dashboard_data(entries)
+
+    projection = project_month_end_balance(df, today=date(2024, 4, 10))
+    # 3000 - 10 jours × 100 déjà passés, puis 20 jours × 100 à venir.
+    assert projection["p10"] == projection["p90"] == 0
+    assert projection["days_simulated"] == 20
+    assert projection["months_used"] == 3
+
+
+def test_month_end_projection_estimates_overspend_risk():
+    entries = _regular_months(["2024-01-01", "2024-02-01"], daily_spend=50)
+    entries += _regular_months(["2024-03-01"], daily_spend=150)
+    entries += [e for e in _regular_months(["2024-04-01"]) if e["date"] < "2024-04-11"]
+    df, _monthly = prepare_dashboard_data(entries)
+
+    projection = project_month_end_balance(df, today=date(2024, 4, 10))
+    assert 0 < projection["overspend_probability"] < 1
+    assert projection["p10"] < 0 < projection["p90"]
+
+
+def test_month_end_projection_needs_history():
+    df, _monthly = prepare_dashboard_data([e for e in _regular_months(["2024-04-01"]) if e["date"] < "2024-04-11"])
+    assert project_month_end_balance(df, today=date(2024, 4, 10)) is None
+
+
+def test_prophet_is_only_imported_on_first_forecast():
+    import subprocess
+
+    code = (
+        "import sys, analysis\n"
+        "assert 'prophet' not in sys.modules\n"
+        "available = analysis.PROPHET_AVAILABLE\n"
+        "assert 'prophet' not in sys.modules\n"
+        "assert available == (analysis.load_prophet() is not None)\n"
+    )
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_entries_without_usable_date_are_dropped_and_counted():
+    entries = ENTRIES + [
+        {"type": "Dépense", "amount": 999, "category": "Transport", "date": "pas une date"},
+        {"type": "Dépense", "amount": 999, "category": "Transport", "date": None},
+    ]
+    df, monthly = prepare_dashboard_data(entries)
+    assert len(df) == len(ENTRIES)
+    assert df.attrs[INVALID_DATES_ATTR] == 2
+    assert list(monthly.months.astype(str)) == ["2024-01", "2024-02", "2024-03"]
+
+    only_invalid, _monthly = prepare_dashboard_data(entries[-2:])
+    assert only_invalid.empty and only_invalid.attrs[INVALID_DATES_ATTR] == 2
+
+
+class _FakeProphet:
+    def __init__(self, **_kwargs):
+        pass
+
+    def fit(self, ts):
+        self.last = float(ts["y"].iloc[-1])
+
+    def make_future_dataframe(self, periods, freq):
+        return None
+
+    def predict(self, _future):
+        return pd.DataFrame({"yhat": [self.last], "yhat_lower": [self.last - 1], "yhat_upper": [self.last + 1]})
+
+
+def test_forecast_is_not_cached_while_prophet_is_unavailable(monkeypatch):
+    import analysis
+    import cache
+
+    monkeypatch.setattr(cache, "_shared_cache", cache.TieredCache([cache.MemoryTier()]))
+    profit = pd.Series([100.0, 120.0, 90.0, 110.0], index=pd.date_range("2024-01-31", periods=4, freq="ME"))
+
+    monkeypatch.setattr(analysis, "prophet_available", lambda: False)
+    assert analysis.forecast_prophet(profit) == {"available": False, "months_used": 4}
+
+    monkeypatch.setattr(analysis, "prophet_available", lambda: True)
+    monkeypatch.setattr(analysis, "load_prophet", lambda: _FakeProphet)
+    forecast = analysis.forecast_prophet(profit)
+    assert forecast["available"] and forecast["yhat"] == 110.0
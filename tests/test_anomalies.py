@@ -0,0 +1,75 @@
+"""Tests du détecteur de dépenses atypiques par catégorie (anomalies.py)."""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from anomalies import AnomalyDetector
+from utils import find_expense_alert
+
+
+def _expenses(rows, start="2024-01-01"):
+    index = pd.date_range(start, periods=len(rows), freq="D", name="date")
+    return pd.DataFrame(
+        {
+            "id": [r[0] for r in rows],
+            "type": "Dépense",
+            "category": [r[1] for r in rows],
+            "amount": [float(r[2]) for r in rows],
+        },
+        index=index,
+    )
+
+
+def test_rent_is_not_flagged_but_an_unusual_small_expense_is():
+    rows = []
+    for i in range(12):
+        rows.append((f"loyer{i}", "Logement", 150_000 + (i % 3) * 1_000))
+        rows.append((f"cafe{i}", "Loisirs", 1_000 + (i % 4) * 100))
+    rows.append(("cafe_x", "Loisirs", 9_000))
+    detector = AnomalyDetector()
+    detector.update(_expenses(rows))
+
+    flagged = detector.anomalies(threshold=300_000)
+    assert [a["id"] for a in flagged] == ["cafe_x"]
+    assert flagged[0]["score"] > detector.z_cutoff
+
+
+def test_threshold_is_the_fallback_for_categories_without_history():
+    detector = AnomalyDetector()
+    detector.update(_expenses([("a", "Santé", 40_000), ("b", "Santé", 500_000)]))
+    assert [a["id"] for a in detector.anomalies(threshold=300_000)] == ["b"]
+    assert detector.anomalies(threshold=600_000) == []
+
+
+def test_update_only_scores_unseen_entries():
+    base = [(f"e{i}", "Courses", 10_000 + i * 100) for i in range(10)]
+    detector = AnomalyDetector()
+    assert detector.update(_expenses(base)) == 10
+    assert detector.update(_expenses(base)) == 0
+
+    extended = _expenses(base + [("big", "Courses", 80_000)])
+    assert detector.update(extended) == 1
+    assert detector.anomalies(threshold=None)[0]["id"] == "big"
+
+
+def test_find_expense_alert_uses_the_session_detector():
+    rows = [(f"e{i}", "Transport", 2_000) for i in range(8)] + [("taxi", "Transport", 20_000)]
+    detector = AnomalyDetector(base_currency="XOF")
+    message = find_expense_alert(_expenses(rows), threshold=300_000, base_currency="XOF", detector=detector)
+    assert message.startswith("⚠️ Dépense inhabituelle détectée : 20000.00")
+    assert "Transport" in message
+
+
+def test_candidates_are_bounded_per_category():
+    # Une dépense atypique toutes les 10 : 20 candidates sur la session.
+    rows = [(f"e{i}", "Courses", 500_000 + i if i % 10 == 9 else 10_000 + (i % 3) * 100) for i in range(200)]
+    detector = AnomalyDetector(max_candidates=5)
+    for end in range(20, len(rows) + 1, 20):
+        detector.update(_expenses(rows[:end]))
+
+    flagged = detector.anomalies(threshold=None)
+    assert len(flagged) == 5
+    assert [a["id"] for a in flagged] == ["e199", "e189", "e179", "e169", "e159"]
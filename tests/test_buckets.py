@@ -0,0 +1,62 @@
+"""Tests du stockage compact par buckets mensuels (buckets.py) : empaquetage
+puis dépliage doivent restituer exactement les transactions d'origine."""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from buckets import MAX_BUCKET_INDEX_ENTRIES, estimate_document_size, expand_entries, pack_month
+
+
+def _entries(n):
+    return [
+        {"id": f"doc{i}", "type": "Dépense", "amount": float(i), "category": "Transport",
+         "date": f"2024-03-{1 + i % 28:02d}", "description": "x" * 50}
+        for i in range(n)
+    ]
+
+
+def test_pack_then_expand_restores_original_entries():
+    entries = _entries(20)
+    entries[3].pop("description")  # champ absent sur une transaction héritée
+
+    packed = pack_month("2024-03", entries)
+    assert len(packed) == 1
+
+    docs = [{**data, "id": doc_id} for doc_id, data in packed]
+    assert expand_entries(docs) == entries
+
+
+def test_large_month_spills_over_into_parts_under_the_size_limit():
+    max_bytes = 2_000
+    packed = pack_month("2024-03", _entries(100), max_bytes=max_bytes)
+
+    assert len(packed) > 1
+    assert [doc_id for doc_id, _ in packed][:2] == ["bucket_2024-03_0", "bucket_2024-03_1"]
+    assert sum(data["count"] for _, data in packed) == 100
+    for doc_id, data in packed:
+        assert estimate_document_size(data, doc_id) < max_bytes + 500
+
+
+def test_month_of_small_entries_spills_over_under_the_index_entry_limit():
+    # Transactions minuscules : loin de 1 Mio, mais 6 valeurs indexées chacune.
+    entries = [{"id": f"d{i}", "type": "Dépense", "amount": 1.0, "category": "A", "date": "2024-03-01",
+                "description": ""} for i in range(5_000)]
+    packed = pack_month("2024-03", entries)
+
+    assert len(packed) > 1
+    for _doc_id, data in packed:
+        indexed = len(data["ids"]) + sum(len(values) for values in data["columns"].values())
+        assert indexed <= MAX_BUCKET_INDEX_ENTRIES
+    docs = [{**data, "id": doc_id} for doc_id, data in packed]
+    assert expand_entries(docs) == entries
+
+
+def test_individual_document_wins_over_its_bucket_copy():
+    entries = _entries(3)
+    docs = [{**data, "id": doc_id} for doc_id, data in pack_month("2024-03", entries)]
+    docs.append({**entries[1], "amount": 999.0})  # original pas encore supprimé
+
+    expanded = expand_entries(docs)
+    assert sorted(e["id"] for e in expanded) == ["doc0", "doc1", "doc2"]
+    assert next(e for e in expanded if e["id"] == "doc1")["amount"] == 999.0
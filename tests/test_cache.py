@@ -0,0 +1,115 @@
+"""Tests du cache partagé (cache.py) : lecture à travers les niveaux,
+expiration, éviction disque, calcul unique par clé et entre répliques."""
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import cache
+
+
+@pytest.fixture
+def disk(tmp_path):
+    return cache.SQLiteTier(str(tmp_path / "cache.sqlite"))
+
+
+def test_slower_tier_hit_is_copied_to_faster_tiers(disk):
+    first = cache.TieredCache([cache.MemoryTier(), disk])
+    assert first.get_or_compute("t", "k", lambda: {"rate": 655.957}, ttl=60) == {"rate": 655.957}
+
+    # Autre processus, même machine : mémoire vide, disque partagé.
+    memory = cache.MemoryTier()
+    second = cache.TieredCache([memory, disk])
+    calls = []
+    assert second.get_or_compute("t", "k", lambda: calls.append(1), ttl=60) == {"rate": 655.957}
+    assert calls == []
+    assert memory.get("k")[0] == {"rate": 655.957}
+
+
+def test_expired_entries_are_recomputed(disk):
+    tiered = cache.TieredCache([cache.MemoryTier(), disk])
+    tiered.get_or_compute("t", "k", lambda: 1, ttl=-1)
+    assert tiered.get_or_compute("t", "k", lambda: 2, ttl=60) == 2
+
+
+def test_disk_tier_evicts_least_recently_read_entries(tmp_path):
+    disk = cache.SQLiteTier(str(tmp_path / "cache.sqlite"), max_bytes=3_000)
+    expires = time.time() + 60
+    for key in ("a", "b", "c"):
+        disk.set(key, b"x" * 900, expires)
+        time.sleep(0.01)
+    disk.get("a")
+    disk.set("d", b"x" * 900, expires)
+    assert disk.get("b") is None
+    assert disk.get("a") is not None and disk.get("d") is not None
+
+
+def test_concurrent_misses_compute_once():
+    tiered = cache.TieredCache([cache.MemoryTier()])
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return 42
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(tiered.get_or_compute("t", "k", slow, 60)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [42] * 8
+    assert calls == [1]
+
+
+def test_replicas_sharing_redis_compute_once():
+    shared = cache.RedisTier(cache.LocalRedisStandIn())
+    replicas = [cache.TieredCache([cache.MemoryTier(), shared]) for _ in range(3)]
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.3)
+        return "prévision"
+
+    results = []
+    threads = [threading.Thread(target=lambda r=r: results.append(r.get_or_compute("t", "k", slow, 60)))
+               for r in replicas]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["prévision"] * 3
+    assert calls == [1]
+
+
+def test_cached_decorator_keys_on_series_content(monkeypatch):
+    monkeypatch.setattr(cache, "_shared_cache", cache.TieredCache([cache.MemoryTier()]))
+    calls = []
+
+    @cache.cached("test_series", ttl=60)
+    def total(series):
+        calls.append(1)
+        return float(series.sum())
+
+    assert total(pd.Series([1.0, 2.0])) == 3.0
+    assert total(pd.Series([1.0, 2.0])) == 3.0
+    assert total(pd.Series([1.0, 5.0])) == 6.0
+    assert calls == [1, 1]
+    row = next(r for r in cache.stats() if r["espace"] == "test_series")
+    assert row["hits mémoire"] >= 1 and row["calculs"] >= 2
+
+
+def test_values_rejected_by_cache_if_are_not_stored():
+    tiered = cache.TieredCache([cache.MemoryTier()])
+    ok = lambda value: value["available"]
+    assert tiered.get_or_compute("t", "k", lambda: {"available": False}, 60, cache_if=ok) == {"available": False}
+    assert tiered.get_or_compute("t", "k", lambda: {"available": True}, 60, cache_if=ok) == {"available": True}
+    assert tiered.get_or_compute("t", "k", lambda: {"available": False}, 60, cache_if=ok) == {"available": True}
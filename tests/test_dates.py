@@ -0,0 +1,39 @@
+"""Tests de la conversion des dates Firestore (dates.py) : horodatages natifs
+et chaînes héritées mélangées doivent donner les mêmes jours calendaires."""
+import os
+import sys
+from datetime import date, datetime, timezone
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dates import to_firestore_datetime, to_naive_datetime_series
+
+
+def test_calendar_date_is_stored_as_utc_midnight():
+    assert to_firestore_datetime(date(2024, 5, 31)) == datetime(2024, 5, 31, tzinfo=timezone.utc)
+
+
+def test_mixed_typed_and_legacy_values_convert_to_naive_datetimes():
+    series = pd.Series([
+        to_firestore_datetime(date(2024, 5, 31)),
+        "2024-06-01",
+        "2024-06-02T08:15:00",
+        None,
+    ])
+    converted = to_naive_datetime_series(series)
+
+    assert list(converted[:3]) == [
+        pd.Timestamp("2024-05-31"),
+        pd.Timestamp("2024-06-01"),
+        pd.Timestamp("2024-06-02 08:15:00"),
+    ]
+    assert pd.isna(converted[3])
+
+
+def test_fully_typed_column_keeps_its_dtype_without_timezone():
+    series = pd.DataFrame({"date": [to_firestore_datetime(date(2024, 1, d)) for d in (1, 2)]})["date"]
+    converted = to_naive_datetime_series(series)
+    assert pd.api.types.is_datetime64_any_dtype(converted)
+    assert converted.dt.tz is None
@@ -0,0 +1,92 @@
+"""Tests des lectures parallèles de DBClient (fetch_concurrently) : exécution
+simultanée, délai commun avec repli sur le dernier résultat connu (jamais un
+résultat vide d'erreur), pool de threads borné, et étiquettes
+d'instrumentation propagées aux threads."""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import instrumentation
+import temp_db_client
+from temp_db_client import DBClient
+
+
+class SlowClient(DBClient):
+    """DBClient sans Firestore : chaque lecture attend delays[collection]."""
+
+    def __init__(self, delays):
+        super().__init__()
+        self.delays = delays
+        self.contexts = []
+        self.failing = set()
+
+    def get_entries(self, collection):
+        self.contexts.append(instrumentation.get_render_context())
+        time.sleep(self.delays[collection])
+        if collection in self.failing:
+            return []  # comme get_entries après une erreur Firestore
+        return [{"id": collection}]
+
+
+def test_independent_reads_run_in_parallel_with_the_caller_context():
+    client = SlowClient({"investments_u": 0.3, "snapshots_u": 0.3})
+    instrumentation.set_render_context(page="🚀 Investissements", role="user")
+    start = time.perf_counter()
+    results, stale = client.fetch_concurrently({
+        "investments": ("get_entries", "investments_u"),
+        "snapshots": ("get_entries", "snapshots_u"),
+    })
+    assert time.perf_counter() - start < 0.55
+    assert results == {"investments": [{"id": "investments_u"}], "snapshots": [{"id": "snapshots_u"}]}
+    assert stale == set()
+    assert client.contexts == [("🚀 Investissements", "user")] * 2
+
+
+def test_slow_read_falls_back_to_its_last_result_after_the_deadline():
+    client = SlowClient({"investments_u": 0.0, "snapshots_u": 0.0})
+    requests = {"investments": ("get_entries", "investments_u"), "snapshots": ("get_entries", "snapshots_u")}
+    client.fetch_concurrently(requests)
+
+    client.delays["snapshots_u"] = 0.5
+    start = time.perf_counter()
+    results, stale = client.fetch_concurrently(requests, deadline=0.1)
+    assert time.perf_counter() - start < 0.4
+    assert stale == {"snapshots"}
+    assert results["snapshots"] == [{"id": "snapshots_u"}]
+
+
+def test_read_without_a_previous_result_is_awaited():
+    client = SlowClient({"investments_u": 0.3})
+    results, stale = client.fetch_concurrently({"investments": ("get_entries", "investments_u")}, deadline=0.05)
+    assert results["investments"] == [{"id": "investments_u"}]
+    assert stale == set()
+
+
+def test_empty_result_of_a_failed_read_is_not_served_as_stale():
+    client = SlowClient({"investments_u": 0.0})
+    requests = {"investments": ("get_entries", "investments_u")}
+    client.fetch_concurrently(requests)
+
+    client.failing.add("investments_u")
+    client.fetch_concurrently(requests)
+    client.failing.clear()
+
+    client.delays["investments_u"] = 0.3
+    results, stale = client.fetch_concurrently(requests, deadline=0.05)
+    assert stale == {"investments"}
+    assert results["investments"] == [{"id": "investments_u"}]
+
+
+def test_slow_reads_share_a_bounded_pool_and_are_not_relaunched():
+    count = 3 * temp_db_client.FETCH_MAX_WORKERS
+    client = SlowClient({f"c{i}": 0.1 for i in range(count)})
+    futures = [client._start_fetch(None, ("p", "r"), ("get_entries", f"c{i}")) for i in range(count)]
+    # Lecture identique encore en cours : même future, pas de second appel.
+    assert client._start_fetch(None, ("p", "r"), ("get_entries", "c0")) is futures[0]
+    assert len(client._fetch_pool._threads) <= temp_db_client.FETCH_MAX_WORKERS
+
+    assert [future.result()[0]["id"] for future in futures] == [f"c{i}" for i in range(count)]
+    assert len(client.contexts) == count
@@ -0,0 +1,64 @@
+"""Tests du graphe des vues dérivées (derived.py) : un nœud n'est recalculé
+que si une version amont ou un paramètre change."""
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from derived import DerivedGraph, data_version
+
+
+def test_node_is_reused_until_its_source_version_changes():
+    graph = DerivedGraph()
+    calls = []
+
+    def total(entries):
+        calls.append(1)
+        return sum(e["amount"] for e in entries)
+
+    graph.set_source("entries", [{"amount": 1}], version=(1, "t1"))
+    assert graph.compute("total", total, deps=("entries",)) == 1
+    graph.set_source("entries", [{"amount": 1}], version=(1, "t1"))
+    assert graph.compute("total", total, deps=("entries",)) == 1
+    assert len(calls) == 1
+
+    graph.set_source("entries", [{"amount": 1}, {"amount": 2}], version=(2, "t2"))
+    assert graph.compute("total", total, deps=("entries",)) == 3
+    assert len(calls) == 2
+    assert graph.stats()[1]["dernier rerun"] == "amont modifié : entries"
+
+
+def test_parameter_change_recomputes_only_that_node():
+    graph = DerivedGraph()
+    graph.set_source("entries", [1, 2], version=(2, None))
+    graph.compute("label", lambda entries: f"{len(entries)} XOF", deps=("entries",), params=("XOF",))
+    assert graph.compute("label", lambda entries: f"{len(entries)} EUR", deps=("entries",), params=("EUR",)) == "2 EUR"
+
+
+def test_data_version_uses_count_and_latest_server_timestamp():
+    old = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    new = datetime(2024, 2, 1, tzinfo=timezone.utc)
+    entries = [{"server_timestamp": new}, {"server_timestamp": old}, {}]
+    assert data_version(entries) == (3, new.isoformat())
+
+
+def test_idle_sessions_are_evicted_least_recently_used_first(monkeypatch):
+    import derived
+
+    monkeypatch.setattr(derived, "_registry", {})
+    graphs = {}
+    for session_id, idle in (("old", 900), ("recent", 300), ("active", 5)):
+        graph = graphs[session_id] = DerivedGraph()
+        graph.set_source("entries", list(range(200_000)), version=(session_id,))
+        graph.last_used -= idle
+        derived.register_graph(session_id, graph)
+    size = graphs["old"].memory_bytes()
+    assert size > 0
+
+    # Budget pour deux graphes : seul le plus ancien est vidé ; une session
+    # active n'est jamais vidée, même au-delà du budget.
+    assert derived.enforce_memory_budget(budget=int(size * 2.5)) == 1
+    assert graphs["old"].memory_bytes() == 0 and graphs["recent"].memory_bytes() == size
+    assert derived.enforce_memory_budget(budget=0, current=graphs["recent"]) == 0
+    assert [row["vidages"] for row in derived.memory_stats()] == [0, 0, 1]
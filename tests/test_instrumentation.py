@@ -0,0 +1,41 @@
+"""Tests de l'instrumentation Firestore (instrumentation.py) : compteurs par
+(méthode, page, rôle) et export texte Prometheus."""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import instrumentation
+
+
+@instrumentation.instrumented
+def fake_get_entries(n):
+    instrumentation.record_reads(n, 100 * n)
+    return list(range(n))
+
+
+def test_calls_are_counted_per_page_and_role():
+    instrumentation.reset()
+    instrumentation.set_render_context(page="dashboard", role="admin")
+    fake_get_entries(3)
+    fake_get_entries(2)
+
+    rows = instrumentation.snapshot()
+    assert len(rows) == 1
+    row = rows[0]
+    assert (row["méthode"], row["page"], row["rôle"]) == ("fake_get_entries", "dashboard", "admin")
+    assert row["appels"] == 2
+    assert row["docs lus"] == 5
+    assert row["octets lus"] == 500
+
+
+def test_prometheus_export_contains_counters_and_histogram():
+    instrumentation.reset()
+    instrumentation.set_render_context(page="dashboard", role="user")
+    fake_get_entries(1)
+
+    text = instrumentation.to_prometheus_text()
+    labels = 'method="fake_get_entries",page="dashboard",role="user"'
+    assert f"probudget_firestore_documents_read_total{{{labels}}} 1" in text
+    assert f'probudget_firestore_latency_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+    assert f"probudget_firestore_latency_seconds_count{{{labels}}} 1" in text
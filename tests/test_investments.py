@@ -0,0 +1,45 @@
+"""Tests du simulateur d'intérêts composés et de la projection Monte Carlo
+(investments.py)."""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from investments import compound_interest_simulation, contribution_schedule, monte_carlo_simulation
+
+
+def _loop_balance(principal, annual_rate, months, contribution):
+    balance = principal
+    for _ in range(months):
+        balance = (balance + contribution) * (1 + annual_rate / 100 / 12)
+    return balance
+
+
+def test_closed_form_matches_the_monthly_loop():
+    df = compound_interest_simulation(1000, 8, 10, 100, symbol="FCFA")
+    assert list(df["Année"]) == [0.1] + [float(y) for y in range(1, 11)]
+    assert np.isclose(df["Solde (FCFA)"].iloc[0], _loop_balance(1000, 8, 1, 100), atol=0.01)
+    assert np.isclose(df["Solde (FCFA)"].iloc[-1], _loop_balance(1000, 8, 120, 100), atol=0.01)
+
+
+def test_zero_volatility_paths_match_the_deterministic_curve():
+    bands = monte_carlo_simulation(1000, 8, 0, 5, 100, n_paths=10)
+    expected = compound_interest_simulation(1000, 8, 5, 100)["Solde (FCFA)"].iloc[-1]
+    assert np.allclose(bands.iloc[-1][["P10", "P50", "P90"]], expected, atol=0.01)
+    assert bands["Versé"].iloc[-1] == 1000 + 100 * 60
+
+
+def test_percentile_bands_are_ordered_and_widen_over_time():
+    bands = monte_carlo_simulation(10_000, 8, 20, 20, contribution_schedule(500, 20, 3), n_paths=4000)
+    assert list(bands.index) == list(range(21))
+    assert (bands["P10"] <= bands["P50"]).all() and (bands["P50"] <= bands["P90"]).all()
+    spread = bands["P90"] - bands["P10"]
+    assert spread.iloc[-1] > spread.iloc[1] > 0
+
+
+def test_contribution_schedule_increases_each_year():
+    schedule = contribution_schedule(100, 2, annual_increase=10)
+    assert len(schedule) == 24
+    assert schedule[11] == 100 and np.isclose(schedule[12], 110)
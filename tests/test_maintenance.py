@@ -0,0 +1,174 @@
+"""Tests de maintenance.py : server_timestamp de rattrapage des documents
+hérités, et purge par pages des jetons "rester connecté" expirés."""
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import maintenance
+from maintenance import derive_server_timestamp
+
+
+def test_created_at_takes_precedence_over_date():
+    derived = derive_server_timestamp({"created_at": "2024-03-05", "date": "2024-01-01"})
+    assert derived == datetime(2024, 3, 5, tzinfo=timezone.utc)
+
+
+def test_falls_back_to_date_when_created_at_is_missing_or_invalid():
+    derived = derive_server_timestamp({"created_at": "pas une date", "date": "2024-01-01T10:30:00"})
+    assert derived == datetime(2024, 1, 1, 10, 30, tzinfo=timezone.utc)
+
+
+def test_unparseable_document_is_sorted_as_oldest():
+    assert derive_server_timestamp({}) == datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeSnapshot:
+    def __init__(self, path, data):
+        self.reference, self.data = path, data
+
+
+class FakeTokenQuery:
+    """Sous-ensemble de la requête de groupe de collections utilisée par la purge."""
+
+    def __init__(self, store, limit=None, after=None):
+        self.store, self._limit, self._after, self.cutoff = store, limit, after, None
+
+    def where(self, filter):
+        assert (filter.field_path, filter.op_string) == ("expires_at", "<")
+        self.cutoff = filter.value
+        return self
+
+    def order_by(self, field):
+        return self
+
+    def select(self, fields):
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def start_after(self, snapshot):
+        query = FakeTokenQuery(self.store, self._limit, snapshot.data["expires_at"])
+        query.cutoff = self.cutoff
+        return query
+
+    def stream(self):
+        self.store.pages += 1
+        matching = sorted(
+            (FakeSnapshot(path, data) for path, data in self.store.tokens.items()
+             if data["expires_at"] < self.cutoff and (self._after is None or data["expires_at"] > self._after)),
+            key=lambda snapshot: snapshot.data["expires_at"],
+        )
+        return iter(matching[:self._limit])
+
+
+class FakeBatch:
+    def __init__(self, store):
+        self.store, self.paths = store, []
+
+    def delete(self, path):
+        self.paths.append(path)
+
+    def commit(self):
+        self.store.commits.append(len(self.paths))
+        for path in self.paths:
+            del self.store.tokens[path]
+
+
+class FakeTokenDB:
+    def __init__(self, tokens):
+        self.tokens, self.pages, self.commits = tokens, 0, []
+
+    def collection_group(self, name):
+        assert name == "remember_tokens"
+        return FakeTokenQuery(self)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def _tokens(expired, valid):
+    tokens = {f"users/u{i}/remember_tokens/old": {"expires_at": 100.0 + i} for i in range(expired)}
+    tokens.update({f"users/u{i}/remember_tokens/new": {"expires_at": 10_000.0 + i} for i in range(valid)})
+    return tokens
+
+
+def test_purge_deletes_only_expired_tokens_in_bounded_batches():
+    db = FakeTokenDB(_tokens(expired=7, valid=3))
+    deleted_before = maintenance.TOKEN_SWEEP_COUNTS["deleted"]
+    totals = maintenance.purge_expired_remember_tokens(db, batch_size=3, concurrency=2, now=1000.0, log=lambda *_: None)
+    assert totals == {"scanned": 7, "updated": 7}
+    assert sorted(db.commits) == [1, 3, 3]
+    assert all(path.endswith("/new") for path in db.tokens) and len(db.tokens) == 3
+    assert maintenance.TOKEN_SWEEP_COUNTS["deleted"] - deleted_before == 7
+
+
+def test_purge_dry_run_counts_without_deleting():
+    db = FakeTokenDB(_tokens(expired=4, valid=1))
+    totals = maintenance.purge_expired_remember_tokens(db, batch_size=2, now=1000.0, dry_run=True, log=lambda *_: None)
+    assert totals == {"scanned": 4, "updated": 0}
+    assert db.commits == [] and len(db.tokens) == 5
+
+
+class FakeDoc:
+    def __init__(self, doc_id, data):
+        self.id, self.data, self.reference = doc_id, data, doc_id
+
+    def to_dict(self):
+        return dict(self.data)
+
+
+class FakeCollection:
+    def __init__(self, name, docs):
+        self.id, self.docs = name, docs
+
+    def select(self, fields):
+        return self
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, count):
+        return self
+
+    def stream(self):
+        return iter(FakeDoc(doc_id, data) for doc_id, data in sorted(self.docs.items()))
+
+
+class FakeCollectionsDB:
+    def __init__(self, collections):
+        self._collections = {name: FakeCollection(name, docs) for name, docs in collections.items()}
+
+    def collections(self):
+        return list(self._collections.values())
+
+    def collection(self, name):
+        return self._collections[name]
+
+    def batch(self):
+        return FakeReadOnlyBatch()
+
+
+class FakeReadOnlyBatch:
+    def update(self, ref, updates):
+        pass
+
+    def commit(self):
+        raise AssertionError("le contrôle ne doit rien écrire")
+
+
+def test_missing_server_timestamps_are_counted_without_writing():
+    db = FakeCollectionsDB({
+        "entries_u1": {"a": {"server_timestamp": datetime(2024, 1, 1, tzinfo=timezone.utc)}, "b": {"date": "2023-05-01"}},
+        "investments_u1": {"c": {"created_at": "2022-01-01"}},
+    })
+    totals = maintenance.count_missing_server_timestamps(db, pause_seconds=0, log=lambda *_: None)
+    assert totals == {"scanned": 3, "updated": 0, "missing": 2}
+
+
+def test_walkers_skip_portfolio_snapshot_collections():
+    db = FakeCollectionsDB({"entries_u1": {}, "investments_u1": {}, "snapshots_u1": {}, "users": {}})
+    assert maintenance.list_user_collections(db) == ["entries_u1", "investments_u1"]
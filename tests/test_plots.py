@@ -0,0 +1,29 @@
+"""Tests du sous-échantillonnage LTTB (plots.lttb_indices) utilisé par la
+courbe de solde quotidien."""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from plots import lttb_indices
+
+
+def test_output_is_bounded_sorted_and_keeps_endpoints():
+    y = np.cumsum(np.random.default_rng(0).normal(size=5000))
+    indices = lttb_indices(y, 300)
+
+    assert len(indices) == 300
+    assert indices[0] == 0 and indices[-1] == len(y) - 1
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_isolated_spike_survives_downsampling():
+    y = np.zeros(2000)
+    y[1234] = 100.0
+    assert 1234 in lttb_indices(y, 50)
+
+
+def test_short_series_is_returned_in_full():
+    assert list(lttb_indices([1.0, 2.0, 3.0], 500)) == [0, 1, 2]
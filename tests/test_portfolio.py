@@ -0,0 +1,70 @@
+"""Tests du moteur de portefeuille (portfolio.py) : valeur, TWR, TRI,
+dérive d'allocation et mise à jour incrémentale."""
+import os
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from portfolio import PortfolioEngine, initial_snapshots, irr
+
+
+def _snap(snap_id, asset_id, value, flow, day):
+    return {"id": snap_id, "asset_id": asset_id, "value": value, "flow": flow,
+            "date": datetime(2024, 1, 1, tzinfo=timezone.utc).replace(month=day[0], day=day[1])}
+
+
+SNAPSHOTS = [
+    _snap("a0", "A", 1000.0, 1000.0, (1, 1)),
+    _snap("a1", "A", 1100.0, 0.0, (4, 1)),
+    # Apport de 1000 le 1er juillet : la valeur saute sans que ce soit du rendement.
+    _snap("a2", "A", 2310.0, 1000.0, (7, 1)),
+    _snap("b0", "B", 500.0, 500.0, (7, 1)),
+]
+
+
+def test_twr_ignores_the_timing_of_contributions():
+    engine = PortfolioEngine()
+    engine.add_snapshots(SNAPSHOTS)
+    assert list(engine.value_series()) == [1000.0, 1100.0, 2810.0]
+    # +10 % puis (2810 - 1500) / 1100 = +19.09 %
+    assert np.isclose(engine.time_weighted_return(), (1.1 * 1310 / 1100 - 1) * 100)
+
+
+def test_incremental_update_matches_a_full_rebuild():
+    incremental = PortfolioEngine()
+    incremental.add_snapshots(SNAPSHOTS[:2])
+    assert incremental.add_snapshots(SNAPSHOTS) == 2
+    assert incremental.add_snapshots(SNAPSHOTS) == 0
+
+    backdated = PortfolioEngine()
+    backdated.add_snapshots(SNAPSHOTS[2:])
+    backdated.add_snapshots(SNAPSHOTS[:2])
+
+    full = PortfolioEngine()
+    full.add_snapshots(SNAPSHOTS)
+    for engine in (incremental, backdated):
+        assert engine.value_series().equals(full.value_series())
+        assert np.isclose(engine.time_weighted_return(), full.time_weighted_return())
+
+
+def test_irr_solves_a_simple_annual_investment():
+    # 1000 investis, 1100 récupérés un an plus tard : 10 %.
+    assert np.isclose(irr([-1000, 1100], [0, 1]), 0.10)
+    assert irr([1000, 1100], [0, 1]) is None
+
+
+def test_allocation_drift_against_invested_amounts():
+    engine = PortfolioEngine()
+    engine.add_snapshots(SNAPSHOTS)
+    allocation = engine.allocation()
+    assert np.isclose(allocation.loc["A", "cible (%)"], 80.0)
+    assert np.isclose(allocation["dérive (pts)"].sum(), 0.0)
+
+
+def test_assets_without_snapshots_get_an_implicit_one():
+    assets = [{"id": "A", "initial_cost": 10, "current_value": 12}, {"id": "C", "initial_cost": 5, "current_value": 4}]
+    implicit = initial_snapshots(assets, SNAPSHOTS)
+    assert [(s["id"], s["value"], s["flow"]) for s in implicit] == [("initial_C", 4.0, 5.0)]
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+from streamlit.runtime.scriptrunner_utils.exceptions import RerunException, StopException
+
+import profiling
+
+
+@pytest.fixture
+def dump_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(profiling.PROFILE_DIR_ENV, str(tmp_path))
+    yield tmp_path
+    profiling.finish_rerun(profiling.current_profiler())
+
+
+def _run_script(abort_with=None):
+    profiler = profiling.start_rerun(True, dump=True)
+    try:
+        with profiling.section("chargement"):
+            if abort_with is not None:
+                raise abort_with
+    finally:
+        profiling.finish_rerun(profiler)
+    return profiler
+
+
+@pytest.mark.parametrize("abort", [StopException(), RerunException(None)])
+def test_aborted_rerun_releases_cprofile_for_next_rerun(dump_dir, abort):
+    with pytest.raises(type(abort)):
+        _run_script(abort_with=abort)
+    assert profiling.current_profiler() is None
+
+    profiler = _run_script()
+
+    assert not profiler.dump_skipped
+    assert len(list(dump_dir.glob("*.pstats"))) == 2
+
+
+def test_concurrent_dump_is_skipped_instead_of_raising(dump_dir):
+    first = profiling.start_rerun(True, dump=True)
+    result = {}
+
+    def other_session():
+        profiler = profiling.start_rerun(True, dump=True)
+        result["skipped"] = profiler.dump_skipped
+        result["path"] = profiler.finish()
+        profiling.finish_rerun(profiler)
+
+    thread = threading.Thread(target=other_session)
+    thread.start()
+    thread.join()
+
+    assert result == {"skipped": True, "path": None}
+    profiling.finish_rerun(first)
+    assert first.dump_path is not None
+    assert profiling.start_rerun(True, dump=True).dump_skipped is False
+
+
+def test_finish_is_idempotent(dump_dir):
+    profiler = profiling.start_rerun(True, dump=True)
+    path = profiler.finish()
+    assert profiler.finish() == path
+    assert len(list(dump_dir.glob("*.pstats"))) == 1
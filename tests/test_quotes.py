@@ -0,0 +1,116 @@
+"""Tests de l'actualisation des cours (quotes.py) : un appel par
+fournisseur, cache TTL, réévaluation et écritures groupées."""
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import quotes
+from portfolio import PortfolioEngine, initial_snapshots
+
+
+class CountingProvider(quotes.QuoteProvider):
+    name = "test"
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.calls = []
+
+    def fetch(self, symbols):
+        self.calls.append(list(symbols))
+        return {s: {"price": self.prices[s], "currency": "USD"} for s in symbols if s in self.prices}
+
+
+@pytest.fixture
+def provider():
+    quotes.clear_cache()
+    counting = CountingProvider({"AAPL": 200.0, "MSFT": 400.0})
+    quotes.register_provider(counting)
+    yield counting
+    quotes.clear_cache()
+
+
+ASSETS = [
+    {"id": "a", "ticker": "aapl", "quantity": 2, "initial_cost": 300.0, "current_value": 300.0, "quote_provider": "test"},
+    {"id": "b", "ticker": "MSFT", "quantity": 1, "initial_cost": 500.0, "current_value": 400.0, "quote_provider": "test"},
+    {"id": "c", "name": "Maison", "initial_cost": 1000.0, "current_value": 1200.0},
+]
+
+
+def test_distinct_tickers_are_fetched_in_one_call_then_cached(provider):
+    tickers = quotes.collect_tickers(ASSETS + [{"ticker": "AAPL", "quote_provider": "test"}])
+    assert tickers == {"test": {"AAPL", "MSFT"}}
+    quotes.fetch_quotes(tickers)
+    quotes.fetch_quotes(tickers)
+    assert provider.calls == [["AAPL", "MSFT"]]
+
+
+def test_revalue_assets_converts_and_keeps_only_changed_values(provider, monkeypatch):
+    monkeypatch.setattr(quotes, "get_exchange_rate", lambda src, dst: 600.0 if (src, dst) == ("USD", "XOF") else 1.0)
+    fetched = quotes.fetch_quotes(quotes.collect_tickers(ASSETS))
+
+    in_usd = quotes.revalue_assets(ASSETS, fetched, "USD")
+    assert list(in_usd.index) == ["a"]  # MSFT vaut déjà 400 USD
+    assert in_usd.loc["a", "current_value"] == 400.0
+    assert in_usd.loc["a", "roi"] == pytest.approx(100 / 3)
+
+    in_xof = quotes.revalue_assets(ASSETS, fetched, "XOF")
+    assert in_xof.loc["b", "current_value"] == 240_000.0
+
+
+def test_file_stub_provider_reads_local_quotes(tmp_path):
+    path = tmp_path / "quotes.json"
+    path.write_text(json.dumps({"SNTS": {"price": 25500, "currency": "XOF"}}), encoding="utf-8")
+    fetched = quotes.FileQuoteProvider(str(path)).fetch(["SNTS", "UNKNOWN"])
+    assert list(fetched) == ["SNTS"]
+    assert fetched["SNTS"]["price"] == 25500.0
+
+
+class RecordingDB:
+    def __init__(self, snapshots=()):
+        self.snapshots = [dict(s) for s in snapshots]
+        self.updates, self.added, self.writes = {}, [], []
+
+    def get_entries(self, collection):
+        return [dict(s) for s in self.snapshots]
+
+    def set_entries(self, collection, entries):
+        self.writes.append(("set", list(entries)))
+        self.snapshots += [{**entry, "id": doc_id} for doc_id, entry in entries.items()]
+        return True
+
+    def update_entries(self, collection, updates):
+        self.updates[collection] = updates
+        return True
+
+    def add_entries(self, collection, entries):
+        self.writes.append(("add", [s["asset_id"] for s in entries]))
+        self.added.append((collection, entries))
+        self.snapshots += [{**entry, "id": f"s{len(self.snapshots)}"} for entry in entries]
+        return True
+
+
+def test_refresh_user_portfolio_writes_values_and_snapshots_in_batches(provider):
+    tracked = [{"id": "s0", "asset_id": "a", "value": 300.0, "flow": 300.0,
+                "date": datetime(2024, 1, 1, tzinfo=timezone.utc)}]
+    db = RecordingDB(tracked)
+    assert quotes.refresh_user_portfolio(db, "u1", "USD", assets=ASSETS) == 1
+    assert db.updates["investments_u1"]["a"]["current_value"] == 400.0
+    assert [(c, [s["asset_id"] for s in entries]) for c, entries in db.added] == [("snapshots_u1", ["a"])]
+    assert db.writes == [("add", ["a"])]
+
+
+def test_refreshing_a_legacy_asset_keeps_its_implicit_snapshot_and_irr(provider):
+    legacy = [{**ASSETS[0], "server_timestamp": datetime(2024, 1, 1, tzinfo=timezone.utc)}]
+    db = RecordingDB()
+    assert quotes.refresh_user_portfolio(db, "u1", "USD", assets=legacy) == 1
+    assert db.writes == [("set", ["initial_a"]), ("add", ["a"])]
+
+    engine = PortfolioEngine()
+    engine.add_snapshots(db.snapshots + initial_snapshots(legacy, db.snapshots))
+    assert engine.money_weighted_return() is not None
+    assert engine.money_weighted_return() > 0
@@ -0,0 +1,61 @@
+"""Tests de l'index de recherche de l'historique (search.py)."""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from search import SearchIndex, tokenize
+
+
+def _frame(rows):
+    return pd.DataFrame(
+        {
+            "id": [r[0] for r in rows],
+            "category": [r[1] for r in rows],
+            "description": [r[2] for r in rows],
+            "amount": [r[3] for r in rows],
+            "justificatif_name": "Aucun justificatif",
+        },
+        index=pd.DatetimeIndex([r[4] for r in rows], name="date"),
+    )
+
+
+ROWS = [
+    ("a", "Alimentation", "Café de la gare", 1_500.0, "2024-01-05"),
+    ("b", "Loisirs", "Restaurant Le Délice", 25_000.0, "2024-02-10"),
+    ("c", "Santé", "Pharmacie du marché", 8_000.0, "2024-03-15"),
+    ("d", "Alimentation", "Marché central", 12_000.0, "2024-03-20"),
+]
+
+
+def test_tokenize_drops_accents_case_and_stop_words():
+    assert tokenize("Café de l'Élysée") == ["cafe", "elysee"]
+
+
+def test_prefix_search_is_accent_insensitive_and_sorted_recent_first():
+    index = SearchIndex()
+    index.update(_frame(ROWS))
+    assert index.search("marche") == ["d", "c"]
+    assert index.search("resta") == ["b"]
+    assert index.search("CAFÉ") == ["a"]
+    assert index.search("pharma marc") == ["c"]
+    assert index.search("aucun") == []
+
+
+def test_amount_and_date_filters():
+    index = SearchIndex()
+    index.update(_frame(ROWS))
+    assert index.search(amount_min=10_000) == ["d", "b"]
+    assert index.search("alim", date_min="2024-03-01", date_max="2024-03-20") == ["d"]
+
+
+def test_update_is_incremental_and_bounded():
+    index = SearchIndex(max_entries=3)
+    assert index.update(_frame(ROWS[:2])) == 2
+    assert index.update(_frame(ROWS[:2])) == 0
+    # Au-delà de max_entries, seules les plus récentes sont gardées.
+    index.update(_frame(ROWS))
+    assert len(index) == 3
+    assert index.search("cafe") == []
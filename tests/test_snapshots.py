@@ -0,0 +1,78 @@
+"""Tests des instantanés locaux du DataFrame préparé (snapshots.py)."""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import snapshots
+from analysis import prepare_dashboard_data
+
+
+def _entries(n=40):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {"id": f"e{i}", "type": "Revenu" if i % 5 == 0 else "Dépense", "amount": 1000.0 + i,
+         "category": "Transport" if i % 2 else "Alimentation", "date": start + timedelta(days=i),
+         "server_timestamp": start + timedelta(days=i), "description": None if i % 3 else "taxi"}
+        for i in range(n)
+    ]
+
+
+class CountingDB:
+    def __init__(self, entries):
+        self.entries = entries
+        self.calls = 0
+
+    def get_entries(self, collection):
+        self.calls += 1
+        return list(self.entries)
+
+
+def test_snapshot_round_trip_matches_the_prepared_frame(tmp_path):
+    df, monthly = prepare_dashboard_data(_entries())
+    assert snapshots.save_snapshot("u1", (40, "2024-02-09"), df, str(tmp_path))
+    loaded_df, loaded_monthly = snapshots.load_snapshot("u1", (40, "2024-02-09"), str(tmp_path))
+    pd.testing.assert_frame_equal(loaded_df, df)
+    pd.testing.assert_series_equal(loaded_monthly.profit, monthly.profit)
+    assert snapshots.load_snapshot("u1", (41, "2024-02-10"), str(tmp_path)) is None
+
+
+def test_cold_start_reads_the_snapshot_instead_of_firestore(tmp_path, monkeypatch):
+    monkeypatch.setenv(snapshots.SNAPSHOT_DIR_ENV, str(tmp_path))
+    db = CountingDB(_entries())
+    first, _ = snapshots.load_prepared(db, "entries_u1", "u1", (40, "v"))
+    second, _ = snapshots.load_prepared(db, "entries_u1", "u1", (40, "v"))
+    assert db.calls == 1
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_new_version_replaces_the_previous_one_and_old_files_expire(tmp_path):
+    df, _ = prepare_dashboard_data(_entries())
+    snapshots.save_snapshot("u1", (40, "a"), df, str(tmp_path))
+    snapshots.save_snapshot("u2", (40, "a"), df, str(tmp_path))
+    snapshots.save_snapshot("u1", (41, "b"), df, str(tmp_path))
+    remaining = sorted(os.listdir(tmp_path))
+    assert remaining == sorted(os.path.basename(snapshots.snapshot_path(uid, version, str(tmp_path)))
+                               for uid, version in (("u1", (41, "b")), ("u2", (40, "a"))))
+
+    old = snapshots.snapshot_path("u2", (40, "a"), str(tmp_path))
+    os.utime(old, (0, 0))
+    assert snapshots.purge_stale_snapshots(str(tmp_path)) == 1
+    assert not os.path.exists(old)
+
+
+def test_snapshot_from_another_format_is_a_cache_miss(tmp_path, monkeypatch):
+    df, _ = prepare_dashboard_data(_entries())
+    snapshots.save_snapshot("u1", (40, "a"), df, str(tmp_path))
+    monkeypatch.setattr(snapshots, "SNAPSHOT_FORMAT_VERSION", snapshots.SNAPSHOT_FORMAT_VERSION + 1)
+    assert snapshots.load_snapshot("u1", (40, "a"), str(tmp_path)) is None
+
+    # Même clé, mais colonnes d'un ancien code (chaînes au lieu de catégories).
+    legacy = df.astype({"type": "object", "category": "object"})
+    snapshots.save_snapshot("u1", (40, "a"), legacy, str(tmp_path))
+    path = snapshots.snapshot_path("u1", (40, "a"), str(tmp_path))
+    assert snapshots.load_snapshot("u1", (40, "a"), str(tmp_path)) is None
+    assert not os.path.exists(path)
@@ -0,0 +1,93 @@
+"""Tests du limiteur de connexion (throttle.py) sous une rafale simulée de
+1000 tentatives par seconde : refus avant Firestore, verrouillage écrit une
+seule fois."""
+import os
+import sys
+
+import bcrypt
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import throttle
+import users
+from cache import LocalRedisStandIn
+
+EMAIL = "awa@example.com"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingDB:
+    def __init__(self):
+        self.reads = 0
+        self.writes = []
+        self.user = {"role": "user", "password_hash": bcrypt.hashpw(b"bon-mot-de-passe", bcrypt.gensalt(4)).decode()}
+
+    def get_user(self, email):
+        self.reads += 1
+        return dict(self.user)
+
+    def update_user(self, email, updates):
+        self.writes.append(updates)
+        self.user.update(updates)
+        return True
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    throttle.set_login_throttle(throttle.LoginThrottle(clock=clock))
+    yield clock
+    throttle.set_login_throttle(None)
+
+
+def _burst(clock, attempt, count=1000, per_second=1000):
+    allowed = 0
+    for i in range(count):
+        allowed += bool(attempt(i))
+        clock.now += 1 / per_second
+    return allowed
+
+
+def test_burst_on_one_account_reaches_firestore_only_within_the_bucket(clock, monkeypatch):
+    monkeypatch.setattr(users, "_client_address", lambda: "203.0.113.7")
+    db = CountingDB()
+    _burst(clock, lambda i: users.login(EMAIL, f"essai-{i}", db))
+    # 5 tentatives d'affilée, la 5e verrouille le compte : une seule écriture.
+    assert db.reads == throttle.EMAIL_BURST
+    assert len(db.writes) == 1 and db.writes[0]["failed_attempts"] == users.MAX_LOGIN_ATTEMPTS
+    assert db.writes[0]["locked_until"] is not None
+
+
+def test_burst_across_many_accounts_is_bounded_by_client_address(clock):
+    limiter = throttle.get_login_throttle()
+    allowed = _burst(clock, lambda i: limiter.allow(f"user{i}@example.com", "203.0.113.7"))
+    assert allowed == throttle.ADDRESS_BURST
+
+    # Une autre adresse n'est pas pénalisée, et le seau se recharge avec le temps.
+    assert limiter.allow("nouveau@example.com", "198.51.100.1") is True
+    clock.now += 1 / throttle.ADDRESS_REFILL_PER_SECOND
+    assert limiter.allow("encore@example.com", "203.0.113.7") is True
+
+
+def test_failures_below_threshold_are_not_written(clock, monkeypatch):
+    monkeypatch.setattr(users, "_client_address", lambda: None)
+    db = CountingDB()
+    for _ in range(users.MAX_LOGIN_ATTEMPTS - 1):
+        users.login(EMAIL, "mauvais", db)
+        clock.now += 60
+    assert db.writes == []
+
+
+def test_shared_limit_applies_across_replicas():
+    client = LocalRedisStandIn()
+    replicas = [throttle.LoginThrottle(shared_client=client) for _ in range(3)]
+    allowed = sum(replica.allow(EMAIL) for replica in replicas for _ in range(throttle.EMAIL_BURST))
+    assert allowed == throttle.SHARED_EMAIL_LIMIT
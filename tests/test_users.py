@@ -0,0 +1,72 @@
+"""Tests de la reconnexion "rester connecté" (users.try_remember_me_login) :
+lecture groupée du compte et du jeton, puis cache des jetons vérifiés."""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+import streamlit as st
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import users
+
+EMAIL = "awa@example.com"
+TOKEN = "jeton-de-test"
+
+
+class FakeCookies:
+    def get(self, cookie):
+        return f"{EMAIL}:{TOKEN}"
+
+
+class FakeDB:
+    def __init__(self, locked=False):
+        self.calls = 0
+        self.user = {"role": "user", "base_currency": "EUR", "alert_threshold": 80,
+                     "locked_until": datetime.now().timestamp() + 60 if locked else None}
+        token_id = users._hash_remember_token(TOKEN)
+        self.token = {"hash": token_id, "expires_at": datetime.now().timestamp() + 3600}
+
+    def get_user_and_remember_token(self, email, token_id):
+        self.calls += 1
+        return self.user, self.token
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    users.invalidate_verified_tokens(email=EMAIL)
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    yield
+    users.invalidate_verified_tokens(email=EMAIL)
+
+
+def test_reconnection_reads_firestore_once_then_uses_the_cache():
+    db = FakeDB()
+    users.try_remember_me_login(db, FakeCookies())
+    assert st.session_state["user"] == EMAIL and st.session_state["base_currency"] == "EUR"
+
+    del st.session_state["user"]
+    users.try_remember_me_login(db, FakeCookies())
+    assert st.session_state["user"] == EMAIL
+    assert db.calls == 1
+
+    users.invalidate_verified_tokens(email=EMAIL)
+    users.try_remember_me_login(db, FakeCookies())
+    assert db.calls == 2
+
+
+def test_locked_account_is_neither_reconnected_nor_cached():
+    db = FakeDB(locked=True)
+    users.try_remember_me_login(db, FakeCookies())
+    users.try_remember_me_login(db, FakeCookies())
+    assert "user" not in st.session_state
+    assert db.calls == 2
+
+
+def test_cached_token_is_bound_to_its_email():
+    token_id = users._hash_remember_token(TOKEN)
+    users._remember_verified_token(token_id, EMAIL, {"role": "user"}, datetime.now().timestamp() + 3600)
+    assert users._lookup_verified_token(token_id, "autre@example.com") is None
+    assert users._lookup_verified_token(token_id, EMAIL) == {"role": "user"}
@@ -0,0 +1,79 @@
+"""Tests de la file d'écriture locale (write_queue.py) : durabilité,
+identifiants stables entre essais, attente exponentielle et fusion des
+opérations en attente avec les données lues."""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import write_queue
+from write_queue import WriteQueue, flush_once, merge_pending
+
+COLLECTION = "entries_u1"
+
+
+class FlakyDB:
+    """Refuse les failures premiers envois, puis écrit (par id de document)."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.docs = {}
+        self.calls = 0
+
+    def set_entries(self, collection, entries):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            return False
+        for doc_id, entry in entries.items():
+            self.docs[(collection, doc_id)] = entry
+        return True
+
+
+def test_enqueued_entries_survive_a_restart_and_keep_their_id(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    doc_id = WriteQueue(path).enqueue(COLLECTION, {"amount": 10.0})
+
+    reopened = WriteQueue(path)
+    assert reopened.pending(COLLECTION) == [{"amount": 10.0, "id": doc_id}]
+    db = FlakyDB()
+    assert flush_once(reopened, db) == 1
+    assert db.docs == {(COLLECTION, doc_id): {"amount": 10.0}}
+    assert reopened.pending(COLLECTION) == []
+
+
+def test_failed_flush_is_retried_with_backoff_under_the_same_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_queue.random, "uniform", lambda low, high: 1.0)
+    queue = WriteQueue(str(tmp_path / "queue.sqlite"))
+    doc_id = queue.enqueue(COLLECTION, {"amount": 5.0})
+    db = FlakyDB(failures=2)
+    now = time.time()
+
+    flush_once(queue, db, now=now)
+    count, error, next_attempt = queue.status(COLLECTION)
+    assert count == 1 and error and next_attempt == now + write_queue.BACKOFF_BASE_SECONDS
+
+    assert flush_once(queue, db, now=now + 1) == 0  # pas encore dû
+    flush_once(queue, db, now=now + 2)
+    assert queue.status(COLLECTION)[2] == now + 2 + 2 * write_queue.BACKOFF_BASE_SECONDS
+
+    flush_once(queue, db, now=now + 10)
+    assert db.calls == 3
+    assert list(db.docs) == [(COLLECTION, doc_id)]
+    assert queue.status(COLLECTION)[0] == 0
+
+
+def test_claimed_entries_are_not_sent_twice_while_leased(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    first, second = WriteQueue(path), WriteQueue(path)
+    first.enqueue(COLLECTION, {"amount": 1.0})
+    assert len(first.claim_due(now=1e10)) == 1
+    assert second.claim_due(now=1e10) == []
+    assert len(second.claim_due(now=1e10 + write_queue.LEASE_SECONDS)) == 1
+
+
+def test_merge_pending_skips_entries_already_written():
+    stored = [{"id": "a", "amount": 1.0}]
+    pending = [{"id": "b", "amount": 2.0}, {"id": "a", "amount": 1.0}]
+    assert [entry["id"] for entry in merge_pending(stored, pending)] == ["b", "a"]
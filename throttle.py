@@ -0,0 +1,182 @@
+"""Limitation des tentatives de connexion, appliquée avant tout accès à
+Firestore.
+
+Chaque tentative échouée coûtait une lecture (get_user) et une écriture
+(failed_attempts) : une rafale de "credential stuffing" se traduisait
+directement en charge et en coût Firestore. Désormais :
+
+- seaux à jetons en mémoire du processus, par email et par adresse du
+  client : une tentative au-delà du débit autorisé est refusée sans aucune
+  lecture ni écriture ;
+- partage optionnel entre répliques : si le cache partagé a un niveau Redis
+  ($PROBUDGET_REDIS_URL, voir cache.py), un compteur par fenêtre fixe y
+  complète les seaux locaux (consulté seulement si le seau local accepte) ;
+- les échecs sont comptés en mémoire (FailureCounter) : le verrouillage du
+  compte n'est écrit dans Firestore qu'au franchissement du seuil, en une
+  seule écriture au lieu d'une par échec.
+
+Les structures sont bornées (MAX_TRACKED_KEYS clés, LRU) : une clé évincée
+repart simplement d'un seau plein.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from instrumentation import register_counter
+
+# Par email : 5 tentatives d'affilée, puis 1 toutes les 12 s.
+EMAIL_BURST = 5
+EMAIL_REFILL_PER_SECOND = 1 / 12
+# Par adresse : 20 tentatives d'affilée (NAT, réseaux mobiles), puis 1 toutes les 3 s.
+ADDRESS_BURST = 20
+ADDRESS_REFILL_PER_SECOND = 1 / 3
+# Limites partagées entre répliques, par fenêtre fixe.
+SHARED_WINDOW_SECONDS = 60
+SHARED_EMAIL_LIMIT = 10
+SHARED_ADDRESS_LIMIT = 60
+# Échecs oubliés au-delà de cette durée sans nouvel échec.
+FAILURE_WINDOW_SECONDS = 15 * 60
+MAX_TRACKED_KEYS = 10_000
+
+# Décisions du limiteur : "allowed", "rejected_email", "rejected_address",
+# "rejected_shared", et "lockout_writes" (verrouillages écrits).
+THROTTLE_COUNTS = Counter()
+register_counter(
+    "probudget_login_throttle_total",
+    "Tentatives de connexion acceptées / refusées par le limiteur, verrouillages écrits.",
+    "event", THROTTLE_COUNTS,
+)
+
+
+class BucketLimiter:
+    """Seaux à jetons par clé : capacity tentatives d'affilée, rechargées
+    de refill_per_second jeton(s) par seconde."""
+
+    def __init__(self, capacity, refill_per_second, max_keys=MAX_TRACKED_KEYS, clock=time.monotonic):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # clé -> (jetons, instant de la dernière mise à jour)
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Consomme un jeton de key ; False si le seau est vide."""
+        with self._lock:
+            now = self.clock()
+            tokens, updated_at = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+
+class SharedWindowLimiter:
+    """Compteur par fenêtre fixe dans Redis (INCR + EXPIRE), commun à toutes
+    les répliques. Clés hachées : pas d'email en clair dans Redis. En cas
+    d'erreur Redis, la tentative est acceptée (les seaux locaux restent)."""
+
+    def __init__(self, client, scope, limit, window_seconds=SHARED_WINDOW_SECONDS, prefix="probudget:throttle:"):
+        self.client = client
+        self.scope = scope
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.prefix = prefix
+
+    def allow(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+        name = f"{self.prefix}{self.scope}:{digest}:{int(time.time() // self.window_seconds)}"
+        try:
+            count = self.client.incr(name)
+            if count == 1:
+                self.client.expire(name, self.window_seconds * 2)
+            return count <= self.limit
+        except Exception:
+            return True
+
+
+class FailureCounter:
+    """Échecs de connexion récents par email, en mémoire du processus."""
+
+    def __init__(self, window_seconds=FAILURE_WINDOW_SECONDS, max_keys=MAX_TRACKED_KEYS, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.clock = clock
+        self._failures = OrderedDict()  # email -> (nombre, dernier échec)
+        self._lock = threading.Lock()
+
+    def add(self, email):
+        """Enregistre un échec ; retourne le nombre d'échecs récents."""
+        with self._lock:
+            now = self.clock()
+            count, last = self._failures.pop(email, (0, now))
+            if now - last > self.window_seconds:
+                count = 0
+            self._failures[email] = (count + 1, now)
+            while len(self._failures) > self.max_keys:
+                self._failures.popitem(last=False)
+            return count + 1
+
+    def clear(self, email):
+        with self._lock:
+            self._failures.pop(email, None)
+
+
+class LoginThrottle:
+    """Limiteur de connexion du processus : seaux par email et par adresse,
+    limites partagées optionnelles, et compteur d'échecs."""
+
+    def __init__(self, shared_client=None, clock=time.monotonic):
+        self.by_email = BucketLimiter(EMAIL_BURST, EMAIL_REFILL_PER_SECOND, clock=clock)
+        self.by_address = BucketLimiter(ADDRESS_BURST, ADDRESS_REFILL_PER_SECOND, clock=clock)
+        self.shared = []
+        if shared_client is not None:
+            self.shared = [
+                ("email", SharedWindowLimiter(shared_client, "email", SHARED_EMAIL_LIMIT)),
+                ("address", SharedWindowLimiter(shared_client, "address", SHARED_ADDRESS_LIMIT)),
+            ]
+        self.failures = FailureCounter(clock=clock)
+
+    def allow(self, email, address=None):
+        """True si une tentative pour (email, adresse) peut aller jusqu'à
+        Firestore. Adresse inconnue (None) : seul l'email est limité, pour ne
+        pas faire partager un même seau à tous les clients."""
+        if not self.by_email.allow(email):
+            THROTTLE_COUNTS["rejected_email"] += 1
+            return False
+        if address and not self.by_address.allow(address):
+            THROTTLE_COUNTS["rejected_address"] += 1
+            return False
+        keys = {"email": email, "address": address}
+        for scope, limiter in self.shared:
+            if keys[scope] and not limiter.allow(keys[scope]):
+                THROTTLE_COUNTS["rejected_shared"] += 1
+                return False
+        THROTTLE_COUNTS["allowed"] += 1
+        return True
+
+
+_login_throttle = None
+_login_throttle_lock = threading.Lock()
+
+
+def get_login_throttle():
+    """Limiteur du processus, partagé via le Redis du cache s'il est configuré."""
+    global _login_throttle
+    with _login_throttle_lock:
+        if _login_throttle is None:
+            from cache import shared_redis_client
+            _login_throttle = LoginThrottle(shared_client=shared_redis_client())
+        return _login_throttle
+
+
+def set_login_throttle(throttle):
+    """Remplace le limiteur du processus (tests, configuration explicite)."""
+    global _login_throttle
+    with _login_throttle_lock:
+        _login_throttle = throttle
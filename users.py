@@ -3,11 +3,15 @@ import secrets
 import hashlib
 import hmac
 import smtplib
+import threading
+import time
+from collections import OrderedDict
 from email.message import EmailMessage
 import streamlit as st
 import bcrypt
 from datetime import datetime, timedelta
 from currency import DEFAULT_ALERT_THRESHOLDS
+from throttle import THROTTLE_COUNTS, get_login_throttle
 
 EMAIL_REGEX = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 
@@ -20,6 +24,62 @@ REMEMBER_COOKIE_NAME = "pb_remember_token"
 REMEMBER_TOKEN_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 jours
 
 
+# Jetons déjà vérifiés, gardés en mémoire du processus pour qu'une
+# reconnexion (onglet mobile rechargé après l'appareil photo, etc.) n'aille
+# pas relire Firestore. Clé : hash du jeton ; valeur : email, champs de
+# session et échéance. Bornée et de courte durée, car chaque réplique a la
+# sienne : une invalidation (déconnexion, verrouillage, nouveau mot de passe,
+# paramètres modifiés) n'atteint que le cache de la réplique qui la traite.
+VERIFIED_TOKEN_CACHE_TTL_SECONDS = 120
+VERIFIED_TOKEN_CACHE_MAX_ENTRIES = 1024
+_verified_tokens = OrderedDict()
+_verified_tokens_lock = threading.Lock()
+
+
+def _remember_verified_token(token_id, email, session_fields, token_expires_at):
+    expires_at = min(time.time() + VERIFIED_TOKEN_CACHE_TTL_SECONDS, token_expires_at)
+    with _verified_tokens_lock:
+        _verified_tokens[token_id] = (email, session_fields, expires_at)
+        _verified_tokens.move_to_end(token_id)
+        while len(_verified_tokens) > VERIFIED_TOKEN_CACHE_MAX_ENTRIES:
+            _verified_tokens.popitem(last=False)
+
+
+def _lookup_verified_token(token_id, email):
+    """Champs de session mis en cache pour ce jeton, ou None."""
+    with _verified_tokens_lock:
+        cached = _verified_tokens.get(token_id)
+        if cached is None:
+            return None
+        cached_email, session_fields, expires_at = cached
+        if time.time() >= expires_at:
+            del _verified_tokens[token_id]
+            return None
+        if not hmac.compare_digest(cached_email, email):
+            return None
+        return session_fields
+
+
+def invalidate_verified_tokens(email=None, token_id=None):
+    """Oublie les jetons vérifiés d'un appareil (token_id) ou de tous les
+    appareils d'un compte (email)."""
+    with _verified_tokens_lock:
+        if token_id is not None:
+            _verified_tokens.pop(token_id, None)
+        if email is not None:
+            for key in [k for k, (cached_email, _, _) in _verified_tokens.items() if cached_email == email]:
+                del _verified_tokens[key]
+
+
+def _session_fields(user_data):
+    base_currency = user_data.get('base_currency', 'XOF')
+    return {
+        'role': user_data.get('role', 'user'),
+        'base_currency': base_currency,
+        'alert_threshold': user_data.get('alert_threshold', DEFAULT_ALERT_THRESHOLDS.get(base_currency, 500)),
+    }
+
+
 def _hash_remember_token(token):
     # Un jeton haute entropie (secrets.token_urlsafe) est vérifié à chaque
     # chargement de page : sha256 suffit ici (contrairement au mot de passe,
@@ -38,20 +98,27 @@ def _compute_uid(email):
     return hashlib.sha256(email.encode('utf-8')).hexdigest()
 
 
-def _issue_remember_me_cookie(email, db, cookie_manager):
+def _issue_remember_me_cookie(email, db, cookie_manager, session_fields=None):
     """Génère un nouveau jeton, l'enregistre comme un nouveau document d'appareil
     dans users/<email>/remember_tokens/<tokenId> et pose le jeton en clair dans
     un cookie navigateur. Un document par appareil : se connecter sur un
-    nouvel appareil ne déconnecte pas les autres."""
+    nouvel appareil ne déconnecte pas les autres.
+
+    session_fields : si fourni, le jeton est aussi placé dans le cache des
+    jetons vérifiés (la première reconnexion ne relit pas Firestore)."""
     try:
         token = secrets.token_urlsafe(32)
         token_id = _hash_remember_token(token)
         now = datetime.now()
-        db.set_remember_token(email, token_id, {
+        expires_at = now.timestamp() + REMEMBER_TOKEN_TTL_SECONDS
+        if not db.set_remember_token(email, token_id, {
             "hash": token_id,
             "created_at": now.timestamp(),
-            "expires_at": now.timestamp() + REMEMBER_TOKEN_TTL_SECONDS,
-        })
+            "expires_at": expires_at,
+        }):
+            return
+        if session_fields is not None:
+            _remember_verified_token(token_id, email, session_fields, expires_at)
         cookie_manager.set(
             REMEMBER_COOKIE_NAME,
             f"{email}:{token}",
@@ -64,24 +131,15 @@ def _issue_remember_me_cookie(email, db, cookie_manager):
         pass
 
 
-def _purge_expired_remember_tokens(email, db):
-    """Supprime les jetons "rester connecté" expirés d'un utilisateur, pour ne
-    pas accumuler indéfiniment de documents dans la sous-collection. Best
-    effort : appelé à l'occasion d'une connexion réussie, jamais bloquant."""
-    try:
-        now_ts = datetime.now().timestamp()
-        for token_doc in db.list_remember_tokens(email):
-            if token_doc.get('expires_at', 0) < now_ts:
-                db.delete_remember_token(email, token_doc['id'])
-    except Exception:
-        pass
-
-
 def try_remember_me_login(db, cookie_manager):
     """Reconnecte automatiquement l'utilisateur si un cookie "rester connecté"
     valide est présent. Ne fait jamais échouer l'app ni afficher d'erreur :
     cookie absent, expiré ou invalide => on retombe silencieusement sur
-    l'écran de connexion normal."""
+    l'écran de connexion normal.
+
+    Un jeton déjà vérifié récemment par ce processus est accepté sans
+    aucune lecture Firestore ; sinon, document utilisateur et jeton sont lus
+    en un seul appel groupé."""
     try:
         raw_cookie = cookie_manager.get(cookie=REMEMBER_COOKIE_NAME)
         if not raw_cookie or ':' not in raw_cookie:
@@ -89,43 +147,46 @@ def try_remember_me_login(db, cookie_manager):
 
         email, token = raw_cookie.split(':', 1)
         email = email.lower().strip()
+        token_id = _hash_remember_token(token)
 
-        user_data = db.get_user(email)
-        if not user_data:
-            return
+        session_fields = _lookup_verified_token(token_id, email)
+        if session_fields is None:
+            user_data, token_data = db.get_user_and_remember_token(email, token_id)
+            if not user_data or not token_data:
+                return
 
-        # Un compte verrouillé (échecs de connexion répétés) ne doit pas rester
-        # accessible via un cookie émis avant le verrouillage : sinon le
-        # lockout ne protège que le formulaire de connexion, pas le compte.
-        locked_until = user_data.get('locked_until')
-        if locked_until and datetime.now().timestamp() < locked_until:
-            return
+            # Un compte verrouillé (échecs de connexion répétés) ne doit pas rester
+            # accessible via un cookie émis avant le verrouillage : sinon le
+            # lockout ne protège que le formulaire de connexion, pas le compte.
+            locked_until = user_data.get('locked_until')
+            if locked_until and datetime.now().timestamp() < locked_until:
+                return
 
-        token_id = _hash_remember_token(token)
-        token_data = db.get_remember_token(email, token_id)
-        if not token_data:
-            return
+            stored_hash = token_data.get('hash')
+            expires_at = token_data.get('expires_at', 0)
+            if not stored_hash or not expires_at:
+                return
+            if datetime.now().timestamp() > expires_at:
+                return
+            if not hmac.compare_digest(stored_hash, token_id):
+                return
 
-        stored_hash = token_data.get('hash')
-        expires_at = token_data.get('expires_at', 0)
-        if not stored_hash or not expires_at:
-            return
-        if datetime.now().timestamp() > expires_at:
-            return
-        if not hmac.compare_digest(stored_hash, token_id):
-            return
+            session_fields = _session_fields(user_data)
+            _remember_verified_token(token_id, email, session_fields, expires_at)
 
-        base_currency = user_data.get('base_currency', 'XOF')
         st.session_state['user'] = email
-        st.session_state['role'] = user_data.get('role', 'user')
-        st.session_state['base_currency'] = base_currency
-        st.session_state['alert_threshold'] = user_data.get(
-            'alert_threshold', DEFAULT_ALERT_THRESHOLDS.get(base_currency, 500)
-        )
+        st.session_state.update(session_fields)
         st.session_state['uid'] = _compute_uid(email)
     except Exception:
         return
 
+def _client_address():
+    """Adresse IP du client de la session (None si inconnue)."""
+    try:
+        return st.context.ip_address
+    except Exception:
+        return None
+
 # --- FONCTION DE CONNEXION ---
 def login(email, password, db, cookie_manager=None, remember_me=False):
     """Gère la connexion de l'utilisateur avec validation stricte et blocage anti brute-force.
@@ -139,6 +200,13 @@ def login(email, password, db, cookie_manager=None, remember_me=False):
 
     email = email.lower().strip() # Nettoyage de l'email
 
+    # Débit limité par email et par adresse du client, avant toute lecture
+    # Firestore : une rafale de tentatives ne coûte rien à la base.
+    throttle = get_login_throttle()
+    if not throttle.allow(email, _client_address()):
+        st.error("Trop de tentatives de connexion. Réessayez dans quelques instants.")
+        return
+
     try:
         user_data = db.get_user(email)
 
@@ -153,36 +221,34 @@ def login(email, password, db, cookie_manager=None, remember_me=False):
         # Même message générique dans tous les cas (email inconnu ou mot de passe
         # erroné) pour ne pas laisser un attaquant déduire quels comptes existent.
         if user_data and bcrypt.checkpw(password.encode('utf-8'), user_data.get('password_hash', '').encode('utf-8')):
+            throttle.failures.clear(email)
             if user_data.get('failed_attempts'):
                 db.update_user(email, {"failed_attempts": 0, "locked_until": None})
 
-            # Entretien opportuniste : purge les jetons "rester connecté"
-            # expirés de ce compte à chaque connexion réussie.
-            _purge_expired_remember_tokens(email, db)
-
-            base_currency = user_data.get('base_currency', 'XOF')
-
+            session_fields = _session_fields(user_data)
             st.session_state['user'] = email
-            st.session_state['role'] = user_data.get('role', 'user')
-            st.session_state['base_currency'] = base_currency
-            st.session_state['alert_threshold'] = user_data.get(
-                'alert_threshold', DEFAULT_ALERT_THRESHOLDS.get(base_currency, 500)
-            )
+            st.session_state.update(session_fields)
             # Création d'un UID propre pour les collections Firestore
             st.session_state['uid'] = _compute_uid(email)
 
             if remember_me and cookie_manager is not None:
-                _issue_remember_me_cookie(email, db, cookie_manager)
+                _issue_remember_me_cookie(email, db, cookie_manager, session_fields)
 
             st.success(f"Bienvenue, {email} !")
             st.rerun()
         else:
             if user_data:
-                attempts = user_data.get('failed_attempts', 0) + 1
-                updates = {"failed_attempts": attempts}
+                # Échecs comptés en mémoire : une seule écriture Firestore,
+                # au franchissement du seuil de verrouillage.
+                attempts = user_data.get('failed_attempts', 0) + throttle.failures.add(email)
                 if attempts >= MAX_LOGIN_ATTEMPTS:
-                    updates["locked_until"] = datetime.now().timestamp() + LOCKOUT_DURATION_SECONDS
-                db.update_user(email, updates)
+                    db.update_user(email, {
+                        "failed_attempts": attempts,
+                        "locked_until": datetime.now().timestamp() + LOCKOUT_DURATION_SECONDS,
+                    })
+                    throttle.failures.clear(email)
+                    THROTTLE_COUNTS["lockout_writes"] += 1
+                    invalidate_verified_tokens(email=email)
             st.error("Identifiants incorrects.")
     except Exception:
         # On n'affiche jamais le détail brut de l'exception (elle peut référencer
@@ -334,6 +400,7 @@ def reset_password(email, token, new_password, db):
             "failed_attempts": 0,
             "locked_until": None,
         })
+        invalidate_verified_tokens(email=email)
         st.success("Mot de passe réinitialisé avec succès. Vous pouvez maintenant vous connecter.")
         return True
     except Exception:
@@ -353,7 +420,9 @@ def logout(db=None, cookie_manager=None):
                 raw_cookie = cookie_manager.get(cookie=REMEMBER_COOKIE_NAME)
                 if raw_cookie and ':' in raw_cookie:
                     _, token = raw_cookie.split(':', 1)
-                    db.delete_remember_token(email, _hash_remember_token(token))
+                    token_id = _hash_remember_token(token)
+                    invalidate_verified_tokens(token_id=token_id)
+                    db.delete_remember_token(email, token_id)
             except Exception:
                 pass
 
@@ -2,36 +2,62 @@ import streamlit as st
 import pandas as pd
 import io
 from currency import CURRENCY_SYMBOLS, DEFAULT_ALERT_THRESHOLDS
+from profiling import profiled
+from anomalies import AnomalyDetector
 
 # Colonnes de traçabilité du taux de change, ajoutées aux transactions à
 # partir de ce changement. Les transactions créées avant ne les ont pas.
 EXCHANGE_RATE_TRACE_COLUMNS = ["exchange_rate", "exchange_rate_source", "exchange_rate_date"]
 
+@profiled
 def with_nd_placeholders(df, columns):
-    """Copie de df où les valeurs manquantes des colonnes indiquées
-    affichent "n/d" plutôt qu'une cellule vide/NaN. Sert à afficher/exporter
-    proprement les anciennes transactions qui n'ont pas ces colonnes, sans
-    migration de données."""
-    df = df.copy()
+    """df où les valeurs manquantes des colonnes indiquées affichent "n/d"
+    plutôt qu'une cellule vide/NaN. Sert à afficher/exporter proprement les
+    anciennes transactions qui n'ont pas ces colonnes, sans migration de
+    données.
+
+    Pas de copie complète : df lui-même s'il n'y a rien à remplacer, sinon
+    un nouveau DataFrame qui ne remplace que les colonnes concernées (les
+    autres sont partagées, copy-on-write)."""
+    replacements = {}
     for col in columns:
         if col not in df.columns:
-            df[col] = "n/d"
+            replacements[col] = "n/d"
+            continue
+        missing = df[col].isna()
+        if not missing.any():
+            continue
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            values = df[col]
+            if "n/d" not in values.cat.categories:
+                values = values.cat.add_categories("n/d")
+            replacements[col] = values.fillna("n/d")
         else:
-            df[col] = df[col].apply(lambda v: "n/d" if pd.isna(v) else v)
-    return df
-
-def export_csv(df, base_currency="XOF"):
-    """Bouton d'exportation CSV natif Streamlit (plus rapide)."""
-    if df.empty:
-        st.warning("Aucune donnée à exporter en CSV.")
-        return
+            replacements[col] = df[col].astype(object).where(~missing, "n/d")
+    return df.assign(**replacements) if replacements else df
 
+@profiled
+def csv_export_bytes(df, base_currency="XOF"):
+    """Contenu du fichier CSV exporté (octets UTF-8)."""
     df_export = with_nd_placeholders(df, EXCHANGE_RATE_TRACE_COLUMNS)
     df_export = df_export.rename(columns={
         "amount": f"amount_{base_currency}",
         "profit": f"profit_{base_currency}",
     })
-    csv = df_export.to_csv(index=True).encode('utf-8')
+    return df_export.to_csv(index=True).encode('utf-8')
+
+@profiled
+def export_csv(df, base_currency="XOF", data=None):
+    """Bouton d'exportation CSV natif Streamlit (plus rapide).
+
+    data : contenu déjà calculé (csv_export_bytes), ex. mis en cache par le
+    graphe des vues dérivées ; calculé ici sinon.
+    """
+    if df.empty:
+        st.warning("Aucune donnée à exporter en CSV.")
+        return
+
+    csv = data if data is not None else csv_export_bytes(df, base_currency)
     st.download_button(
         label="📥 Télécharger l'historique (CSV)",
         data=csv,
@@ -40,16 +66,15 @@ def export_csv(df, base_currency="XOF"):
         use_container_width=True
     )
 
-def export_excel(df, base_currency="XOF"):  # RENOMMÉ : Plus logique que export_pdf
-    """Exportation au format Excel sans erreur de fuseau horaire."""
-    if df.empty:
-        st.warning("Aucune donnée à exporter en Excel.")
-        return
-
+@profiled
+def excel_export_bytes(df, base_currency="XOF"):
+    """Contenu du classeur Excel exporté, sans erreur de fuseau horaire."""
     output = io.BytesIO()
 
-    # CORRECTION CRITIQUE : Copie du DataFrame et retrait des timezones
-    df_clean = with_nd_placeholders(df, EXCHANGE_RATE_TRACE_COLUMNS)
+    # CORRECTION CRITIQUE : Copie du DataFrame et retrait des timezones.
+    # Copie superficielle : les données restent partagées (copy-on-write),
+    # seules les colonnes modifiées ci-dessous sont réécrites.
+    df_clean = with_nd_placeholders(df, EXCHANGE_RATE_TRACE_COLUMNS).copy(deep=False)
     if isinstance(df_clean.index, pd.DatetimeIndex):
         df_clean.index = df_clean.index.tz_localize(None)
 
@@ -67,38 +92,72 @@ def export_excel(df, base_currency="XOF"):  # RENOMMÉ : Plus logique que export
 
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
         df_clean.to_excel(writer, index=True, sheet_name='Transactions')
+    return output.getvalue()
+
+@profiled
+def export_excel(df, base_currency="XOF", data=None):  # RENOMMÉ : Plus logique que export_pdf
+    """Exportation au format Excel sans erreur de fuseau horaire.
+
+    data : contenu déjà calculé (excel_export_bytes) ; calculé ici sinon.
+    """
+    if df.empty:
+        st.warning("Aucune donnée à exporter en Excel.")
+        return
 
     st.download_button(
         label="📄 Exporter pour Comptable (Excel)",
-        data=output.getvalue(),
+        data=data if data is not None else excel_export_bytes(df, base_currency),
         file_name="rapport_finance.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         use_container_width=True
     )
 
-def alert_expense(df, threshold=None, base_currency="XOF"):
-    """Système d'alerte intelligente sur les dépenses atypiques.
+def find_expense_alert(df, threshold=None, base_currency="XOF", detector=None):
+    """Message d'alerte pour la dépense atypique la plus récente, ou None.
 
-    threshold : seuil configurable par l'utilisateur ; si absent, on retombe
-    sur un seuil par défaut adapté à la devise de référence.
+    Dépense atypique au sens de anomalies.AnomalyDetector : inhabituelle pour
+    sa catégorie, ou, pour une catégorie sans historique suffisant, au-dessus
+    du seuil configurable par l'utilisateur (si absent, seuil par défaut
+    adapté à la devise de référence).
+
+    detector : détecteur incrémental de la session (seules les transactions
+    qu'il n'a pas encore vues sont analysées) ; un détecteur neuf analyse
+    tout l'historique sinon.
     """
     df_expenses = df[df['type'] == 'Dépense']
     if df_expenses.empty:
-        return
+        return None
 
     if threshold is None:
         threshold = DEFAULT_ALERT_THRESHOLDS.get(base_currency, 500)
     symbole = CURRENCY_SYMBOLS.get(base_currency, base_currency)
 
-    recent_high_expense = df_expenses[df_expenses['amount'] > threshold].sort_index(ascending=False).head(1)
+    if detector is None:
+        detector = AnomalyDetector(base_currency=base_currency)
+    detector.update(df_expenses)
+    anomalies = detector.anomalies(threshold)
+    if not anomalies:
+        return None
 
-    if not recent_high_expense.empty:
-        row = recent_high_expense.iloc[0]
+    row = anomalies[0]
 
-        # AJOUT SÉCURITÉ DEVISE : On vérifie si les colonnes de la devise originale existent
-        if 'amount_original' in row and 'currency_original' in row:
-            montant_txt = f"{row['amount_original']:,} {row['currency_original']} (soit {row['amount']:.2f} {symbole})"
-        else:
-            montant_txt = f"{row['amount']:.2f} {symbole}"
+    # AJOUT SÉCURITÉ DEVISE : On vérifie si la devise originale est connue
+    if row['amount_original'] is not None and row['currency_original'] is not None:
+        montant_txt = f"{row['amount_original']:,} {row['currency_original']} (soit {row['amount']:.2f} {symbole})"
+    else:
+        montant_txt = f"{row['amount']:.2f} {symbole}"
+
+    if row['score'] is None:
+        return f"⚠️ Dépense élevée détectée : {montant_txt} en {row['category']}"
+    return f"⚠️ Dépense inhabituelle détectée : {montant_txt} en {row['category']}"
 
-        st.toast(f"⚠️ Dépense élevée détectée : {montant_txt} en {row['category']}", icon="🚨")
\ No newline at end of file
+@profiled
+def alert_expense(df, threshold=None, base_currency="XOF", message=None):
+    """Système d'alerte intelligente sur les dépenses atypiques.
+
+    message : alerte déjà calculée (find_expense_alert) ; calculée ici sinon.
+    """
+    if message is None:
+        message = find_expense_alert(df, threshold, base_currency)
+    if message:
+        st.toast(message, icon="🚨")
@@ -0,0 +1,223 @@
+"""File d'écriture locale et durable pour les nouvelles transactions.
+
+DBClient.add_entry était synchrone : en cas de réseau lent, l'utilisateur
+attendait un aller-retour complet avant le rerun, et en cas de coupure
+l'opération était perdue ("Erreur lors de l'ajout de l'opération").
+Désormais la saisie est écrite dans une base SQLite locale (mode WAL,
+synchronous=FULL), confirmée immédiatement, puis envoyée à Firestore par un
+thread de fond (FlushWorker) :
+
+- identifiants de documents choisis à la mise en file : un renvoi (réponse
+  perdue, deux répliques qui envoient la même ligne) réécrit le même
+  document au lieu d'en créer un doublon ;
+- envoi en batchs par collection (DBClient.set_entries) ;
+- échec : nouvel essai avec attente exponentielle (BACKOFF_BASE_SECONDS,
+  plafonnée à BACKOFF_MAX_SECONDS), sans limite de tentatives : une
+  opération n'est retirée de la file qu'une fois écrite ;
+- une ligne prise par un envoi est réservée LEASE_SECONDS, pour que les
+  répliques d'une même machine (même fichier) ne l'envoient pas en double ;
+  un processus arrêté en plein envoi la libère à l'échéance du bail.
+
+Emplacement : $PROBUDGET_WRITE_QUEUE_PATH (défaut .cache/write_queue.sqlite ;
+vide pour désactiver et revenir à l'écriture synchrone). Le fichier doit
+être sur un disque qui survit aux redémarrages du processus.
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from instrumentation import register_counter, set_render_context
+from temp_db_client import MAX_BATCH_WRITES
+
+WRITE_QUEUE_PATH_ENV = "PROBUDGET_WRITE_QUEUE_PATH"
+DEFAULT_WRITE_QUEUE_PATH = os.path.join(".cache", "write_queue.sqlite")
+FLUSH_INTERVAL_SECONDS = 2.0
+LEASE_SECONDS = 30.0
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 300.0
+
+# Opérations "enqueued" (mises en file), "flushed" (écrites dans Firestore),
+# "failed" (envois échoués, à réessayer), "errors" (exceptions du thread).
+WRITE_QUEUE_COUNTS = Counter()
+register_counter(
+    "probudget_write_queue_total",
+    "Opérations de la file d'écriture locale (enqueued / flushed / failed / errors).",
+    "event", WRITE_QUEUE_COUNTS,
+)
+
+
+def backoff_seconds(attempts):
+    """Attente avant le prochain essai après attempts échecs (avec gigue)."""
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+class WriteQueue:
+    """Opérations en attente d'écriture dans Firestore, dans une base SQLite."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending (doc_id TEXT PRIMARY KEY, collection TEXT NOT NULL, "
+            "entry BLOB NOT NULL, created_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt_at REAL NOT NULL, last_error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pending_collection ON pending (collection, created_at)")
+
+    def enqueue(self, collection, entry, doc_id=None):
+        """Met l'opération en file (écrite sur disque au retour) et retourne
+        l'identifiant du document qu'elle aura dans Firestore."""
+        doc_id = doc_id or uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pending (doc_id, collection, entry, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (doc_id, collection, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), now, now),
+            )
+        WRITE_QUEUE_COUNTS["enqueued"] += 1
+        return doc_id
+
+    def pending(self, collection):
+        """Opérations en attente de la collection, plus récentes d'abord,
+        avec leur identifiant ("id"), pour les afficher avant leur écriture."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, entry FROM pending WHERE collection = ? ORDER BY created_at DESC", (collection,)
+            ).fetchall()
+        return [{**pickle.loads(entry), "id": doc_id} for doc_id, entry in rows]
+
+    def status(self, collection):
+        """(nombre en attente, dernier message d'erreur, prochain essai) de la collection."""
+        with self._lock:
+            count, next_attempt_at = self._conn.execute(
+                "SELECT COUNT(*), MIN(next_attempt_at) FROM pending WHERE collection = ?", (collection,)
+            ).fetchone()
+            row = self._conn.execute(
+                "SELECT last_error FROM pending WHERE collection = ? AND last_error IS NOT NULL "
+                "ORDER BY next_attempt_at DESC LIMIT 1", (collection,)
+            ).fetchone()
+        return count, row[0] if row else None, next_attempt_at
+
+    def claim_due(self, limit=MAX_BATCH_WRITES, now=None):
+        """Réserve (LEASE_SECONDS) et retourne les opérations dont l'essai est
+        dû : liste de (doc_id, collection, entry, attempts)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT doc_id, collection, entry, attempts FROM pending WHERE next_attempt_at <= ? "
+                    "ORDER BY created_at LIMIT ?", (now, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE pending SET next_attempt_at = ? WHERE doc_id = ?",
+                    [(now + LEASE_SECONDS, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(doc_id, collection, pickle.loads(entry), attempts) for doc_id, collection, entry, attempts in rows]
+
+    def mark_done(self, doc_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+
+    def mark_failed(self, doc_ids, error, now=None):
+        """Replanifie les opérations avec une attente exponentielle."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for doc_id in doc_ids:
+                row = self._conn.execute("SELECT attempts FROM pending WHERE doc_id = ?", (doc_id,)).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+                self._conn.execute(
+                    "UPDATE pending SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE doc_id = ?",
+                    (attempts, now + backoff_seconds(attempts), error, doc_id),
+                )
+
+
+def flush_once(queue, db, limit=MAX_BATCH_WRITES, now=None):
+    """Envoie les opérations dues, un batch par collection. Retourne le
+    nombre d'opérations réservées (limit : il en reste peut-être)."""
+    claimed = queue.claim_due(limit, now)
+    by_collection = defaultdict(dict)
+    for doc_id, collection, entry, _attempts in claimed:
+        by_collection[collection][doc_id] = entry
+    for collection, entries in by_collection.items():
+        if db.set_entries(collection, entries):
+            queue.mark_done(list(entries))
+            WRITE_QUEUE_COUNTS["flushed"] += len(entries)
+        else:
+            queue.mark_failed(list(entries), "Firestore injoignable ou écriture refusée", now)
+            WRITE_QUEUE_COUNTS["failed"] += len(entries)
+    return len(claimed)
+
+
+class FlushWorker:
+    """Thread de fond qui vide la file : toutes les FLUSH_INTERVAL_SECONDS,
+    ou aussitôt après une mise en file (wake)."""
+
+    def __init__(self, queue, db, interval_seconds=FLUSH_INTERVAL_SECONDS):
+        self.queue = queue
+        self.db = db
+        self.interval_seconds = interval_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        set_render_context(page="file d'écriture")
+        while not self._stop.is_set():
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            try:
+                while flush_once(self.queue, self.db) == MAX_BATCH_WRITES:
+                    pass
+            except Exception:
+                WRITE_QUEUE_COUNTS["errors"] += 1
+
+
+def open_write_queue():
+    """File du fichier configuré, ou None si elle est désactivée ou
+    inutilisable (l'app écrit alors directement dans Firestore)."""
+    path = os.environ.get(WRITE_QUEUE_PATH_ENV, DEFAULT_WRITE_QUEUE_PATH)
+    if not path:
+        return None
+    try:
+        return WriteQueue(path)
+    except (OSError, sqlite3.Error):
+        return None
+
+
+def merge_pending(entries, pending):
+    """Transactions lues dans Firestore complétées des opérations encore en
+    file (plus récentes, en tête), sans doublon si l'écriture a déjà eu lieu."""
+    known = {entry.get("id") for entry in entries}
+    return [entry for entry in pending if entry["id"] not in known] + list(entries)